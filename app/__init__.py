@@ -1,12 +1,35 @@
-from flask import Flask
+import threading
 from app.utils.logger import logger
-from app.api.routes import api_bp
 
 def create_app():
+    # 路由及其依赖在这里才导入: 命令行脚本 import app.utils.* 时不需要加载 Flask 路由和 lark-oapi
+    from flask import Flask
+    from app.api.routes import api_bp, get_event_handler
+    from app.api.event_consumer import start_event_consumer
+    from app.api.event_handler import resume_recording_check
+    from app.core.lease_manager import lease_manager
+    from app.core.archive_reconciler import start_archive_reconciler
+    from app.core.download_sink import check_zero_copy
+
     app = Flask(__name__)
-    
+
     # 注册路由 Blueprint
     app.register_blueprint(api_bp)
-    
+
+    # 启动 Webhook 事件消费线程 (快速确认模式下事件在这里解析和处理)
+    start_event_consumer(get_event_handler)
+
+    # 后台预先构建 lark-oapi 事件处理器，服务先开始监听，不等待 lark-oapi 导入
+    threading.Thread(target=get_event_handler, name="lark-preload", daemon=True).start()
+
+    # 启动多副本租约心跳 (接管其他副本宕机后遗留的会议重新开始轮询录制；退出时保存了断点的会议按断点恢复)
+    lease_manager.start(on_takeover=resume_recording_check)
+
+    # 启动后台归档重试线程 (处理滞留在下载目录的文件)
+    start_archive_reconciler()
+
+    # DOWNLOAD_ZERO_COPY 开启但运行环境不支持时告警
+    check_zero_copy()
+
     logger.info("Flask App Initialized")
     return app
@@ -0,0 +1,93 @@
+import time
+import threading
+from app.utils.logger import logger
+from app.utils.config import load_config
+from app.utils.metrics import registry, EVENT_QUEUE_WAIT, EVENT_DISPATCH_LATENCY, EVENT_DISPATCH_FAILURES
+from app.data.event_queue import event_queue
+
+registry.gauge("feishu_event_queue_depth", "已确认但尚未分发的 Webhook 事件数", callback=event_queue.depth)
+
+_started = False
+_start_lock = threading.Lock()
+
+# 重试间隔上限 (秒)
+MAX_RETRY_DELAY = 300
+
+def dispatch_event(handler, body, headers):
+    """
+    在后台线程中执行原本在请求线程中的 SDK 解析 + 事件处理 (handler.do)
+    Token 已在请求线程校验过，这里 SDK 会再校验一次，不影响结果
+    返回: SDK 的响应；事件处理出错时 SDK 捕获异常并返回非 200
+    """
+    from lark_oapi.core.model import RawRequest
+    req = RawRequest()
+    req.uri = "/webhook/event"
+    req.headers = headers
+    req.body = body
+    resp = handler.do(req)
+    if resp.status_code != 200:
+        logger.warning(f"[事件分发] 事件处理失败: {resp.status_code} {resp.content[:200]}")
+    return resp
+
+def _handle_failure(item, error):
+    """
+    事件处理失败: 飞书已收到 200 不会重推，事件留在队列中按退避时间重试 (重复处理由会议租约去重)
+    超过 EVENT_MAX_ATTEMPTS 次仍失败的事件 (例如无法解析的坏数据) 移入死信，不再重放
+    """
+    config = load_config()
+    attempts = item[4] + 1
+    if attempts >= config["event_max_attempts"]:
+        EVENT_DISPATCH_FAILURES.inc("dead_lettered")
+        event_queue.dead_letter(item, error)
+        return
+    delay = min(config["event_retry_backoff"] * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    EVENT_DISPATCH_FAILURES.inc("retried")
+    logger.warning(f"[事件分发] 第 {attempts} 次处理失败，{delay:.0f} 秒后重试: {error}")
+    event_queue.retry(item, delay)
+
+def _consume_loop(get_handler):
+    # lark-oapi 体积很大，事件处理器在消费线程中构建，不拖慢服务启动
+    handler = get_handler()
+    while True:
+        item = event_queue.get(timeout=1)
+        if item is None:
+            continue
+        item_id, body, headers, received_at, attempts = item
+        if attempts == 0:
+            EVENT_QUEUE_WAIT.observe(value=max(time.time() - received_at, 0))
+        started = time.perf_counter()
+        error = None
+        try:
+            resp = dispatch_event(handler, body, headers)
+            if resp.status_code != 200:
+                error = f"HTTP {resp.status_code}"
+        except Exception as e:
+            logger.error(f"[事件分发异常] {e}")
+            error = e
+        finally:
+            EVENT_DISPATCH_LATENCY.observe(value=time.perf_counter() - started)
+        if error is None:
+            event_queue.ack(item_id)
+        else:
+            _handle_failure(item, error)
+
+def start_event_consumer(get_handler):
+    """
+    启动 Webhook 事件消费线程 (进程内只启动一次)
+    :param get_handler: 返回 lark-oapi 事件处理器的函数 (首次调用时才构建)
+    WEBHOOK_FAST_ACK 关闭时不启动，事件仍在请求线程中同步处理
+    """
+    global _started
+    config = load_config()
+    if not config["webhook_fast_ack"]:
+        return
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    event_queue.configure(config["event_queue_max_size"], durable=config["event_queue_durable"])
+    for i in range(config["event_consumer_threads"]):
+        t = threading.Thread(target=_consume_loop, args=(get_handler,), name=f"event-consumer-{i}", daemon=True)
+        t.start()
+    mode = "持久化" if config["event_queue_durable"] else "内存"
+    logger.info(f"[事件队列] 快速确认模式已启用 ({mode}队列，{config['event_consumer_threads']} 个消费线程)")
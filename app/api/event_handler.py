@@ -1,16 +1,173 @@
 import threading
+import asyncio
+import time
 import re
+from typing import TYPE_CHECKING
 from app.utils.logger import logger
+from app.utils.config import load_config
+from app.utils.exceptions import JobInterrupted
+from app.utils.metrics import (registry, WEBHOOK_EVENTS, POLL_ATTEMPTS, POLL_ATTEMPTS_PER_MEETING,
+                               SHUTDOWN_CHECKPOINTS)
+from app.utils.tracing import tracer
 from app.data.token_store import token_store
-from app.core.meeting_service import get_recording_info
+from app.core.meeting_service import get_recording_info, async_get_recording_info
 from app.core.notification import send_auth_failed_notification
-from app.core.downloader import download_single_video
-from lark_oapi.api.vc.v1 import P2VcMeetingAllMeetingEndedV1
+from app.core.downloader import download_single_video, async_download_single_video
+from app.core.async_engine import async_engine
+from app.core.lease_manager import lease_manager
+from app.core.job_registry import job_registry
+from app.core.download_scheduler import download_priority, PRIORITY_LIVE, PRIORITY_REMEDY
+from app.core.lifecycle import lifecycle
+
+if TYPE_CHECKING:
+    # lark-oapi 导入较慢，只在类型检查时导入事件类型
+    from lark_oapi.api.vc.v1 import P2VcMeetingAllMeetingEndedV1
+
+# 正在轮询录制的会议 (用于指标和管理接口)
+_polling_meetings = set()
+_state_lock = threading.Lock()
+
+class _PendingPoll:
+    """已排期、尚未执行的一次录制查询 (进程退出时据此保存断点)"""
+    def __init__(self, meeting_id, owner_id, attempt, priority, delay):
+        self.meeting_id = meeting_id
+        self.owner_id = owner_id
+        self.attempt = attempt
+        self.priority = priority
+        self.due_at = time.time() + delay
+        # 取消等待的函数 (Timer.cancel / 取消协程任务)
+        self.cancel = None
+
+# meeting_id -> 等待中的下一次查询
+_pending_polls = {}
+
+registry.gauge("feishu_pending_recording_polls", "等待录制生成的会议数 (轮询中)",
+               callback=lambda: len(_polling_meetings))
+
+def _finish_polling(meeting_id, attempt, result):
+    with _state_lock:
+        _polling_meetings.discard(meeting_id)
+    POLL_ATTEMPTS_PER_MEETING.observe(result, value=attempt)
+
+def _add_pending(meeting_id, owner_id, attempt, priority, delay):
+    pending = _PendingPoll(meeting_id, owner_id, attempt, priority, delay)
+    with _state_lock:
+        _pending_polls[meeting_id] = pending
+    job_registry.polling(meeting_id, owner_id, attempt, pending.due_at)
+    return pending
+
+def _take_pending(pending):
+    """到点执行前取出排期记录；返回 False 表示已被退出流程取走 (断点已保存，不再执行)"""
+    with _state_lock:
+        if _pending_polls.get(pending.meeting_id) is not pending:
+            return False
+        del _pending_polls[pending.meeting_id]
+        return True
+
+def _pop_pending(meeting_id):
+    """管理接口: 取出并取消等待中的查询；没有等待中的查询返回 None"""
+    with _state_lock:
+        pending = _pending_polls.pop(meeting_id, None)
+    if pending is not None and pending.cancel is not None:
+        pending.cancel()
+    return pending
+
+def cancel_poll(meeting_id):
+    """
+    管理接口: 取消等待录制的会议 (不再查询，租约记为完成)
+    返回: 是否有等待中的查询被取消；正在查询 / 下载中的任务不在这里处理
+    """
+    pending = _pop_pending(meeting_id)
+    if pending is None:
+        return False
+    _finish_polling(meeting_id, pending.attempt - 1, "cancelled")
+    tracer.start(meeting_id, pending.owner_id)
+    tracer.finish("cancelled")
+    lease_manager.release(meeting_id, done=False)
+    logger.info(f"[任务管理] 已取消会议 {meeting_id} 的录制查询 (已查询 {pending.attempt - 1} 次)")
+    return True
+
+def poll_now(meeting_id):
+    """
+    管理接口: 等待中的会议立即查询一次录制 (沿用原来的查询次数和优先级)
+    返回: 是否有等待中的查询
+    """
+    pending = _pop_pending(meeting_id)
+    if pending is None:
+        return False
+    logger.info(f"[任务管理] 会议 {meeting_id} 立即查询录制 (第 {pending.attempt} 次)")
+    schedule_recording_check(meeting_id, pending.owner_id, 0, pending.priority, pending.attempt)
+    return True
+
+def restart_polling(meeting_id, owner_id, priority=PRIORITY_REMEDY):
+    """
+    管理接口: 已结束的会议 (无录制 / 下载失败 / 已取消) 重新开始查询录制并下载
+    返回: 是否已开始；本副本正在处理或其他副本持有租约时返回 False (租约库不可用时抛出 LeaseUnavailable)
+    """
+    with _state_lock:
+        if meeting_id in _polling_meetings:
+            return False
+        _polling_meetings.add(meeting_id)
+    claimed = False
+    try:
+        claimed = lease_manager.claim(meeting_id, owner_id, reclaim_done=True)
+    finally:
+        if not claimed:
+            with _state_lock:
+                _polling_meetings.discard(meeting_id)
+    if not claimed:
+        return False
+    logger.info(f"[任务管理] 会议 {meeting_id} 重新开始查询录制 | Owner: {owner_id}")
+    trace = tracer.start(meeting_id, owner_id)
+    trace.begin("wait_recording")
+    tracer.detach()
+    job_registry.polling(meeting_id, owner_id, 1, time.time())
+    schedule_recording_check(meeting_id, owner_id, 0, priority)
+    return True
+
+def _suspend_poll(meeting_id, owner_id, attempt, priority, due_at):
+    """进程退出: 保存轮询断点并释放租约，由重启后的副本 (或其他副本) 在 due_at 继续查询"""
+    SHUTDOWN_CHECKPOINTS.inc("poll")
+    with _state_lock:
+        _polling_meetings.discard(meeting_id)
+    tracer.start(meeting_id, owner_id)
+    tracer.finish("interrupted")
+    lease_manager.suspend(meeting_id, owner_id, attempt=attempt, priority=priority, due_at=due_at)
+
+def suspend_pending_polls():
+    """进程退出: 取消所有等待中的录制查询并保存断点"""
+    with _state_lock:
+        pending = list(_pending_polls.values())
+        _pending_polls.clear()
+    for p in pending:
+        if p.cancel is not None:
+            p.cancel()
+        _suspend_poll(p.meeting_id, p.owner_id, p.attempt, p.priority, p.due_at)
+    if pending:
+        logger.info(f"[退出] 已保存 {len(pending)} 个等待录制的会议的断点")
+
+lifecycle.add_drain_hook(suspend_pending_polls)
+
+def _suspend_download(meeting_id, owner_id):
+    """下载在排队 / 进行中被退出流程中断: 重新接管后从查询录制开始 (已下载的部分按断点续传)"""
+    tracer.finish("interrupted")
+    lease_manager.suspend(meeting_id, owner_id, attempt=1, priority=download_priority.get(), due_at=time.time())
+
+def _download_completed():
+    """
+    下载流程是否走完: 成功归档 / 文件已存在 / 内容重复时 downloader 会标注 result；
+    下载失败或被取消时 (download_single_video 内部已清理，不抛出异常) 没有 result
+    """
+    trace = tracer.current()
+    return trace is not None and bool(trace.attrs.get("result"))
 
 def do_download_task(token, user_id, meeting_id=None):
     """
     具体的下载任务，在独立线程中运行
+    只有下载归档完成时租约才标记完成；失败 / 取消时释放租约，飞书重推或其他副本可以重新处理
     """
+    interrupted = False
+    completed = False
     try:
         # 1. 尝试从 TokenStore 获取该用户的 Token
         user_data = token_store.get_user_token(user_id)
@@ -20,36 +177,85 @@ def do_download_task(token, user_id, meeting_id=None):
             user_access_token = user_data.get("user_access_token")
         else:
             logger.warning(f"[跳过] 用户 {user_id} 未授权")
+            tracer.finish("unauthorized")
             return
 
         # 2. 调用 downloader 进行下载
         download_single_video(token, user_id, user_access_token, meeting_id)
-        
+        completed = _download_completed()
+        tracer.finish("done")
+
+    except JobInterrupted as e:
+        logger.warning(f"[下载中断] {e}")
+        interrupted = bool(meeting_id)
+        if interrupted:
+            _suspend_download(meeting_id, user_id)
     except Exception as e:
         logger.error(f"[下载异常] {e}")
+        tracer.finish("error")
+    finally:
+        if meeting_id and not interrupted:
+            lease_manager.release(meeting_id, done=completed)
 
-def check_recording_loop(meeting_id, owner_id, attempt=1):
+async def async_do_download_task(token, user_id, meeting_id=None):
     """
-    轮询检查录制是否生成 (适用于手动创建的会议)
+    do_download_task 的协程版本 (asyncio 执行模式)
+    """
+    interrupted = False
+    completed = False
+    try:
+        user_data = token_store.get_user_token(user_id)
+        if not user_data:
+            logger.warning(f"[跳过] 用户 {user_id} 未授权")
+            tracer.finish("unauthorized")
+            return
+
+        await async_download_single_video(token, user_id, user_data.get("user_access_token"), meeting_id)
+        completed = _download_completed()
+        tracer.finish("done")
+
+    except JobInterrupted as e:
+        logger.warning(f"[下载中断] {e}")
+        interrupted = bool(meeting_id)
+        if interrupted:
+            _suspend_download(meeting_id, user_id)
+    except Exception as e:
+        logger.error(f"[下载异常] {e}")
+        tracer.finish("error")
+    finally:
+        if meeting_id and not interrupted:
+            lease_manager.release(meeting_id, done=completed)
+
+def _poll_interval(attempt):
+    """
+    第 attempt 次查询失败后，距下次查询的等待时间 (秒)；返回 None 表示超时放弃
     采取阶梯式重试策略，最大覆盖约 30 分钟。
     """
     # [策略配置]
     # 阶段1 (0-5分): 60秒一次, attempt 1-5 (每次日志)
     # 阶段2 (5-30分): 300秒一次, attempt 6-10 (每次日志)
     # 超时: >30分 (停止)
-    
-    interval = 60
-    silent = False
-    
     if attempt <= 5:
-        interval = 60
-        silent = False        # 前5分钟: 每60秒一次
-    elif attempt <= 10:
-        interval = 300        # 5-30分钟: 每300秒(5分钟)一次
-        silent = False        # 每次都打印
-    else:
+        return 60
+    if attempt <= 10:
+        return 300
+    return None
+
+def _begin_poll(meeting_id, owner_id, attempt):
+    """
+    每次查询前的公共检查
+    返回: user_access_token；已超时或用户未授权时结束任务并返回 None
+    """
+    if _poll_interval(attempt) is None:
         logger.warning(f"[监测停止] 会议 {meeting_id} 超过30分钟未生成录制文件，判定为无录制，停止任务。")
-        return
+        _finish_polling(meeting_id, attempt - 1, "timeout")
+        lease_manager.release(meeting_id, done=False)
+        tracer.finish("no_recording")
+        return None
+
+    with _state_lock:
+        _polling_meetings.add(meeting_id)
+    job_registry.polling(meeting_id, owner_id, attempt)
     
     # 1. Token 检查
     user_data = token_store.get_user_token(owner_id)
@@ -57,34 +263,168 @@ def check_recording_loop(meeting_id, owner_id, attempt=1):
         # 如果用户未授权，输出错误日志并发送通知卡片
         logger.error(f"[权限错误] 用户 {owner_id} 的会议 {meeting_id} 已结束，但在系统中找不到该用户的 Token。无法下载。")
         send_auth_failed_notification(owner_id, meeting_id)
+        _finish_polling(meeting_id, attempt, "unauthorized")
+        lease_manager.release(meeting_id, done=False)
+        tracer.finish("unauthorized")
+        return None
+
+    return user_data.get("user_access_token")
+
+def _recording_token(res, meeting_id, attempt, trace):
+    """
+    查询结果判断
+    返回: (是否结束轮询, 妙计 Token)；录制就绪但链接无法解析时 Token 为 None
+    """
+    # 成功拿到 url
+    if res and res.get('code') == 0 and res.get('data', {}).get('recording', {}).get('url'):
+        POLL_ATTEMPTS.inc("ready")
+        _finish_polling(meeting_id, attempt, "ready")
+        trace.end("wait_recording", attempts=attempt)
+        url = res['data']['recording']['url']
+
+        # 提取 token
+        match = re.search(r'(obcn[a-z0-9]+)', url)
+        if match:
+            token = match.group(1)
+            logger.info(f"[✅ 录制就绪] Token: {token} | 准备下载...")
+            return True, token
+        lease_manager.release(meeting_id, done=False)
+        tracer.finish("invalid_url")
+        return True, None
+
+    POLL_ATTEMPTS.inc("not_ready")
+    return False, None
+
+def _schedule_poll(meeting_id, owner_id, attempt, priority, delay):
+    """delay 秒后在 Timer 线程中执行第 attempt 次查询；进程退出中则直接保存断点"""
+    if not lifecycle.accepting():
+        _suspend_poll(meeting_id, owner_id, attempt, priority, time.time() + delay)
+        return
+    pending = _add_pending(meeting_id, owner_id, attempt, priority, delay)
+    t = threading.Timer(float(delay), check_recording_loop, args=(meeting_id, owner_id, attempt, priority, pending))
+    # 等待中的 Timer 在退出时已保存断点，不应阻止进程退出
+    t.daemon = True
+    pending.cancel = t.cancel
+    t.start()
+
+def check_recording_loop(meeting_id, owner_id, attempt=1, priority=PRIORITY_LIVE, pending=None):
+    """
+    轮询检查录制是否生成 (适用于手动创建的会议)
+    每次查询在一个 Timer 线程中执行，未就绪则按 _poll_interval 重新调度
+    :param priority: 录制就绪后下载的调度优先级 (实时 / 补录)
+    :param pending: 本次查询的排期记录 (由 _schedule_poll 传入)
+    """
+    if pending is not None and not _take_pending(pending):
+        return
+    silent = False
+    download_priority.set(priority)
+
+    # 绑定该会议的耗时追踪 (补录等直接调用的场景会在这里新建)
+    trace = tracer.start(meeting_id, owner_id)
+
+    user_token = _begin_poll(meeting_id, owner_id, attempt)
+    if not user_token:
         return
-        
-    user_token = user_data.get("user_access_token")
     
     # 2. 调用 API 查询 (需 vc:recording:readonly 权限)
     # 传递 owner_id 以支持自动 Token 刷新
     # 传递 silent 参数控制日志噪音
-    res = get_recording_info(meeting_id, user_token, user_id=owner_id, silent=silent)
+    with tracer.span("poll_recording", attempt=attempt):
+        res = get_recording_info(meeting_id, user_token, user_id=owner_id, silent=silent)
     
     # 3. 结果判断
-    # 成功拿到 url
-    if res and res.get('code') == 0 and res.get('data', {}).get('recording', {}).get('url'):
-        url = res['data']['recording']['url']
-        
-        # 提取 token 并下载
-        match = re.search(r'(obcn[a-z0-9]+)', url)
-        if match:
-             token = match.group(1)
-             logger.info(f"[✅ 录制就绪] Token: {token} | 准备下载...")
-             # 传递 meeting_id
-             do_download_task(token, owner_id, meeting_id)
+    done, token = _recording_token(res, meeting_id, attempt, trace)
+    if done:
+        if token:
+            # 传递 meeting_id
+            do_download_task(token, owner_id, meeting_id)
         return
         
     # 失败则重试
-    t = threading.Timer(float(interval), check_recording_loop, args=(meeting_id, owner_id, attempt + 1))
-    t.start()
+    tracer.detach()
+    _schedule_poll(meeting_id, owner_id, attempt + 1, priority, _poll_interval(attempt))
 
-def do_p2_meeting_ended(data: P2VcMeetingAllMeetingEndedV1) -> None:
+async def _async_wait_poll(meeting_id, owner_id, attempt, priority, delay):
+    """
+    协程模式下等待 delay 秒后执行第 attempt 次查询
+    返回 False 表示进程正在退出，断点已保存，协程应直接结束
+    """
+    if not lifecycle.accepting():
+        _suspend_poll(meeting_id, owner_id, attempt, priority, time.time() + delay)
+        return False
+    pending = _add_pending(meeting_id, owner_id, attempt, priority, delay)
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    pending.cancel = lambda: loop.call_soon_threadsafe(task.cancel)
+    try:
+        await asyncio.sleep(delay)
+    except asyncio.CancelledError:
+        return False
+    return _take_pending(pending)
+
+async def async_check_recording(meeting_id, owner_id, delay=0, priority=PRIORITY_LIVE, attempt=1):
+    """
+    check_recording_loop 的协程版本 (asyncio 执行模式)
+    等待期间只是一个挂起的协程，不占用线程；查询与重试策略与线程模式一致
+    """
+    download_priority.set(priority)
+    if not await _async_wait_poll(meeting_id, owner_id, attempt, priority, delay):
+        return
+
+    # 协程任务有独立的上下文，Trace 绑定不会串到其他会议
+    trace = tracer.start(meeting_id, owner_id)
+    while True:
+        user_token = _begin_poll(meeting_id, owner_id, attempt)
+        if not user_token:
+            return
+
+        with tracer.span("poll_recording", attempt=attempt):
+            res = await async_get_recording_info(meeting_id, user_token, user_id=owner_id, silent=False)
+
+        done, token = _recording_token(res, meeting_id, attempt, trace)
+        if done:
+            if token:
+                await async_do_download_task(token, owner_id, meeting_id)
+            return
+
+        tracer.detach()
+        if not await _async_wait_poll(meeting_id, owner_id, attempt + 1, priority, _poll_interval(attempt)):
+            return
+        attempt += 1
+        trace = tracer.start(meeting_id, owner_id)
+
+def schedule_recording_check(meeting_id, owner_id, delay=0, priority=PRIORITY_LIVE, attempt=1):
+    """
+    延迟 delay 秒后开始轮询录制 (按 EXECUTION_MODE 选择线程或协程执行)
+    :param attempt: 从第几次查询开始 (从断点恢复时沿用之前的次数，不重新计算超时)
+    """
+    if load_config()["execution_mode"] == "async":
+        if async_engine.available():
+            async_engine.submit(async_check_recording(meeting_id, owner_id, delay, priority, attempt))
+            return
+        logger.warning("[Async] 未安装 httpx，EXECUTION_MODE=async 不可用，回退到线程模式")
+
+    _schedule_poll(meeting_id, owner_id, attempt, priority, delay)
+
+def resume_recording_check(meeting_id, owner_id, resume=None):
+    """
+    接管租约后的回调: 有断点 (上一个进程退出时保存) 时按原来的查询次数和时间继续，否则从头开始轮询
+    """
+    if not resume:
+        schedule_recording_check(meeting_id, owner_id)
+        return
+    delay = max(resume.get("due_at", 0) - time.time(), 0)
+    with _state_lock:
+        _polling_meetings.add(meeting_id)
+    schedule_recording_check(meeting_id, owner_id, delay, resume.get("priority", PRIORITY_LIVE),
+                             resume.get("attempt", 1))
+
+def do_p2_meeting_ended(data: "P2VcMeetingAllMeetingEndedV1") -> None:
+    """
+    会议结束事件: 认领会议后开始轮询录制
+    处理出错时抛出异常 (SDK 返回 500)，快速确认模式下事件留在队列中重试，同步模式下由飞书重推
+    """
+    claimed = False
     try:
         # 1. 基础完整性检查
         if not data or not data.event or not data.event.meeting:
@@ -107,11 +447,30 @@ def do_p2_meeting_ended(data: P2VcMeetingAllMeetingEndedV1) -> None:
             logger.warning(f"[事件侦测] 会议 {meeting_id} 未能获取到 Owner ID (event.meeting.owner 为空)，无法归档。")
             return
 
+        # 认领该会议: 本副本或其他副本已在处理 (或已处理过，包括飞书重推的同一事件) 时跳过
+        if not lease_manager.claim(meeting_id, owner_id):
+            WEBHOOK_EVENTS.inc("claimed_elsewhere")
+            return
+        claimed = True
+        with _state_lock:
+            _polling_meetings.add(meeting_id)
+        WEBHOOK_EVENTS.inc("received")
+
         logger.info(f"[事件侦测] 会议结束 (All Meeting Ended) | ID: {meeting_id} | Owner: {owner_id} | 启动查询...")
         
-        # 延迟 30秒开始第一次检查
-        t = threading.Timer(30.0, check_recording_loop, args=(meeting_id, owner_id))
-        t.start()
+        # 开始记录耗时: 从收到事件到录制就绪为 wait_recording 阶段
+        trace = tracer.start(meeting_id, owner_id)
+        trace.begin("wait_recording")
+        tracer.detach()
+
+        # 延迟 30秒 (POLL_INITIAL_DELAY) 开始第一次检查
+        schedule_recording_check(meeting_id, owner_id, load_config()["poll_initial_delay"])
         
     except Exception as e:
         logger.error(f"[事件处理错误] {e} | Data dump: {data.event.meeting if data and data.event else 'No Data'}")
+        if claimed:
+            # 放弃租约，重试的事件可以重新认领
+            with _state_lock:
+                _polling_meetings.discard(meeting_id)
+            lease_manager.release(meeting_id, done=False)
+        raise
@@ -1,29 +1,122 @@
-from flask import Blueprint, request
-import requests
+from flask import Blueprint, request, jsonify, Response
+import json
+import time
+import hmac
 import threading
-import lark_oapi as lark
-from lark_oapi.adapter.flask import *
-from app.utils.config import load_config
+from functools import wraps
+from app.utils.config import load_config, parse_size
 from app.utils.logger import logger
+from app.utils.feishu_client import api_request, open_api_url
+from app.utils.metrics import registry, WEBHOOK_EVENTS
+from app.utils.tracing import tracer
+from app.utils.exceptions import LeaseUnavailable
+from app.utils.profiler import (sampling_profiler, memory_profiler, thread_dump,
+                                 DEFAULT_INTERVAL, MAX_DURATION, DEFAULT_MALLOC_FRAMES)
 from app.data.token_store import token_store
-from app.api.event_handler import do_p2_meeting_ended, check_recording_loop
+from app.data.recording_catalog import recording_catalog
+from app.data.event_queue import event_queue
+from app.data.auth_notice_store import auth_notice_store
+from app.core.lease_manager import lease_manager
+from app.core.backfill import backfill_manager
+from app.core.bandwidth import bandwidth_governor
+from app.core.download_scheduler import PRIORITY_REMEDY
+from app.core.lifecycle import lifecycle
+from app.core.health import health_monitor
+from app.core.job_registry import job_registry, ACTIVE_PHASES, PHASE_PENDING_ARCHIVE
+from app.core import archive_reconciler
+from app.data.archive_queue import archive_queue
+from app.api.event_handler import (do_p2_meeting_ended, schedule_recording_check, cancel_poll, poll_now,
+                                   restart_polling)
 
 api_bp = Blueprint('api', __name__)
 
-# 全局 Handler，需要在 app init 时初始化，或是 lazy init
-# 为了简单，这里 lazy init 或直接 init
-config = load_config()
-encrypt_key = ""  # 强制关闭加密
-verification_token = config.get('verification_token', '')
+# 配置和 lark-oapi 事件处理器都在第一次用到时才创建:
+# lark-oapi 导入需要数秒，import 本模块 (以及只用到部分工具函数的脚本) 不应为此等待
+_config = None
+_handler = None
+_handler_lock = threading.Lock()
 
-handler = lark.EventDispatcherHandler.builder(encrypt_key, verification_token, lark.LogLevel.INFO) \
-    .register_p2_vc_meeting_all_meeting_ended_v1(do_p2_meeting_ended) \
-    .build()
+def _get_config():
+    global _config
+    if _config is None:
+        _config = load_config()
+    return _config
+
+def get_event_handler():
+    """lark-oapi 事件处理器 (首次调用时导入 lark-oapi 并构建)"""
+    global _handler
+    if _handler is None:
+        with _handler_lock:
+            if _handler is None:
+                import lark_oapi as lark
+                encrypt_key = ""  # 强制关闭加密
+                verification_token = _get_config().get('verification_token', '')
+                _handler = lark.EventDispatcherHandler.builder(encrypt_key, verification_token, lark.LogLevel.INFO) \
+                    .register_p2_vc_meeting_all_meeting_ended_v1(do_p2_meeting_ended) \
+                    .build()
+    return _handler
+
+def _sdk_handle_event():
+    """由 lark-oapi 解析并处理当前请求中的事件"""
+    from lark_oapi.adapter.flask import parse_req, parse_resp
+    return parse_resp(get_event_handler().do(parse_req()))
 
 @api_bp.route("/webhook/event", methods=["POST"])
 def event():
-    # 飞书要求返回 200 Keep-Alive，lark-oapi 自动处理
-    return parse_resp(handler.do(parse_req()))
+    if not lifecycle.accepting():
+        # 进程正在退出: 不确认事件，飞书稍后重推时由重启后的副本 (或其他副本) 处理
+        WEBHOOK_EVENTS.inc("rejected_shutdown")
+        return jsonify({"code": 503, "msg": "shutting down"}), 503
+    config = _get_config()
+    # 飞书要求 3 秒内返回 200，否则会重推事件
+    if not config["webhook_fast_ack"] or not event_queue.ready():
+        # 同步模式: lark-oapi 解析并处理完事件后才返回
+        return _sdk_handle_event()
+
+    # 快速确认: 只做 Token 校验 / Challenge 应答，原始请求体入队后立即返回
+    body = request.get_data()
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return jsonify({"msg": "invalid request body"}), 400
+    if not isinstance(payload, dict) or "encrypt" in payload:
+        # 加密事件需要解密后才能校验，交给 SDK 同步处理
+        return _sdk_handle_event()
+
+    # v2 事件 Token 在 header 中，v1 事件 / URL 校验在顶层
+    token = (payload.get("header") or {}).get("token") or payload.get("token")
+    verification_token = config.get('verification_token', '')
+    if verification_token and not (isinstance(token, str) and
+                                   hmac.compare_digest(token.encode(), verification_token.encode())):
+        logger.warning("[Webhook] Verification Token 校验失败，拒绝事件")
+        return jsonify({"msg": "invalid verification_token"}), 403
+
+    if payload.get("type") == "url_verification":
+        return jsonify({"challenge": payload.get("challenge")})
+
+    headers = {k: v for k, v in request.headers.items() if k.lower().startswith("x-")}
+    if not event_queue.put(body, headers):
+        # 队列已满: 返回 503 让飞书稍后重推，而不是让请求线程阻塞
+        WEBHOOK_EVENTS.inc("queue_full")
+        logger.warning(f"[Webhook] 事件队列已满 ({event_queue.depth()})，拒绝事件等待飞书重推")
+        return jsonify({"msg": "event queue full"}), 503
+    return jsonify({"msg": "success"})
+
+@api_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus 指标抓取接口"""
+    return Response(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@api_bp.route("/healthz", methods=["GET"])
+def healthz():
+    """存活检查: 进程能处理请求即返回 200 (优雅退出期间也是，避免被编排系统提前杀掉)"""
+    return jsonify({"status": "ok"})
+
+@api_bp.route("/readyz", methods=["GET"])
+def readyz():
+    """就绪检查: 依赖探测 (结果有缓存) 全部正常且未在退出中时返回 200，否则 503"""
+    ready, checks = health_monitor.check()
+    return jsonify({"status": "ready" if ready else "not_ready", "checks": checks}), 200 if ready else 503
 
 @api_bp.route("/auth/start", methods=["GET"])
 def auth_start():
@@ -34,20 +127,25 @@ def auth_start():
         
     redirect_uri = f"{scheme}://{host}/auth/callback"
     
-    # 0. 尝试获取 query 中的 meeting_id（用于补录）
+    # 0. 尝试获取 query 中的 meeting_id / remedy（用于补录）
     meeting_id = request.args.get('meeting_id', '')
-    # 如果有 meeting_id，将其放入 OAuth state 中
-    state = f"meeting_{meeting_id}" if meeting_id else "init_auth"
+    # 如果有 meeting_id，将其放入 OAuth state 中 (旧版卡片的链接)；remedy=1 时回调补录该用户全部错过的会议
+    if meeting_id:
+        state = f"meeting_{meeting_id}"
+    elif request.args.get('remedy'):
+        state = "remedy"
+    else:
+        state = "init_auth"
     
     # 权限范围
     scope = "minutes:minutes.media:export contact:user.id:readonly vc:record:readonly contact:user.base:readonly vc:meeting:readonly" 
-    app_id = config['app_id']
+    app_id = _get_config()['app_id']
     
     from urllib.parse import quote
     encoded_redirect_uri = quote(redirect_uri, safe='')
     
     # 将 state 传入 OAuth URL
-    url = f"https://open.feishu.cn/open-apis/authen/v1/authorize?app_id={app_id}&redirect_uri={encoded_redirect_uri}&scope={scope}&state={state}"
+    url = open_api_url(f"authen/v1/authorize?app_id={app_id}&redirect_uri={encoded_redirect_uri}&scope={scope}&state={state}")
     return f'''
     <div style="text-align:center; margin-top: 50px;">
         <h1>Feishu Auto-Downloader Authorization</h1>
@@ -66,9 +164,12 @@ def auth_callback():
     if not code:
         return "Missing code", 400
     
+    import lark_oapi as lark
+    config = _get_config()
     client = lark.Client.builder() \
         .app_id(config['app_id']) \
         .app_secret(config['app_secret']) \
+        .domain(config['feishu_base_url']) \
         .build()
         
     req = lark.api.authen.v1.CreateAccessTokenRequest.builder() \
@@ -90,9 +191,9 @@ def auth_callback():
         expires_in = data.expires_in
         
         # 2. 获取用户信息 (User ID)
-        user_info_url = "https://open.feishu.cn/open-apis/authen/v1/user_info"
+        user_info_url = open_api_url("authen/v1/user_info")
         headers = {"Authorization": f"Bearer {access_token}"}
-        user_resp = requests.get(user_info_url, headers=headers)
+        user_resp = api_request("GET", "authen.user_info", user_info_url, headers=headers)
         user_json = user_resp.json()
         
         if user_json.get("code") != 0:
@@ -113,16 +214,28 @@ def auth_callback():
         }
         token_store.save_user_token(user_id, token_data)
         
-        # 4. 检查是否需要补录 (如果 state 包含 meeting_id)
-        remedy_info = ""
+        # 4. 补录授权失效期间错过的会议 (授权失效通知中累计的会议 + 旧版链接 state 中的 meeting_id)
+        missed_meeting_ids = auth_notice_store.pop_missed(user_id)
         if state and state.startswith("meeting_"):
             # 提取会议ID
             missed_meeting_id = state.replace("meeting_", "")
-            if missed_meeting_id:
-                 logger.info(f"[补录逻辑] 检测到授权补录请求，会议ID: {missed_meeting_id}")
-                 t = threading.Thread(target=check_recording_loop, args=(missed_meeting_id, user_id))
-                 t.start()
-                 remedy_info = f"<p style='color: blue'>🔁 正在尝试为你补下载刚才错过的会议 ({missed_meeting_id})，请留意飞书通知。</p>"
+            if missed_meeting_id and missed_meeting_id not in missed_meeting_ids:
+                missed_meeting_ids.append(missed_meeting_id)
+
+        remedy_info = ""
+        if missed_meeting_ids:
+            logger.info(f"[补录逻辑] 用户 {user_id} 重新授权，补录会议: {missed_meeting_ids}")
+            for missed_meeting_id in missed_meeting_ids:
+                # 用户重新授权后允许重新处理已结束 (未授权) 的会议；其他副本正在处理时不重复轮询
+                try:
+                    if lease_manager.claim(missed_meeting_id, user_id, reclaim_done=True):
+                        schedule_recording_check(missed_meeting_id, user_id, priority=PRIORITY_REMEDY)
+                except LeaseUnavailable as e:
+                    logger.error(f"[补录逻辑] {e}，可稍后通过补录接口重新处理")
+            if len(missed_meeting_ids) == 1:
+                remedy_info = f"<p style='color: blue'>🔁 正在尝试为你补下载刚才错过的会议 ({missed_meeting_ids[0]})，请留意飞书通知。</p>"
+            else:
+                remedy_info = f"<p style='color: blue'>🔁 正在尝试为你补下载错过的 {len(missed_meeting_ids)} 个会议，请留意飞书通知。</p>"
 
         return f"""
         <div style="text-align:center; margin-top: 50px;">
@@ -136,3 +249,322 @@ def auth_callback():
     except Exception as e:
         logger.error(f"[Auth Callback Error] {e}")
         return f"❌ 内部异常: {str(e)}"
+
+
+def require_admin(f):
+    """
+    运维接口鉴权: 请求头需携带 Authorization: Bearer <ADMIN_TOKEN>
+    未配置 ADMIN_TOKEN 时，运维接口一律拒绝访问
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        admin_token = _get_config().get('admin_token')
+        auth = request.headers.get('Authorization', '')
+        if not admin_token or not hmac.compare_digest(auth, f"Bearer {admin_token}"):
+            return jsonify({"code": 403, "msg": "forbidden"}), 403
+        return f(*args, **kwargs)
+    return wrapper
+
+def _int_arg(name, default=None):
+    value = request.args.get(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+@api_bp.route("/api/recordings", methods=["GET"])
+@require_admin
+def list_recordings():
+    """
+    查询已归档录制
+    参数: owner_id / meeting_id / object_token / sha256 (精确匹配), topic (模糊匹配),
+          start_from / start_to (会议开始时间, Unix 秒), page, page_size (最大 100)
+    """
+    try:
+        page = max(_int_arg('page', 1), 1)
+        page_size = min(max(_int_arg('page_size', 20), 1), 100)
+        start_from = _int_arg('start_from')
+        start_to = _int_arg('start_to')
+    except ValueError:
+        return jsonify({"code": 400, "msg": "invalid integer parameter"}), 400
+
+    filters = {
+        "owner_id": request.args.get('owner_id'),
+        "meeting_id": request.args.get('meeting_id'),
+        "object_token": request.args.get('object_token'),
+        "sha256": request.args.get('sha256'),
+    }
+    items, total = recording_catalog.query(
+        filters=filters, start_from=start_from, start_to=start_to,
+        topic=request.args.get('topic'), page=page, page_size=page_size)
+
+    return jsonify({
+        "code": 0,
+        "data": {"items": items, "total": total, "page": page, "page_size": page_size}
+    })
+
+@api_bp.route("/api/traces/slowest", methods=["GET"])
+@require_admin
+def slowest_traces():
+    """
+    最近最慢的归档任务及各阶段耗时
+    参数: limit (默认 20，最大 200), include_active=1 同时包含进行中的任务
+    """
+    try:
+        limit = min(max(_int_arg('limit', 20), 1), 200)
+    except ValueError:
+        return jsonify({"code": 400, "msg": "invalid integer parameter"}), 400
+    include_active = request.args.get('include_active') in ('1', 'true')
+    return jsonify({"code": 0, "data": {"items": tracer.slowest(limit, include_active)}})
+
+@api_bp.route("/api/backfill", methods=["POST"])
+@require_admin
+def start_backfill():
+    """
+    历史补录: 为已授权用户归档指定时间范围内的历史会议录制
+    参数 (JSON): start_time / end_time (Unix 秒，必填), user_ids (可选，默认全部已授权用户)
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        start_time = int(body.get("start_time"))
+        end_time = int(body.get("end_time", time.time()))
+    except (TypeError, ValueError):
+        return jsonify({"code": 400, "msg": "start_time / end_time must be unix seconds"}), 400
+    if start_time >= end_time:
+        return jsonify({"code": 400, "msg": "start_time must be earlier than end_time"}), 400
+
+    user_ids = body.get("user_ids") or token_store.list_user_ids()
+    if not isinstance(user_ids, list) or not all(isinstance(u, str) for u in user_ids):
+        return jsonify({"code": 400, "msg": "user_ids must be a list of strings"}), 400
+
+    job = backfill_manager.start(user_ids, start_time, end_time)
+    return jsonify({"code": 0, "data": job.to_dict()}), 202
+
+@api_bp.route("/api/backfill", methods=["GET"])
+@require_admin
+def list_backfills():
+    """最近的补录任务及进度"""
+    return jsonify({"code": 0, "data": {"items": backfill_manager.list()}})
+
+@api_bp.route("/api/backfill/<job_id>", methods=["GET"])
+@require_admin
+def get_backfill(job_id):
+    job = backfill_manager.get(job_id)
+    if job is None:
+        return jsonify({"code": 404, "msg": "backfill job not found"}), 404
+    return jsonify({"code": 0, "data": job.to_dict()})
+
+def _archive_entries(meeting_id=None):
+    """归档重试队列中的条目 (持久化，进程重启后仍在)，按任务列表的格式返回"""
+    now = int(time.time())
+    entries = []
+    for file_path, entry in archive_queue.items().items():
+        if meeting_id is not None and entry.get("meeting_id") != meeting_id:
+            continue
+        entries.append({
+            "meeting_id": entry.get("meeting_id"),
+            "owner_id": entry.get("user_id"),
+            "phase": PHASE_PENDING_ARCHIVE,
+            "file_path": file_path,
+            "attempts": entry.get("attempts", 0),
+            "error": entry.get("last_error"),
+            "next_retry_in": max(entry.get("next_retry_at", 0) - now, 0),
+        })
+    return entries
+
+def _job_data(meeting_id):
+    job = job_registry.get(meeting_id)
+    return job.to_dict() if job is not None else {"meeting_id": meeting_id}
+
+@api_bp.route("/api/jobs", methods=["GET"])
+@require_admin
+def list_jobs():
+    """
+    本副本的归档任务 (轮询录制 / 排队 / 下载 / 归档中，以及最近结束的任务) 和归档重试队列
+    参数: phase (polling / queued / downloading / finalizing / pending_archive / done / failed / cancelled ...),
+          owner_id, limit (默认 100，最大 500)
+    """
+    try:
+        limit = min(max(_int_arg('limit', 100), 1), 500)
+    except ValueError:
+        return jsonify({"code": 400, "msg": "invalid integer parameter"}), 400
+    phase, owner_id = request.args.get('phase') or None, request.args.get('owner_id') or None
+
+    items = [job.to_dict() for job in job_registry.list(phase, owner_id)]
+    counts = job_registry.counts()
+    # 重试队列中的文件: 本副本登记表里没有 (进程重启前 / 其他副本下载) 的也列出
+    tracked = {job.meeting_id for job in job_registry.list(PHASE_PENDING_ARCHIVE)}
+    queued = [e for e in _archive_entries() if e["meeting_id"] not in tracked]
+    counts[PHASE_PENDING_ARCHIVE] = counts.get(PHASE_PENDING_ARCHIVE, 0) + len(queued)
+    if phase in (None, PHASE_PENDING_ARCHIVE):
+        items.extend(e for e in queued if owner_id is None or e["owner_id"] == owner_id)
+    return jsonify({"code": 0, "data": {"items": items[:limit], "total": len(items), "counts": counts}})
+
+@api_bp.route("/api/jobs/<meeting_id>", methods=["GET"])
+@require_admin
+def get_job(meeting_id):
+    job = job_registry.get(meeting_id)
+    archive = _archive_entries(meeting_id)
+    if job is None and not archive:
+        return jsonify({"code": 404, "msg": "job not found"}), 404
+    data = job.to_dict() if job is not None else {"meeting_id": meeting_id, "phase": PHASE_PENDING_ARCHIVE}
+    data["archive_queue"] = archive
+    return jsonify({"code": 0, "data": data})
+
+@api_bp.route("/api/jobs/<meeting_id>/cancel", methods=["POST"])
+@require_admin
+def cancel_job(meeting_id):
+    """
+    取消任务: 等待录制的会议不再查询；排队 / 下载中的任务停止下载并删除临时文件
+    正在查询录制或归档中 (finalizing) 的任务无法取消，返回 409
+    """
+    if cancel_poll(meeting_id):
+        return jsonify({"code": 0, "data": _job_data(meeting_id)})
+    job = job_registry.request_cancel(meeting_id)
+    if job is not None:
+        logger.info(f"[任务管理] 已请求取消会议 {meeting_id} 的下载 ({job.phase})")
+        return jsonify({"code": 0, "data": job.to_dict()}), 202
+    job = job_registry.get(meeting_id)
+    if job is None:
+        return jsonify({"code": 404, "msg": "job not found"}), 404
+    return jsonify({"code": 409, "msg": f"job is {job.phase}, cannot cancel"}), 409
+
+@api_bp.route("/api/jobs/<meeting_id>/repoll", methods=["POST"])
+@require_admin
+def repoll_job(meeting_id):
+    """
+    立即查询录制: 等待中的会议提前执行下一次查询；已结束的会议 (无录制 / 失败 / 已取消) 重新开始查询并下载
+    参数 (JSON): owner_id (登记表中没有该会议时必填)
+    """
+    if poll_now(meeting_id):
+        return jsonify({"code": 0, "data": _job_data(meeting_id)}), 202
+    job = job_registry.get(meeting_id)
+    if job is not None and job.phase in ACTIVE_PHASES:
+        return jsonify({"code": 409, "msg": f"job is {job.phase}"}), 409
+    body = request.get_json(silent=True) or {}
+    owner_id = body.get("owner_id") or (job.owner_id if job is not None else None)
+    if not owner_id:
+        return jsonify({"code": 400, "msg": "owner_id is required"}), 400
+    try:
+        started = restart_polling(meeting_id, owner_id)
+    except LeaseUnavailable:
+        return jsonify({"code": 503, "msg": "lease store unavailable, retry later"}), 503
+    if not started:
+        return jsonify({"code": 409, "msg": "meeting is being processed"}), 409
+    return jsonify({"code": 0, "data": _job_data(meeting_id)}), 202
+
+@api_bp.route("/api/jobs/<meeting_id>/archive", methods=["POST"])
+@require_admin
+def retry_job_archive(meeting_id):
+    """已下载但 NAS 个人归档失败的录制立即重试归档 (不等待退避时间)"""
+    paths = archive_reconciler.retry_now(meeting_id)
+    if not paths:
+        return jsonify({"code": 404, "msg": "no pending archive for this meeting"}), 404
+    return jsonify({"code": 0, "data": {"meeting_id": meeting_id, "paths": paths}}), 202
+
+@api_bp.route("/api/bandwidth", methods=["GET"])
+@require_admin
+def get_bandwidth():
+    """当前全局下载带宽上限及来源 (override / schedule / default)"""
+    return jsonify({"code": 0, "data": bandwidth_governor.status()})
+
+@api_bp.route("/api/bandwidth", methods=["PUT", "POST"])
+@require_admin
+def set_bandwidth():
+    """
+    临时调整全局下载带宽上限，对正在进行的下载立即生效
+    参数 (JSON): rate ("10M" / 字节数，0 为不限速), ttl (秒，可选；到期后恢复分时段配置)
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        rate = parse_size(body.get("rate"))
+        ttl = int(body["ttl"]) if body.get("ttl") is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"code": 400, "msg": "rate must be bytes per second or like '10M', ttl must be seconds"}), 400
+    if rate < 0 or (ttl is not None and ttl <= 0):
+        return jsonify({"code": 400, "msg": "rate and ttl must be positive"}), 400
+    bandwidth_governor.set_override(rate, ttl)
+    logger.info(f"[带宽] 运维接口设置带宽上限 {rate} 字节/秒, ttl={ttl}")
+    return jsonify({"code": 0, "data": bandwidth_governor.status()})
+
+@api_bp.route("/api/bandwidth", methods=["DELETE"])
+@require_admin
+def clear_bandwidth():
+    """取消临时上限，恢复分时段 / 默认配置"""
+    bandwidth_governor.clear_override()
+    return jsonify({"code": 0, "data": bandwidth_governor.status()})
+
+@api_bp.route("/api/debug/profile", methods=["POST"])
+@require_admin
+def start_profile():
+    """
+    开始采样 CPU 分析 (所有线程)
+    参数 (JSON): interval_ms (采样间隔，默认 10), duration (最长秒数，默认 / 最大 600，到时自动停止)
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        interval = float(body.get("interval_ms", DEFAULT_INTERVAL * 1000)) / 1000
+        duration = float(body.get("duration", MAX_DURATION))
+    except (TypeError, ValueError):
+        return jsonify({"code": 400, "msg": "interval_ms / duration must be numbers"}), 400
+    if interval <= 0 or duration <= 0:
+        return jsonify({"code": 400, "msg": "interval_ms and duration must be positive"}), 400
+    if not sampling_profiler.start(interval, duration):
+        return jsonify({"code": 409, "msg": "profiler is already running"}), 409
+    return jsonify({"code": 0, "data": sampling_profiler.status()}), 202
+
+@api_bp.route("/api/debug/profile", methods=["GET"])
+@require_admin
+def profile_status():
+    return jsonify({"code": 0, "data": sampling_profiler.status()})
+
+@api_bp.route("/api/debug/profile", methods=["DELETE"])
+@require_admin
+def stop_profile():
+    """停止采样并下载 collapsed stack 文件 (flamegraph.pl / speedscope 可直接打开)"""
+    collapsed = sampling_profiler.stop()
+    filename = f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed"
+    return Response(collapsed, mimetype="text/plain",
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@api_bp.route("/api/debug/memory", methods=["POST"])
+@require_admin
+def start_memory_trace():
+    """开启 tracemalloc 并记录基线快照。参数 (JSON): frames (调用栈深度，默认 10)"""
+    body = request.get_json(silent=True) or {}
+    try:
+        frames = min(max(int(body.get("frames", DEFAULT_MALLOC_FRAMES)), 1), 100)
+    except (TypeError, ValueError):
+        return jsonify({"code": 400, "msg": "frames must be an integer"}), 400
+    memory_profiler.start(frames)
+    return jsonify({"code": 0, "data": memory_profiler.status()})
+
+@api_bp.route("/api/debug/memory/snapshot", methods=["GET"])
+@require_admin
+def memory_snapshot():
+    """
+    与上一次快照对比内存增长最多的位置
+    参数: limit (默认 30，最大 200), key_type (lineno / filename / traceback)
+    """
+    try:
+        limit = min(max(_int_arg('limit', 30), 1), 200)
+    except ValueError:
+        return jsonify({"code": 400, "msg": "invalid integer parameter"}), 400
+    key_type = request.args.get('key_type', 'lineno')
+    if key_type not in ('lineno', 'filename', 'traceback'):
+        return jsonify({"code": 400, "msg": "key_type must be lineno / filename / traceback"}), 400
+    diff = memory_profiler.snapshot_diff(limit, key_type)
+    if diff is None:
+        return jsonify({"code": 409, "msg": "tracemalloc is not started, POST /api/debug/memory first"}), 409
+    return jsonify({"code": 0, "data": diff})
+
+@api_bp.route("/api/debug/memory", methods=["DELETE"])
+@require_admin
+def stop_memory_trace():
+    memory_profiler.stop()
+    return jsonify({"code": 0, "data": memory_profiler.status()})
+
+@api_bp.route("/api/debug/threads", methods=["GET"])
+@require_admin
+def dump_threads():
+    """所有线程的调用栈，正在处理归档任务的线程标注会议 / 阶段 (排在前面)"""
+    return jsonify({"code": 0, "data": {"items": thread_dump()}})
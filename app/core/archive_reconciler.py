@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+from app.utils.logger import logger
+from app.utils.config import load_config
+from app.data.archive_queue import archive_queue
+from app.data.archive_index import archive_index
+from app.data.recording_catalog import recording_catalog
+from app.core.nas_manager import NasManager
+from app.core.job_registry import job_registry
+from app.core.notification import send_archive_followup_notification
+from app.utils.metrics import registry
+
+# 单条记录的最大退避时间 (秒)
+MAX_BACKOFF = 6 * 3600
+
+registry.gauge("feishu_archive_retry_queue_depth", "归档重试队列中的文件数", callback=archive_queue.size)
+
+_started = False
+_start_lock = threading.Lock()
+_wakeup = threading.Event()
+
+def _mapping_mtime():
+    try:
+        return os.path.getmtime(NasManager.MAPPING_FILE)
+    except OSError:
+        return None
+
+def _nas_available():
+    return os.path.isdir(NasManager.NAS_ROOT)
+
+def reconcile_once(batch_size, move_interval, base_interval):
+    """
+    处理一批到期的待归档文件
+    返回: 成功归档的数量
+    """
+    archived = 0
+    for file_path, entry in archive_queue.due_items(batch_size):
+        # 文件已被人工处理或清理，直接出队
+        if not os.path.exists(file_path):
+            logger.info(f"[归档重试] 文件已不存在，移出队列: {file_path}")
+            archive_queue.remove(file_path)
+            continue
+
+        user_id = entry.get("user_id")
+        user_name = entry.get("user_name")
+        is_archived, archived_path, nas_folder = NasManager.archive_file(file_path, user_name, user_id)
+
+        if is_archived:
+            archived += 1
+            archive_queue.remove(file_path)
+            archive_index.replace_path(file_path, archived_path)
+            recording_catalog.update_personal_path(file_path, archived_path)
+            logger.info(f"[归档重试] 补归档成功: {file_path} -> {archived_path}")
+            if entry.get("meeting_id"):
+                job_registry.mark_archived(entry["meeting_id"])
+            send_archive_followup_notification(user_id, entry.get("file_name"), f"NAS/{nas_folder}")
+        else:
+            # 指数退避: base, 2*base, 4*base ... 最长 MAX_BACKOFF
+            attempts = entry.get("attempts", 0) + 1
+            retry_after = min(base_interval * (2 ** (attempts - 1)), MAX_BACKOFF)
+            archive_queue.mark_failed(file_path, "归档未成功 (未找到目录或移动失败)", retry_after)
+            logger.info(f"[归档重试] 第 {attempts} 次重试失败，{retry_after} 秒后再试: {file_path}")
+
+        # 限速: 大文件移动会占满 NAS 带宽，两次移动之间留出间隔
+        if move_interval > 0:
+            time.sleep(move_interval)
+    return archived
+
+def _reconcile_loop():
+    config = load_config()
+    interval = config["archive_retry_interval"]
+    batch_size = config["archive_retry_batch_size"]
+    move_interval = config["archive_retry_move_interval"]
+
+    last_mtime = _mapping_mtime()
+    last_nas_ok = _nas_available()
+
+    while True:
+        # 每个周期醒来一次; 映射表变化或 NAS 恢复也能被及时发现
+        _wakeup.wait(timeout=min(interval, 60))
+        _wakeup.clear()
+        try:
+            mtime = _mapping_mtime()
+            nas_ok = _nas_available()
+            if mtime != last_mtime:
+                logger.info("[归档重试] 检测到 NAS 映射表更新，立即重试所有待归档文件")
+                archive_queue.reset_schedule()
+            elif nas_ok and not last_nas_ok:
+                logger.info("[归档重试] 检测到 NAS 挂载恢复，立即重试所有待归档文件")
+                archive_queue.reset_schedule()
+            last_mtime, last_nas_ok = mtime, nas_ok
+
+            if not nas_ok:
+                continue
+
+            reconcile_once(batch_size, move_interval, interval)
+        except Exception as e:
+            logger.error(f"[归档重试异常] {e}")
+
+def retry_now(meeting_id):
+    """
+    管理接口: 立即重试该会议的待归档文件 (唤醒后台线程，不等到下次重试时间)
+    返回: 待归档文件的路径，为空表示该会议没有待归档文件
+    """
+    paths = archive_queue.retry_now(meeting_id)
+    if paths:
+        logger.info(f"[归档重试] 会议 {meeting_id} 立即重试: {paths}")
+        _wakeup.set()
+    return paths
+
+def start_archive_reconciler():
+    """启动后台归档重试线程 (进程内只启动一次)"""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    t = threading.Thread(target=_reconcile_loop, name="archive-reconciler", daemon=True)
+    t.start()
+    logger.info(f"[归档重试] 后台线程已启动，当前待归档文件: {archive_queue.size()} 个")
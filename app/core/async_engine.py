@@ -0,0 +1,80 @@
+import time
+import asyncio
+import threading
+from app.utils.logger import logger
+from app.utils.feishu_client import response_code
+from app.utils.metrics import API_REQUESTS, API_LATENCY
+
+try:
+    import httpx
+except ImportError:  # 未安装 httpx 时只能使用 thread 执行模式
+    httpx = None
+
+class AsyncEngine:
+    """
+    asyncio 执行模式的事件循环
+    在独立线程中运行一个事件循环，Flask / Waitress 工作线程通过 submit() 把协程交给它执行，
+    等待录制生成的会议只是一个挂起的协程 (几 KB 内存)，而不是一个休眠的系统线程
+    """
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def available():
+        return httpx is not None
+
+    def start(self):
+        """启动事件循环线程 (只会启动一次)"""
+        with self._lock:
+            if self._loop is not None:
+                return self._loop
+            ready = threading.Event()
+
+            def _run():
+                self._loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self._loop)
+                ready.set()
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=_run, name="feishu-async-loop", daemon=True)
+            self._thread.start()
+            ready.wait()
+            logger.info("[Async] 事件循环线程已启动")
+            return self._loop
+
+    def submit(self, coro):
+        """从任意线程提交协程，返回 concurrent.futures.Future"""
+        loop = self.start()
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def client(self):
+        """共享的 httpx.AsyncClient (连接池复用)，只能在事件循环线程中调用"""
+        if self._client is None:
+            # follow_redirects: 与 requests 默认行为一致 (媒体下载链接可能跳转到 CDN)
+            self._client = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=httpx.Timeout(30.0, read=300.0),
+                limits=httpx.Limits(max_connections=200, max_keepalive_connections=50))
+        return self._client
+
+# 全局单例
+async_engine = AsyncEngine()
+
+async def async_api_request(method, endpoint, url, **kwargs):
+    """
+    api_request 的协程版本 (httpx)，记录相同的耗时与返回码指标
+    其余参数原样传给 httpx.AsyncClient.request，返回 httpx.Response
+    """
+    started = time.perf_counter()
+    try:
+        resp = await async_engine.client().request(method, url, **kwargs)
+    except Exception:
+        API_LATENCY.observe(endpoint, value=time.perf_counter() - started)
+        API_REQUESTS.inc(endpoint, "exception")
+        raise
+    API_LATENCY.observe(endpoint, value=time.perf_counter() - started)
+    API_REQUESTS.inc(endpoint, response_code(resp))
+    return resp
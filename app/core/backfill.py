@@ -0,0 +1,234 @@
+import re
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from app.utils.logger import logger
+from app.utils.config import load_config
+from app.utils.tracing import tracer
+from app.utils.exceptions import JobInterrupted, LeaseUnavailable
+from app.data.token_store import token_store
+from app.data.recording_catalog import recording_catalog
+from app.core.bandwidth import TokenBucket, download_limiter
+from app.core.lease_manager import lease_manager
+from app.core.lifecycle import lifecycle
+from app.core.download_scheduler import download_priority, PRIORITY_LIVE, PRIORITY_BACKFILL
+from app.core.meeting_service import list_user_meetings, get_recording_info, get_meeting_owner
+from app.core.downloader import download_single_video
+
+# 会议列表接口按时间窗口分段查询 (单次查询范围不宜过大)
+WINDOW_SECONDS = 30 * 86400
+# 内存中保留最近的补录任务数
+MAX_JOBS = 20
+
+# 下载完成后 Trace 上的 result -> 补录统计项
+_RESULT_COUNTERS = {
+    "archived": "archived",
+    "pending_archive": "archived",
+    "already_archived": "skipped_archived",
+    "file_exists": "skipped_archived",
+    "duplicate_content": "skipped_archived",
+}
+
+class BackfillJob:
+    """一次历史补录任务的进度"""
+    def __init__(self, user_ids, start_time, end_time):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.user_ids = list(user_ids)
+        self.start_time = int(start_time)
+        self.end_time = int(end_time)
+        self.status = "pending"
+        self.created_at = int(time.time())
+        self.finished_at = None
+        self.counts = {
+            "meetings": 0, "skipped_archived": 0, "skipped_claimed": 0, "skipped_not_owner": 0,
+            "no_recording": 0, "archived": 0, "failed": 0, "interrupted": 0,
+        }
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def error(self, message):
+        logger.error(f"[历史补录] {message}")
+        with self._lock:
+            self.errors = (self.errors + [message])[-20:]
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "user_ids": self.user_ids,
+                "start_time": self.start_time,
+                "end_time": self.end_time,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+                "counts": dict(self.counts),
+                "errors": list(self.errors),
+            }
+
+def _iter_windows(start_time, end_time):
+    cursor = start_time
+    while cursor < end_time:
+        yield cursor, min(cursor + WINDOW_SECONDS, end_time)
+        cursor += WINDOW_SECONDS
+
+def _process_meeting(job, meeting_id, owner_id, limiter):
+    """补录单个会议: 已归档跳过，否则查询录制并走与实时事件相同的下载归档流程"""
+    if not lifecycle.accepting():
+        # 进程正在退出: 尚未开始的会议不再处理，之后重新发起补录即可 (已归档的会议会被跳过)
+        job.incr("interrupted")
+        return
+    if recording_catalog.has_meeting(meeting_id):
+        job.incr("skipped_archived")
+        return
+    # 会议列表中也有用户只是参会的会议: 只归档该用户作为 Owner 的会议 (参会的会议由其 Owner 的补录处理)，
+    # 否则录制会以参会人为 Owner 归档到错误的个人目录
+    user_data = token_store.get_user_token(owner_id)
+    user_token = user_data.get("user_access_token") if user_data else None
+    if not user_token:
+        job.incr("failed")
+        return
+    meeting_owner = get_meeting_owner(meeting_id, user_token)
+    if meeting_owner is None:
+        job.incr("failed")
+        job.error(f"会议 {meeting_id} 无法获取 Owner，跳过")
+        return
+    if meeting_owner != owner_id:
+        job.incr("skipped_not_owner")
+        return
+    # 与实时事件共用会议租约: 其他副本 / 实时流程正在处理或已处理过的会议不再重复下载
+    try:
+        claimed = lease_manager.claim(meeting_id, owner_id)
+    except LeaseUnavailable as e:
+        job.incr("failed")
+        job.error(str(e))
+        return
+    if not claimed:
+        job.incr("skipped_claimed")
+        return
+
+    trace = None
+    # 只有下载流程走完才标记完成；未授权 / 暂无录制 / 失败的会议允许之后重新补录
+    completed = False
+    interrupted = False
+    try:
+        res = get_recording_info(meeting_id, user_token, user_id=owner_id, silent=True)
+        url = (res or {}).get("data", {}).get("recording", {}).get("url") if res and res.get("code") == 0 else None
+        match = re.search(r'(obcn[a-z0-9]+)', url or "")
+        if not match:
+            job.incr("no_recording")
+            return
+
+        trace = tracer.start(meeting_id, owner_id)
+        tracer.annotate(source="backfill", backfill_job=job.job_id)
+        # 补录下载共享同一个限速器，总带宽不超过 BACKFILL_BANDWIDTH；调度优先级低于实时会议
+        download_limiter.set(limiter)
+        download_priority.set(PRIORITY_BACKFILL)
+        # Token 可能在查询录制时被刷新，重新读取
+        user_data = token_store.get_user_token(owner_id) or user_data
+        download_single_video(match.group(1), owner_id, user_data.get("user_access_token"), meeting_id)
+        result = _RESULT_COUNTERS.get(trace.attrs.get("result"), "failed")
+        job.incr(result)
+        completed = result != "failed"
+        tracer.finish("done")
+    except JobInterrupted as e:
+        # 进程退出: 保存断点，由重启后的副本按补录优先级继续下载 (已下载的部分断点续传)
+        interrupted = True
+        job.incr("interrupted")
+        logger.warning(f"[历史补录] 会议 {meeting_id} 下载中断: {e}")
+        if trace is not None:
+            tracer.finish("interrupted")
+        lease_manager.suspend(meeting_id, owner_id, attempt=1, priority=PRIORITY_BACKFILL, due_at=time.time())
+    except Exception as e:
+        job.incr("failed")
+        job.error(f"会议 {meeting_id} 补录失败: {e}")
+        if trace is not None:
+            tracer.finish("error")
+    finally:
+        download_limiter.set(None)
+        download_priority.set(PRIORITY_LIVE)
+        if not interrupted:
+            lease_manager.release(meeting_id, done=completed)
+
+def run_backfill(job):
+    """
+    同步执行补录任务 (命令行直接调用；接口调用时在后台线程中执行)
+    使用独立的线程池和限速器，并发数 / 带宽不占用实时归档的资源
+    """
+    config = load_config()
+    limiter = TokenBucket(config["backfill_bandwidth"])
+    job.status = "running"
+    logger.info(f"[历史补录] 任务 {job.job_id} 开始: {len(job.user_ids)} 个用户, "
+                f"{time.strftime('%Y-%m-%d', time.localtime(job.start_time))} ~ "
+                f"{time.strftime('%Y-%m-%d', time.localtime(job.end_time))}")
+
+    with ThreadPoolExecutor(max_workers=max(config["backfill_concurrency"], 1),
+                            thread_name_prefix=f"backfill-{job.job_id}") as pool:
+        futures = []
+        seen = set()
+        for user_id in job.user_ids:
+            user_data = token_store.get_user_token(user_id)
+            if not user_data:
+                job.error(f"用户 {user_id} 未授权，跳过")
+                continue
+            for window_start, window_end in _iter_windows(job.start_time, job.end_time):
+                try:
+                    meetings = list_user_meetings(user_data.get("user_access_token"), window_start, window_end,
+                                                  user_id=user_id)
+                except Exception as e:
+                    job.error(f"用户 {user_id} 会议列表获取失败: {e}")
+                    continue
+                # 同一会议可能出现在相邻时间窗口的列表中；出现在多个参会人列表中的会议
+                # 由各自的任务检查 Owner，只有 Owner 的那一份会下载
+                meetings = [m["meeting_id"] for m in meetings if (user_id, m["meeting_id"]) not in seen]
+                seen.update((user_id, meeting_id) for meeting_id in meetings)
+                job.incr("meetings", len(meetings))
+                for meeting_id in meetings:
+                    futures.append(pool.submit(_process_meeting, job, meeting_id, user_id, limiter))
+        for future in futures:
+            future.result()
+
+    job.status = "interrupted" if job.counts["interrupted"] else "done"
+    job.finished_at = int(time.time())
+    logger.info(f"[历史补录] 任务 {job.job_id} 完成: {job.counts}")
+    return job
+
+class BackfillManager:
+    """后台补录任务 (接口触发)，内存中保留最近 MAX_JOBS 个任务的进度"""
+    def __init__(self):
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, user_ids, start_time, end_time):
+        job = BackfillJob(user_ids, start_time, end_time)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > MAX_JOBS:
+                self._jobs.popitem(last=False)
+
+        def _run():
+            try:
+                run_backfill(job)
+            except Exception as e:
+                job.status = "failed"
+                job.finished_at = int(time.time())
+                job.error(f"任务异常: {e}")
+
+        threading.Thread(target=_run, name=f"backfill-{job.job_id}", daemon=True).start()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
+
+# 全局单例
+backfill_manager = BackfillManager()
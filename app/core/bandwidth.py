@@ -0,0 +1,203 @@
+import re
+import time
+import asyncio
+import threading
+import contextvars
+from app.utils.logger import logger
+from app.utils.config import load_config, parse_size
+from app.utils.metrics import registry
+
+class TokenBucket:
+    """
+    令牌桶限速 (字节/秒)，可被多个下载线程共享，整体速率不超过 rate
+    rate <= 0 表示不限速
+    """
+    def __init__(self, rate, burst=None):
+        self._lock = threading.Lock()
+        self._burst = burst
+        self._updated = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """调整速率 (立即对所有正在下载的流生效)"""
+        with self._lock:
+            self.rate = float(rate)
+            # 默认允许 1 秒的突发量，至少能放行一个下载块
+            self.capacity = float(self._burst if self._burst is not None else max(rate, 1024 * 1024))
+            self._tokens = min(getattr(self, "_tokens", self.capacity), self.capacity)
+
+    def _reserve(self, n):
+        """预扣 n 个令牌，返回需要等待的秒数 (令牌可以透支，等待结束后正好补齐)"""
+        with self._lock:
+            if self.rate <= 0:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= n
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def consume(self, n):
+        if self.rate <= 0:
+            return
+        wait = self._reserve(n)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def async_consume(self, n):
+        if self.rate <= 0:
+            return
+        wait = self._reserve(n)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+# 当前下载使用的限速器 (None 为不限速)
+# 通过 ContextVar 传递，批量任务 (例如历史补录) 在自己的线程中设置后，
+# download_single_video 等函数签名不变即可生效
+download_limiter = contextvars.ContextVar("download_limiter", default=None)
+
+_WEEKDAYS = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+
+def _parse_days(text):
+    """ "mon-fri" / "sat,sun" -> 星期集合 (0=周一)"""
+    days = set()
+    for part in text.split(","):
+        if "-" in part:
+            start, end = (_WEEKDAYS[p.strip()[:3]] for p in part.split("-", 1))
+            days.update(range(start, end + 1) if start <= end else list(range(start, 7)) + list(range(0, end + 1)))
+        else:
+            days.add(_WEEKDAYS[part.strip()[:3]])
+    return days
+
+def parse_schedule(text):
+    """
+    解析分时段带宽配置，多个时段用 ; 分隔，按顺序匹配第一个:
+        "mon-fri 09:00-18:00=10M; 18:00-09:00=0"
+    星期可省略 (每天)；结束时间小于开始时间表示跨零点
+    返回: [(星期集合或 None, 开始分钟, 结束分钟, 字节/秒)]
+    """
+    windows = []
+    for entry in filter(None, (e.strip() for e in (text or "").split(";"))):
+        m = re.match(r"^(?:([a-z,\-]+)\s+)?(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})\s*=\s*(\S+)$", entry.lower())
+        if not m:
+            raise ValueError(f"无法解析带宽时段: {entry}")
+        days = _parse_days(m.group(1)) if m.group(1) else None
+        start = int(m.group(2)) * 60 + int(m.group(3))
+        end = int(m.group(4)) * 60 + int(m.group(5))
+        windows.append((days, start, end, parse_size(m.group(6))))
+    return windows
+
+def _window_matches(window, now):
+    days, start, end, _ = window
+    minute = now.tm_hour * 60 + now.tm_min
+    weekday = now.tm_wday
+    if start <= end:
+        in_window = start <= minute < end
+    else:
+        # 跨零点: 凌晨部分属于前一天的时段
+        in_window = minute >= start or minute < end
+        if minute < end:
+            weekday = (weekday - 1) % 7
+    return in_window and (days is None or weekday in days)
+
+class BandwidthGovernor:
+    """
+    全局下载带宽控制: 所有并发下载共享一个令牌桶，总速率不超过当前上限
+    上限来源 (优先级从高到低): 运维接口临时设置 > 分时段配置 BANDWIDTH_SCHEDULE > 默认 BANDWIDTH_LIMIT
+    """
+    # 每隔多少秒重新计算一次当前时段的上限
+    REFRESH_INTERVAL = 10
+
+    def __init__(self):
+        self._bucket = TokenBucket(0)
+        self._lock = threading.Lock()
+        self._schedule = None
+        self._default_rate = 0
+        self._override = None  # (rate, 过期时间 或 None)
+        self._source = "default"
+        self._checked_at = 0.0
+
+    def _load(self):
+        if self._schedule is None:
+            config = load_config()
+            self._default_rate = config["bandwidth_limit"]
+            try:
+                self._schedule = parse_schedule(config["bandwidth_schedule"])
+            except (ValueError, KeyError) as e:
+                logger.error(f"[带宽] BANDWIDTH_SCHEDULE 配置错误，忽略分时段限速: {e}")
+                self._schedule = []
+
+    def _resolve(self, now=None):
+        """计算当前应生效的上限: (字节/秒, 来源)"""
+        self._load()
+        if self._override is not None:
+            rate, expires_at = self._override
+            if expires_at is None or time.time() < expires_at:
+                return rate, "override"
+            self._override = None
+        local = time.localtime(now)
+        for window in self._schedule:
+            if _window_matches(window, local):
+                return window[3], "schedule"
+        return self._default_rate, "default"
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.REFRESH_INTERVAL:
+            return
+        with self._lock:
+            self._checked_at = now
+            rate, source = self._resolve()
+            if rate != self._bucket.rate:
+                logger.info(f"[带宽] 下载带宽上限调整为 {_format_rate(rate)} ({source})")
+                self._bucket.set_rate(rate)
+            self._source = source
+
+    def consume(self, n):
+        self._refresh()
+        self._bucket.consume(n)
+
+    async def async_consume(self, n):
+        self._refresh()
+        await self._bucket.async_consume(n)
+
+    def set_override(self, rate, ttl=None):
+        """运维接口临时设置上限 (ttl 秒后恢复分时段配置，None 为一直有效)"""
+        with self._lock:
+            self._override = (int(rate), time.time() + ttl if ttl else None)
+        self._refresh(force=True)
+
+    def clear_override(self):
+        with self._lock:
+            self._override = None
+        self._refresh(force=True)
+
+    def current_rate(self):
+        self._refresh()
+        return self._bucket.rate
+
+    def status(self):
+        self._refresh()
+        self._load()
+        override = self._override
+        return {
+            "rate": int(self._bucket.rate),
+            "rate_human": _format_rate(self._bucket.rate),
+            "source": self._source,
+            "default_rate": self._default_rate,
+            "schedule": load_config()["bandwidth_schedule"],
+            "override_expires_at": int(override[1]) if override and override[1] else None,
+        }
+
+def _format_rate(rate):
+    if rate <= 0:
+        return "unlimited"
+    return f"{rate / 1024 / 1024:.1f}MB/s"
+
+# 全局单例
+bandwidth_governor = BandwidthGovernor()
+
+registry.gauge("feishu_bandwidth_limit_bytes", "当前全局下载带宽上限 (字节/秒，0 为不限)",
+               callback=bandwidth_governor.current_rate)
@@ -0,0 +1,179 @@
+import time
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from app.utils.config import load_config
+from app.utils.exceptions import JobInterrupted
+from app.utils.metrics import registry, DOWNLOAD_QUEUE_WAIT, SHUTDOWN_CHECKPOINTS
+from app.core.lifecycle import lifecycle
+
+# 优先级 (数字越小越优先): 实时会议 > 用户授权后的补录 > 历史批量补录
+PRIORITY_LIVE = 0
+PRIORITY_REMEDY = 1
+PRIORITY_BACKFILL = 2
+PRIORITY_NAMES = {PRIORITY_LIVE: "live", PRIORITY_REMEDY: "remedy", PRIORITY_BACKFILL: "backfill"}
+
+# 当前任务的优先级，由发起方 (轮询线程 / 补录线程 / 协程) 设置，下载时读取
+download_priority = contextvars.ContextVar("download_priority", default=PRIORITY_LIVE)
+
+class _Ticket:
+    def __init__(self, seq, owner_id, priority, expected_size):
+        self.seq = seq
+        self.owner_id = owner_id
+        self.priority = priority
+        self.expected_size = expected_size
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.event = threading.Event()
+        # 协程等待时的 (loop, future)
+        self.waiter = None
+
+class DownloadScheduler:
+    """
+    下载任务调度: 限制同时下载数，空出名额时按以下顺序挑选等待中的任务
+    1. 优先级 (实时 > 补录)；等待超过 DOWNLOAD_AGING_SECONDS 的任务提升为最高优先级，避免饿死
+    2. 按 Owner 公平轮转: 当前正在下载数少、最久没被调度的 Owner 优先
+       (一个用户连续结束十个会议，不会挡住其他人的短会)
+    3. 可选 (DOWNLOAD_SJF=1): 预计文件小的优先 (Content-Length)
+    4. 先到先得
+    DOWNLOAD_POLICY=fifo 时只按到达顺序调度 (用于对比 / 回退)
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._running = 0
+        self._running_by_owner = {}
+        self._served = {}
+        self._seq = itertools.count()
+        self._serve_seq = itertools.count(1)
+        self._config = None
+        self._closed = False
+
+    def _get_config(self):
+        if self._config is None:
+            config = load_config()
+            self._config = {
+                "max_running": max(config["download_concurrency"], 1),
+                "aging": config["download_aging_seconds"],
+                "sjf": config["download_sjf"],
+                "fifo": config["download_policy"] == "fifo",
+            }
+        return self._config
+
+    def _sort_key(self, ticket, now):
+        config = self._get_config()
+        if config["fifo"]:
+            return (ticket.seq,)
+        aged = now - ticket.enqueued_at >= config["aging"]
+        priority = PRIORITY_LIVE if aged else ticket.priority
+        size = 0
+        if config["sjf"] and not aged:
+            size = ticket.expected_size if ticket.expected_size is not None else float("inf")
+        return (priority,
+                self._running_by_owner.get(ticket.owner_id, 0),
+                self._served.get(ticket.owner_id, 0),
+                size,
+                ticket.seq)
+
+    def _dispatch(self):
+        """在持有 _cond 时调用: 有空闲名额就按顺序放行等待中的任务"""
+        max_running = self._get_config()["max_running"]
+        while self._waiting and self._running < max_running:
+            now = time.monotonic()
+            ticket = min(self._waiting, key=lambda t: self._sort_key(t, now))
+            self._waiting.remove(ticket)
+            self._running += 1
+            self._running_by_owner[ticket.owner_id] = self._running_by_owner.get(ticket.owner_id, 0) + 1
+            self._served[ticket.owner_id] = next(self._serve_seq)
+            ticket.granted = True
+            ticket.event.set()
+            if ticket.waiter is not None:
+                loop, future = ticket.waiter
+                loop.call_soon_threadsafe(_resolve, future)
+            DOWNLOAD_QUEUE_WAIT.observe(PRIORITY_NAMES.get(ticket.priority, str(ticket.priority)),
+                                        value=now - ticket.enqueued_at)
+
+    def _enqueue(self, owner_id, priority, expected_size, waiter=None):
+        ticket = _Ticket(next(self._seq), owner_id, priority, expected_size)
+        ticket.waiter = waiter
+        with self._cond:
+            if self._closed:
+                raise JobInterrupted("进程正在退出，不再调度新的下载")
+            self._waiting.append(ticket)
+            self._dispatch()
+        return ticket
+
+    def release(self, ticket):
+        with self._cond:
+            if not ticket.granted:
+                # 等待期间被取消 (例如协程被 cancel)
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                return
+            self._running -= 1
+            remaining = self._running_by_owner.get(ticket.owner_id, 1) - 1
+            if remaining > 0:
+                self._running_by_owner[ticket.owner_id] = remaining
+            else:
+                self._running_by_owner.pop(ticket.owner_id, None)
+            # 只保留有任务的 Owner 的轮转记录，避免无限增长
+            if len(self._served) > 10000:
+                active = {t.owner_id for t in self._waiting} | set(self._running_by_owner)
+                self._served = {k: v for k, v in self._served.items() if k in active}
+            self._dispatch()
+
+    def close(self):
+        """进程退出: 不再放行新的下载，唤醒所有等待中的任务 (抛出 JobInterrupted，由调用方保存断点)"""
+        with self._cond:
+            self._closed = True
+            waiting, self._waiting = self._waiting, []
+        for ticket in waiting:
+            SHUTDOWN_CHECKPOINTS.inc("queued")
+            ticket.event.set()
+            if ticket.waiter is not None:
+                loop, future = ticket.waiter
+                loop.call_soon_threadsafe(_resolve, future)
+
+    @contextmanager
+    def slot(self, owner_id, expected_size=None):
+        """获取一个下载名额 (阻塞等待)，优先级取自 download_priority"""
+        ticket = self._enqueue(owner_id, download_priority.get(), expected_size)
+        try:
+            ticket.event.wait()
+            if not ticket.granted:
+                raise JobInterrupted("进程正在退出，等待中的下载已取消")
+            yield
+        finally:
+            self.release(ticket)
+
+    async def async_acquire(self, owner_id, expected_size=None):
+        """协程版本: 等待期间不占用线程，返回 ticket，用完后调用 release"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        ticket = self._enqueue(owner_id, download_priority.get(), expected_size, waiter=(loop, future))
+        try:
+            await future
+            if not ticket.granted:
+                raise JobInterrupted("进程正在退出，等待中的下载已取消")
+        except BaseException:
+            self.release(ticket)
+            raise
+        return ticket
+
+    def queued(self):
+        return len(self._waiting)
+
+    def running(self):
+        return self._running
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+# 全局单例
+download_scheduler = DownloadScheduler()
+lifecycle.add_drain_hook(download_scheduler.close)
+
+registry.gauge("feishu_download_queue_depth", "等待下载名额的任务数", callback=download_scheduler.queued)
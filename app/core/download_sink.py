@@ -0,0 +1,270 @@
+import os
+import sys
+import ssl
+import mmap
+import time
+import fcntl
+import select
+import socket
+import asyncio
+import hashlib
+from collections import deque
+import requests
+from app.utils.logger import logger
+from app.utils.config import load_config
+from app.utils.exceptions import DownloadError, DownloadStalled, JobInterrupted, JobCancelled
+from app.utils.metrics import DOWNLOAD_SINK
+from app.core.bandwidth import download_limiter, bandwidth_governor
+from app.core.lifecycle import lifecycle
+
+# 每次从网络读取的块大小 (1MB，减少 Python 层循环和 hash.update 调用次数)
+CHUNK_SIZE = 1024 * 1024
+# 零拷贝写入 (os.splice: socket -> 管道 -> 文件) 需要 Python 3.10+ 且只在 Linux 上可用
+SPLICE_SUPPORTED = hasattr(os, "splice")
+# 调整管道容量 (Python 3.10+)，不可用时使用默认容量
+_F_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", None)
+
+class StallMonitor:
+    """
+    下载吞吐监测: 最近 window 秒内的平均速度低于 min_rate (字节/秒) 判定为卡顿
+    限速等待 (全局带宽上限 / 补录限速) 的时间不计入，完全收不到数据的情况由连接的读超时处理
+    """
+    def __init__(self, min_rate, window):
+        self.min_rate = min_rate
+        self.window = window
+        self._throttled = 0.0
+        self._started = time.monotonic()
+        # (扣除限速等待后的时间, 字节数)
+        self._samples = deque()
+        self._window_bytes = 0
+
+    def update(self, n, throttled=0.0):
+        """记录收到的 n 字节；throttled 为本次限速等待的秒数"""
+        if self.min_rate <= 0 or self.window <= 0:
+            return
+        self._throttled += throttled
+        now = time.monotonic() - self._throttled
+        self._samples.append((now, n))
+        self._window_bytes += n
+        while self._samples and now - self._samples[0][0] > self.window:
+            self._window_bytes -= self._samples.popleft()[1]
+        if now - self._started >= self.window and self._window_bytes < self.min_rate * self.window:
+            raise DownloadStalled(f"最近 {self.window:.0f} 秒平均速度 {self._window_bytes / self.window:.0f} 字节/秒，"
+                                  f"低于 {self.min_rate} 字节/秒")
+
+def _resume_hasher(file_path, resume_from, chunk_size=CHUNK_SIZE):
+    """断点续传: 先对已下载的部分计算哈希，之后接着写入的数据继续累加"""
+    hasher = hashlib.sha256()
+    if resume_from:
+        with open(file_path, 'rb') as f:
+            remaining = resume_from
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise DownloadError(f"断点文件不完整: {file_path}")
+                hasher.update(chunk)
+                remaining -= len(chunk)
+    return hasher
+
+def check_zero_copy():
+    """启动时检查: 开启了 DOWNLOAD_ZERO_COPY 但运行环境不支持 splice 时告警 (下载仍按普通方式写入)"""
+    if load_config()["download_zero_copy"] and not SPLICE_SUPPORTED:
+        logger.warning("[零拷贝] DOWNLOAD_ZERO_COPY=1 需要 Linux 上的 Python 3.10+ (os.splice)，"
+                       f"当前为 Python {sys.version.split()[0]}，下载将使用普通写入")
+
+def _check_abort(file_path, written, progress=None):
+    if lifecycle.aborting():
+        raise JobInterrupted(f"进程退出，下载中断: {file_path} (已写入 {written} 字节)")
+    if progress is not None and progress.cancelled:
+        raise JobCancelled(f"任务已取消: {file_path} (已写入 {written} 字节)")
+
+def _throttle(n, limiter, monitor):
+    """每写入一块数据后: 全局带宽上限 (所有下载共享) + 任务自己的限速 (例如历史补录)，再更新卡顿监测"""
+    throttle_started = time.monotonic()
+    bandwidth_governor.consume(n)
+    if limiter is not None:
+        limiter.consume(n)
+    if monitor is not None:
+        monitor.update(n, time.monotonic() - throttle_started)
+
+def stream_to_file(response, file_path, chunk_size=CHUNK_SIZE, resume_from=0, monitor=None, zero_copy=False,
+                   progress=None):
+    """
+    将 HTTP 流式响应写入文件，并在写入的同时计算 SHA-256 (不需要再读一遍文件)
+    :param response: requests 的流式响应 (stream=True)
+    :param resume_from: 断点续传时文件中已有的字节数 (response 为对应的 206 Range 响应)，新数据追加写入
+    :param monitor: 可选的 StallMonitor，速度过低时抛出 DownloadStalled (已写入的数据保留，可从断点重连)
+    :param zero_copy: 条件允许时 (Linux、明文 HTTP、有 Content-Length) 用 splice 零拷贝写入，否则按普通方式写入
+    :param progress: 可选的 DownloadProgress (任务登记表)，每块数据累加已写入字节数，取消标记置位时停止下载
+    :return: (文件总字节数, sha256 十六进制字符串)
+    :raises DownloadError: 实际字节数与 Content-Length 不一致 (连接提前断开导致文件不完整)
+    :raises JobInterrupted: 进程退出超时，已写入的数据保留在文件中供下次续传
+    :raises JobCancelled: 任务被管理接口取消
+    """
+    source = _splice_source(response) if zero_copy and SPLICE_SUPPORTED else None
+    if source is not None:
+        DOWNLOAD_SINK.inc("splice")
+        return _splice_to_file(response, source, file_path, chunk_size, resume_from, monitor, progress)
+    DOWNLOAD_SINK.inc("buffered")
+    if progress is not None:
+        progress.reset(resume_from)
+
+    hasher = _resume_hasher(file_path, resume_from, chunk_size)
+    written = 0
+    limiter = download_limiter.get()
+    with open(file_path, 'ab' if resume_from else 'wb') as f:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if not chunk:
+                continue
+            f.write(chunk)
+            hasher.update(chunk)
+            written += len(chunk)
+            if progress is not None:
+                progress.add(len(chunk))
+            _check_abort(file_path, resume_from + written, progress)
+            _throttle(len(chunk), limiter, monitor)
+
+    _check_length(response, written)
+    return resume_from + written, hasher.hexdigest()
+
+def _splice_source(response):
+    """
+    零拷贝写入的前提: 响应正文直接来自一个明文 TCP socket (非 HTTPS)、长度已知、没有 chunked / 压缩编码
+    返回: (socket, http.client 的读缓冲区)；不满足条件时返回 None，按普通方式写入
+    HTTPS 连接的解密在 OpenSSL 中进行 (Python 的 ssl 模块无法交给内核 kTLS)，数据必然经过用户态
+    """
+    if response.headers.get("Content-Encoding") or not response.headers.get("Content-Length"):
+        return None
+    raw = response.raw
+    # urllib3 的 HTTPResponse -> http.client.HTTPResponse (_fp) / 连接 (connection.sock)
+    http_response = getattr(raw, "_fp", None)
+    sock = getattr(getattr(raw, "connection", None), "sock", None)
+    if http_response is None or getattr(http_response, "chunked", True) or getattr(http_response, "fp", None) is None:
+        return None
+    if not isinstance(sock, socket.socket) or isinstance(sock, ssl.SSLSocket):
+        return None
+    return sock, http_response.fp
+
+def _wait_readable(sock, timeout):
+    """等待 socket 可读 (连接设置了读超时时 socket 为非阻塞模式)；超时抛出 ReadTimeout，按卡顿重连处理"""
+    poller = select.poll()
+    poller.register(sock.fileno(), select.POLLIN)
+    if not poller.poll(None if timeout is None else timeout * 1000):
+        raise requests.exceptions.ReadTimeout(f"Read timed out. ({timeout} 秒内没有收到数据)")
+
+def _hash_range(hasher, fd, offset, n):
+    """对刚写入文件的 [offset, offset+n) 计算哈希: 映射页缓存直接读取，不再复制到用户态缓冲区"""
+    start = offset - offset % mmap.ALLOCATIONGRANULARITY
+    with mmap.mmap(fd, offset + n - start, offset=start, access=mmap.ACCESS_READ) as m:
+        with memoryview(m) as view:
+            hasher.update(view[offset - start:])
+
+def _splice_to_file(response, source, file_path, chunk_size, resume_from, monitor, progress=None):
+    """
+    stream_to_file 的零拷贝版本: 数据经管道从 socket 直接移动到文件 (os.splice)，不再经过 Python 的 bytes 对象
+    内核中的哈希 (AF_ALG) 在容器中通常不可用，SHA-256 仍在用户态计算: 每块写入后从页缓存读回一次 (一次复制)，
+    省去的是 socket -> bytes、bytes -> 文件两次复制以及 urllib3 / requests 的逐块处理
+    """
+    sock, buffered = source
+    expected = int(response.headers["Content-Length"])
+    hasher = _resume_hasher(file_path, resume_from, chunk_size)
+    limiter = download_limiter.get()
+    timeout = sock.gettimeout()
+    written = 0
+    if progress is not None:
+        progress.reset(resume_from)
+
+    fd = os.open(file_path, os.O_RDWR | os.O_CREAT | (0 if resume_from else os.O_TRUNC), 0o666)
+    pipe_r, pipe_w = os.pipe()
+    try:
+        if _F_SETPIPE_SZ is not None:
+            try:
+                # 管道默认容量 64KB，调大后每次 splice 可以搬运更多数据 (超过 pipe-max-size 时保持默认)
+                fcntl.fcntl(pipe_w, _F_SETPIPE_SZ, chunk_size)
+            except OSError:
+                pass
+        # http.client 解析响应头时可能已经把一部分正文读进了缓冲区，这部分按普通方式写入
+        try:
+            head = buffered.peek()[:expected]
+        except (socket.timeout, TimeoutError) as e:
+            raise requests.exceptions.ReadTimeout(f"Read timed out. {e}")
+        if head:
+            buffered.read(len(head))
+            os.pwrite(fd, head, resume_from)
+            hasher.update(head)
+            written += len(head)
+            if progress is not None:
+                progress.add(len(head))
+            _throttle(len(head), limiter, monitor)
+
+        while written < expected:
+            try:
+                moved = os.splice(sock.fileno(), pipe_w, min(chunk_size, expected - written), flags=os.SPLICE_F_MOVE)
+            except BlockingIOError:
+                _wait_readable(sock, timeout)
+                continue
+            except OSError as e:
+                raise requests.ConnectionError(f"连接中断: {e}")
+            if moved == 0:
+                raise requests.ConnectionError(f"连接提前断开: 已写入 {written} 字节，预期 {expected} 字节")
+            offset = resume_from + written
+            left = moved
+            while left:
+                left -= os.splice(pipe_r, fd, left, offset_dst=offset + moved - left, flags=os.SPLICE_F_MOVE)
+            _hash_range(hasher, fd, offset, moved)
+            written += moved
+            if progress is not None:
+                progress.add(moved)
+            _check_abort(file_path, resume_from + written, progress)
+            _throttle(moved, limiter, monitor)
+    finally:
+        os.close(pipe_r)
+        os.close(pipe_w)
+        os.close(fd)
+    # 连接上的数据已绕过 http.client 读取，关闭响应时连接不会放回连接池
+    return resume_from + written, hasher.hexdigest()
+
+async def async_stream_to_file(response, file_path, chunk_size=CHUNK_SIZE, resume_from=0, monitor=None, progress=None):
+    """
+    stream_to_file 的协程版本 (httpx 流式响应)
+    网络读取在事件循环中进行，写盘和计算哈希放到线程池，避免阻塞事件循环
+    :return: (文件总字节数, sha256 十六进制字符串)
+    """
+    hasher = await asyncio.to_thread(_resume_hasher, file_path, resume_from, chunk_size)
+    written = 0
+    if progress is not None:
+        progress.reset(resume_from)
+
+    def _write(f, chunk):
+        f.write(chunk)
+        hasher.update(chunk)
+
+    limiter = download_limiter.get()
+    f = await asyncio.to_thread(open, file_path, 'ab' if resume_from else 'wb')
+    try:
+        async for chunk in response.aiter_bytes(chunk_size):
+            if not chunk:
+                continue
+            await asyncio.to_thread(_write, f, chunk)
+            written += len(chunk)
+            if progress is not None:
+                progress.add(len(chunk))
+            _check_abort(file_path, resume_from + written, progress)
+            throttle_started = time.monotonic()
+            await bandwidth_governor.async_consume(len(chunk))
+            if limiter is not None:
+                await limiter.async_consume(len(chunk))
+            if monitor is not None:
+                monitor.update(len(chunk), time.monotonic() - throttle_started)
+    finally:
+        await asyncio.to_thread(f.close)
+
+    _check_length(response, written)
+    return resume_from + written, hasher.hexdigest()
+
+def _check_length(response, written):
+    expected = response.headers.get("Content-Length")
+    # 注意: 若服务端使用 gzip 等编码，Content-Length 为压缩后大小，此时不做校验
+    # 断点续传的 206 响应中 Content-Length 为本次传输的字节数，与 written 对应
+    if expected and not response.headers.get("Content-Encoding") and int(expected) != written:
+        raise DownloadError(f"文件不完整: 已写入 {written} 字节，预期 {expected} 字节")
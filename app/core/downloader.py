@@ -1,11 +1,30 @@
 import os
+import time
+import json
+import errno
+import calendar
+import asyncio
 import requests
-import lark_oapi as lark
+from urllib.parse import urlsplit, parse_qsl
 from app.utils.logger import logger
 from app.utils.config import load_config
-from app.utils.feishu_client import get_tenant_access_token # 添加这个引用
+from app.utils.feishu_client import get_tenant_access_token, api_request, open_api_url # 添加这个引用
 from app.data.token_store import token_store
 from app.core.nas_manager import NasManager
+from app.data.archive_queue import archive_queue
+from app.data.archive_index import archive_index
+from app.data.recording_catalog import recording_catalog
+from app.core.download_sink import stream_to_file, async_stream_to_file, StallMonitor
+from app.core.async_engine import async_engine, httpx
+from app.core.download_scheduler import download_scheduler
+from app.core.staging import staging_area, RESUME_SUFFIX
+from app.core import mp4
+from app.core.job_registry import job_registry, PHASE_DOWNLOADING, PHASE_FINALIZING
+from app.utils.exceptions import JobInterrupted, JobCancelled, DownloadStalled, MediaCorrupted
+from app.utils.metrics import (DOWNLOAD_BYTES, DOWNLOAD_DURATION, DOWNLOAD_THROUGHPUT, ACTIVE_DOWNLOADS,
+                               SHUTDOWN_CHECKPOINTS, DOWNLOAD_STALLS, MEDIA_CHECKS)
+from app.utils.tracing import tracer
+from app.utils.ttl_cache import TTLCache
 from app.core.notification import send_auth_failed_notification, send_success_notification
 from app.core.meeting_service import (
     get_meeting_detail, 
@@ -15,20 +34,73 @@ from app.core.meeting_service import (
 )
 # from app.utils.user_cache import UserCache # 移除缓存引用
 
+# 写盘时遇到磁盘已满，重新等待空间后重试的次数
+DISK_FULL_RETRIES = 3
+# 媒体下载建立连接的超时 (秒)；读超时由 DOWNLOAD_READ_TIMEOUT 配置
+MEDIA_CONNECT_TIMEOUT = 10
+# 卡顿重连前的等待时间上限 (秒，按 1 / 2 / 4 ... 递增)
+RECONNECT_BACKOFF_MAX = 30
+
+# 可以从断点重新连接的下载错误: 速度过低 / 读超时 / 连接断开
+_STREAM_ERRORS = (DownloadStalled, requests.ConnectionError, requests.Timeout,
+                  requests.exceptions.ChunkedEncodingError)
+_ASYNC_STREAM_ERRORS = (DownloadStalled, httpx.TransportError) if httpx is not None else (DownloadStalled,)
+
+# 妙记下载链接缓存 (按 object_token)：Token 刷新后重新获取、断点续传、重复任务时复用
+media_url_cache = TTLCache("media_url")
+# 签名链接在过期前多久不再使用 (秒)，留出下载建立连接的时间
+MEDIA_URL_EXPIRY_MARGIN = 60
+
+def _signed_url_expiry(url):
+    """
+    从签名链接的参数中解析过期时间 (Unix 秒)，解析不到返回 None
+    支持 Expires / x-expires (过期时间戳) 和 X-Amz-Date + X-Amz-Expires (签名时间 + 有效秒数)
+    """
+    params = {k.lower(): v for k, v in parse_qsl(urlsplit(url).query)}
+    for name in ("expires", "x-expires", "x-oss-expires"):
+        if params.get(name, "").isdigit():
+            return int(params[name])
+    amz_date, amz_expires = params.get("x-amz-date"), params.get("x-amz-expires", "")
+    if amz_date and amz_expires.isdigit():
+        try:
+            signed_at = calendar.timegm(time.strptime(amz_date, "%Y%m%dT%H%M%SZ"))
+        except ValueError:
+            return None
+        return signed_at + int(amz_expires)
+    return None
+
+def _media_url_ttl(file_url):
+    """下载链接缓存 API_CACHE_TTL 秒，且不超过链接的签名有效期；"RenewToken" / 获取失败不缓存"""
+    if not file_url or not file_url.startswith("http"):
+        return 0
+    ttl = load_config()["api_cache_ttl"]
+    expires_at = _signed_url_expiry(file_url)
+    if expires_at is not None:
+        ttl = min(ttl, expires_at - time.time() - MEDIA_URL_EXPIRY_MARGIN)
+    return ttl
+
 def _get_download_url(object_token, access_token):
+    """
+    获取妙记媒体下载链接 (优先使用缓存，同一录制的并发请求只调用一次接口)
+    返回: url 字符串, 或者 "RenewToken", 或者 None
+    """
+    return media_url_cache.get_or_load(
+        object_token, lambda: _fetch_download_url(object_token, access_token), _media_url_ttl)
+
+def _fetch_download_url(object_token, access_token):
     """
     使用妙计媒体 API 直接获取下载链接
     API: GET /open-apis/minutes/v1/minutes/:minute_token/media
     接口权限: minutes:minutes.media:export (下载妙记的音视频文件)
     返回: url 字符串, 或者 "RenewToken", 或者 None
     """
-    url = f"https://open.feishu.cn/open-apis/minutes/v1/minutes/{object_token}/media"
+    url = open_api_url(f"minutes/v1/minutes/{object_token}/media")
     headers = {
         "Authorization": f"Bearer {access_token}"
     }
     
     try:
-        resp = requests.get(url, headers=headers)
+        resp = api_request("GET", "minutes.media", url, headers=headers)
         
         # 处理 Token 过期的情况
         if resp.status_code == 401:
@@ -64,24 +136,62 @@ def _get_download_url(object_token, access_token):
     
     return None
 
-def download_single_video(object_token, user_id, user_access_token=None, meeting_id=None):
+def _display_path(file_path):
+    """卡片上展示的目录: NAS 内的文件显示为 NAS/目录名，否则显示下载目录"""
+    nas_root = os.path.abspath(NasManager.NAS_ROOT)
+    abs_path = os.path.abspath(file_path)
+    if abs_path.startswith(nas_root + os.sep):
+        return "NAS/" + os.path.dirname(os.path.relpath(abs_path, nas_root))
+    return None
+
+def _find_archived_copy(sha256):
+    """按内容哈希查找已归档的副本，返回第一个仍存在的路径或 None"""
+    paths = archive_index.get_paths(sha256)
+    return paths[0] if paths else None
+
+def _record_catalog(object_token, meeting_id, user_id, user_name, topic, start_time, duration,
+                    size, personal_path, team_paths, sha256):
+    """登记到归档目录 (失败不影响下载主流程)"""
+    try:
+        recording_catalog.upsert(
+            object_token, meeting_id=meeting_id, owner_id=user_id, owner_name=user_name, topic=topic,
+            start_time=start_time, duration=duration, size=size, personal_path=personal_path,
+            team_paths=team_paths, sha256=sha256)
+    except Exception as e:
+        logger.error(f"[归档目录登记失败] {e}")
+
+def prepare_download(object_token, user_id, user_access_token=None, meeting_id=None):
     """
-    下载单个视频
+    下载前的准备阶段: 去重检查、获取文件名元数据、获取媒体下载链接
+    返回: 下载任务 dict (包含 file_url / file_path 等)，无需下载或无法下载时返回 None
     """
     config = load_config()
     
     # 如果没有传 Token（比如还没登录），就无法下载私有视频
     if not user_access_token:
         logger.error(f"[错误] 缺少 User Token，无法下载用户 {user_id} 的视频")
-        return
+        return None
 
     # 创建 API Client (用于刷新 Token - 虽然我们现在不用 SDK client 刷新了，但保留 config 逻辑)
     # 真正刷新用的是 http request
 
     logger.info(f"[处理中] 妙计Token: {object_token} | Owner: {user_id}")
+
+    # --- 0. 下载前去重: 该 object_token 已归档过且文件仍在，则不再下载 ---
+    known_hash = archive_index.get_hash_by_token(object_token)
+    if known_hash:
+        existing_path = _find_archived_copy(known_hash)
+        if existing_path:
+            logger.info(f"[跳过下载] 妙计 {object_token} 已归档: {existing_path}")
+            tracer.annotate(result="already_archived")
+            send_success_notification(user_id, os.path.basename(existing_path), nas_path=_display_path(existing_path))
+            return None
     
     # --- 1. 获取文件名所需的元数据 (用户+会议名+时间) ---
     file_name_prefix = object_token # 默认用 token
+    user_name = user_id # 默认用 user_id (归档匹配时使用)
+    topic, start_time_ts, duration = None, None, None # 归档目录 (Catalog) 登记用
+    tracer.begin("fetch_metadata")
     try:
         if meeting_id:
             meeting_info = get_meeting_detail(meeting_id, user_access_token)
@@ -97,9 +207,11 @@ def download_single_video(object_token, user_id, user_access_token=None, meeting
                 m_data = meeting_info.get("data", {}).get("meeting", {})
                 topic = m_data.get("topic", "未命名会议")
                 start_time_ts = int(m_data.get("start_time", 0))
+                end_time_ts = int(m_data.get("end_time", 0) or 0)
+                if end_time_ts > start_time_ts:
+                    duration = end_time_ts - start_time_ts
                 
                 # 转换时间戳
-                import time
                 time_str = time.strftime("%Y%m%d_%H%M", time.localtime(start_time_ts))
                 
                 # 组合文件名: 用户名_会议名_时间
@@ -111,31 +223,35 @@ def download_single_video(object_token, user_id, user_access_token=None, meeting
         logger.warning(f"[文件名构建失败] 使用默认Token命名. Err: {e}")
     # -----------------------------------------------------
 
+    tracer.end("fetch_metadata")
+
     # 使用妙计媒体 API 获取下载链接（直接用Token，不查会议ID）
-    file_url = _get_download_url(object_token, user_access_token)
-    
-    # 如果Token过期，尝试刷新
-    if file_url == "RenewToken":
-        logger.info("[Token过期] 尝试刷新 Token...")
-        saved_data = token_store.get_user_token(user_id)
-        if saved_data and saved_data.get("refresh_token"):
-            new_at, new_rt = refresh_user_token_for_user(user_id, saved_data["refresh_token"])
-            if new_at:
-                user_access_token = new_at
-                file_url = _get_download_url(object_token, user_access_token)
+    # 早退 (Token 刷新失败) 时 span 也会结束
+    with tracer.span("fetch_media_url"):
+        file_url = _get_download_url(object_token, user_access_token)
+
+        # 如果Token过期，尝试刷新
+        if file_url == "RenewToken":
+            logger.info("[Token过期] 尝试刷新 Token...")
+            saved_data = token_store.get_user_token(user_id)
+            if saved_data and saved_data.get("refresh_token"):
+                new_at, new_rt = refresh_user_token_for_user(user_id, saved_data["refresh_token"])
+                if new_at:
+                    user_access_token = new_at
+                    file_url = _get_download_url(object_token, user_access_token)
+                else:
+                    logger.error("[放弃] Token 刷新失败，无法下载。")
+                    send_auth_failed_notification(user_id, meeting_id)
+                    return None
             else:
-                logger.error("[放弃] Token 刷新失败，无法下载。")
+                logger.error("[放弃] 找不到 Refresh Token，无法下载。")
                 send_auth_failed_notification(user_id, meeting_id)
-                return
-        else:
-            logger.error("[放弃] 找不到 Refresh Token，无法下载。")
-            send_auth_failed_notification(user_id, meeting_id)
-            return
-    
+                return None
+
     logger.debug(f"[调试] 获取到下载链接: {file_url}")
     if not file_url:
         logger.error(">>> 无法获取下载链接，跳过。")
-        return
+        return None
 
     # 下载文件
     download_dir = config.get("download_path", "./downloads")
@@ -146,76 +262,481 @@ def download_single_video(object_token, user_id, user_access_token=None, meeting
     final_file_name = f"{file_name_prefix}.mp4"
     file_path = os.path.join(download_dir, final_file_name)
 
-    # 去重检查: 如果文件已存在 (且大小 > 0)，则视为下载成功，不做重复下载
+    # 去重检查: 同名文件已存在且在内容索引中登记过 (即完整下载过)，不做重复下载
+    # 未登记的同名文件可能是不完整的残留，重新下载覆盖
     if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-        logger.info(f"[跳过下载] 文件已存在: {file_path}")
-        send_success_notification(user_id, final_file_name)
+        if archive_index.has_path(file_path):
+            logger.info(f"[跳过下载] 文件已存在: {file_path}")
+            tracer.annotate(result="file_exists")
+            send_success_notification(user_id, final_file_name)
+            return None
+        logger.warning(f"[重新下载] 同名文件未经校验登记，可能不完整: {file_path}")
+
+    # 文件大小用于磁盘空间预留 (以及 DOWNLOAD_SJF 调度)
+    expected_size = _probe_media_size(file_url)
+
+    job = {
+        "object_token": object_token,
+        "user_id": user_id,
+        "user_name": user_name,
+        "user_access_token": user_access_token,
+        "meeting_id": meeting_id,
+        "topic": topic,
+        "start_time": start_time_ts,
+        "duration": duration,
+        "file_url": file_url,
+        "expected_size": expected_size,
+        "file_name": final_file_name,
+        "file_path": file_path,
+        # 使用临时文件下载，防止中断导致残留不完整文件
+        "temp_path": file_path + ".downloading",
+    }
+    # 上次进程退出时保留的部分下载 (断点续传)
+    job["resume_from"] = _load_resume_point(job)
+    # 任务登记表中的状态 (管理接口查看进度 / 取消)
+    job["tracked"] = job_registry.track_download(meeting_id, user_id, object_token, file_path, expected_size)
+    return job
+
+def _load_resume_point(job):
+    """
+    读取临时文件旁的断点记录 (.resume)，返回可以续传的起始字节数
+    录制不同 (object_token 不一致)、文件大小变化或临时文件异常时删除残留，从头下载
+    """
+    resume_path = job["temp_path"] + RESUME_SUFFIX
+    if not os.path.exists(resume_path):
+        return 0
+    try:
+        with open(resume_path, "r", encoding="utf-8") as f:
+            point = json.load(f)
+        written = os.path.getsize(job["temp_path"])
+    except (OSError, ValueError) as e:
+        logger.warning(f"[断点续传] 断点记录无效，重新下载: {e}")
+        point, written = {}, 0
+    expected_size = job["expected_size"]
+    if (point.get("object_token") == job["object_token"] and point.get("expected_size") == expected_size
+            and 0 < written and (expected_size is None or written < expected_size)):
+        logger.info(f"[断点续传] 从第 {written} 字节继续下载: {job['file_path']}")
+        return written
+    _remove_resume_point(job, with_temp=True)
+    return 0
+
+def _save_resume_point(job):
+    """进程退出导致下载中断: 保留临时文件并记录断点，重启后 (或其他副本) 从断点继续下载"""
+    try:
+        if os.path.getsize(job["temp_path"]) <= 0:
+            return
+    except OSError:
         return
+    point = {"object_token": job["object_token"], "expected_size": job["expected_size"], "saved_at": time.time()}
+    try:
+        with open(job["temp_path"] + RESUME_SUFFIX, "w", encoding="utf-8") as f:
+            json.dump(point, f)
+        SHUTDOWN_CHECKPOINTS.inc("download")
+        logger.info(f"[断点续传] 已保存下载断点: {job['temp_path']}")
+    except OSError as e:
+        logger.error(f"[断点续传] 保存断点失败: {e}")
+
+def _remove_resume_point(job, with_temp=False):
+    paths = [job["temp_path"] + RESUME_SUFFIX]
+    if with_temp:
+        paths.append(job["temp_path"])
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _range_headers(job):
+    return {"Range": f"bytes={job['resume_from']}-"} if job["resume_from"] else None
+
+def _accepted_resume(job, status_code, headers):
+    """
+    检查服务端是否按 Range 返回了断点之后的数据 (206 且起始位置一致)
+    返回: 续传起始字节数；服务端返回完整文件 (200) 时为 0，从头写入
+    """
+    offset = job["resume_from"]
+    if not offset:
+        return 0
+    if status_code == 206 and headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+        return offset
+    logger.warning(f"[断点续传] 服务端未按断点返回数据 (HTTP {status_code})，从头下载: {job['file_path']}")
+    job["resume_from"] = 0
+    return 0
 
-    logger.info(f"正在下载文件到: {file_path}")
+def _probe_media_size(file_url):
+    """
+    用 Range: bytes=0-0 请求探测媒体文件大小 (供磁盘空间预留和 DOWNLOAD_SJF 调度使用)
+    预签名的下载链接通常不支持 HEAD，这里只读取 1 个字节；探测失败返回 None
+    """
     try:
-        # 使用临时文件下载，防止中断导致残留不完整文件
-        temp_file_path = file_path + ".downloading"
-        with requests.get(file_url, stream=True) as r:
-            r.raise_for_status()
-            with open(temp_file_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-        
-        # 下载完成后重命名
-        os.rename(temp_file_path, file_path)
-        logger.info(f"下载完成: {file_path}")
-
-        # --- 1. NAS 个人归档 (Move) ---
-        # 优先执行个人归档，因为 Move 会改变文件路径
-        display_path = None
-        current_file_path = file_path # 追踪当前文件的实际位置
+        with requests.get(file_url, headers={"Range": "bytes=0-0"}, stream=True, timeout=10) as r:
+            content_range = r.headers.get("Content-Range", "")
+            if r.status_code == 206 and "/" in content_range:
+                total = content_range.rsplit("/", 1)[1]
+                return int(total) if total.isdigit() else None
+            if r.status_code == 200 and r.headers.get("Content-Length", "").isdigit():
+                return int(r.headers["Content-Length"])
+    except Exception as e:
+        logger.debug(f"[调度] 探测文件大小失败: {e}")
+    return None
+
+def _stall_monitor(config):
+    return StallMonitor(config["download_stall_rate"], config["download_stall_window"])
+
+def _stall_reason(error):
+    if isinstance(error, DownloadStalled):
+        return "slow"
+    if isinstance(error, requests.Timeout) or (httpx is not None and isinstance(error, httpx.TimeoutException)) \
+            or "timed out" in str(error):
+        return "timeout"
+    return "disconnect"
+
+def _prepare_reconnect(job, error, attempt, config):
+    """
+    下载连接卡顿 / 中断: 记录指标，重连次数未用完时把续传位置设为已写入的字节数
+    返回: 是否重新连接 (调用方随后调用 _renew_media_url 并等待 _reconnect_backoff 秒)
+    """
+    reason = _stall_reason(error)
+    DOWNLOAD_STALLS.inc(reason)
+    if attempt >= config["download_stall_retries"]:
+        logger.error(f"[下载卡顿] {reason}: {error}，已重连 {attempt} 次，放弃: {job['file_path']}")
+        return False
+    try:
+        written = os.path.getsize(job["temp_path"])
+    except OSError:
+        written = 0
+    job["resume_from"] = written
+    tracer.annotate(reconnects=attempt + 1)
+    logger.warning(f"[下载卡顿] {reason}: {error}，从第 {written} 字节重新连接 (第 {attempt + 1} 次): {job['file_path']}")
+    return True
+
+def _reconnect_backoff(attempt):
+    return min(2 ** attempt, RECONNECT_BACKOFF_MAX)
+
+def _renew_media_url(job):
+    """重新获取下载链接 (原链接所在的 CDN 节点可能有问题，签名也可能快过期)；获取失败时沿用原链接"""
+    media_url_cache.invalidate(job["object_token"])
+    user_data = token_store.get_user_token(job["user_id"]) or {}
+    file_url = _get_download_url(job["object_token"], user_data.get("user_access_token") or job["user_access_token"])
+    if file_url and file_url.startswith("http"):
+        job["file_url"] = file_url
+
+def fetch_media(job):
+    """
+    下载阶段 (同步版本): 把媒体文件流式写入 job["temp_path"]
+    连接卡顿 (速度过低 / 读超时) 或中断时，换新的下载链接从已写入的位置续传，最多重连 DOWNLOAD_STALL_RETRIES 次
+    返回: (文件大小, sha256)
+    """
+    config = load_config()
+    attempt = 0
+    while True:
+        try:
+            with requests.get(job["file_url"], headers=_range_headers(job), stream=True,
+                              timeout=(MEDIA_CONNECT_TIMEOUT, config["download_read_timeout"])) as r:
+                r.raise_for_status()
+                # 边下载边计算 SHA-256，不需要额外读一遍文件
+                return stream_to_file(r, job["temp_path"], resume_from=_accepted_resume(job, r.status_code, r.headers),
+                                      monitor=_stall_monitor(config), zero_copy=config["download_zero_copy"],
+                                      progress=job["tracked"].progress)
+        except _STREAM_ERRORS as e:
+            if not _prepare_reconnect(job, e, attempt, config):
+                raise
+        _renew_media_url(job)
+        time.sleep(_reconnect_backoff(attempt))
+        attempt += 1
+
+async def async_fetch_media(job):
+    """fetch_media 的协程版本 (httpx 流式下载)"""
+    config = load_config()
+    timeout = httpx.Timeout(MEDIA_CONNECT_TIMEOUT, read=config["download_read_timeout"])
+    attempt = 0
+    while True:
+        try:
+            async with async_engine.client().stream("GET", job["file_url"], headers=_range_headers(job),
+                                                    timeout=timeout) as r:
+                r.raise_for_status()
+                resume_from = _accepted_resume(job, r.status_code, r.headers)
+                return await async_stream_to_file(r, job["temp_path"], resume_from=resume_from,
+                                                  monitor=_stall_monitor(config), progress=job["tracked"].progress)
+        except _ASYNC_STREAM_ERRORS as e:
+            if not _prepare_reconnect(job, e, attempt, config):
+                raise
+        await asyncio.to_thread(_renew_media_url, job)
+        await asyncio.sleep(_reconnect_backoff(attempt))
+        attempt += 1
+
+def record_download_metrics(started, file_size=None):
+    """记录下载耗时 / 速度指标 (file_size 为 None 表示下载失败)"""
+    elapsed = time.perf_counter() - started
+    if file_size is None:
+        DOWNLOAD_DURATION.observe("failure", value=elapsed)
+        return
+    tracer.end("download", bytes=file_size)
+    DOWNLOAD_BYTES.inc(amount=file_size)
+    DOWNLOAD_DURATION.observe("success", value=elapsed)
+    if elapsed > 0:
+        DOWNLOAD_THROUGHPUT.observe(value=file_size / elapsed)
+
+def inspect_media(job, file_size):
+    """
+    下载完成后、重命名之前的文件检查: 总字节数与探测到的文件大小一致 (断点续传 / 重连后仍然完整)，
+    MP4 结构完整 (MP4_VERIFY)；MP4_FASTSTART=1 时把文件末尾的 moov 移到开头，NAS 上的播放器可以边下边播
+    sha256 仍为下载内容的哈希 (只用于去重，faststart 对同一录制的改写结果是确定的)
+    :raises MediaCorrupted: 文件不完整，按下载失败处理
+    """
+    config = load_config()
+    if job["expected_size"] is not None and file_size != job["expected_size"]:
+        MEDIA_CHECKS.inc("invalid")
+        raise MediaCorrupted(f"文件大小 {file_size} 字节与探测到的 {job['expected_size']} 字节不一致")
+    if not config["mp4_verify"] and not config["mp4_faststart"]:
+        return
+    try:
+        with tracer.span("verify"):
+            info = mp4.inspect(job["temp_path"])
+    except MediaCorrupted:
+        MEDIA_CHECKS.inc("invalid")
+        raise
+    MEDIA_CHECKS.inc("valid")
+    if config["mp4_faststart"] and not info["faststart"]:
+        with tracer.span("faststart"):
+            moved = mp4.faststart(job["temp_path"])
+        MEDIA_CHECKS.inc("faststart" if moved else "faststart_skipped")
+        if moved:
+            logger.info(f"[faststart] 已将索引 (moov) 移到文件开头: {job['file_path']}")
+        else:
+            logger.warning(f"[faststart] 无法改写，保持原文件: {job['file_path']}")
+
+def finalize_download(job, file_size, sha256):
+    """
+    下载完成后的归档阶段: 内容去重、重命名、NAS 个人/团队归档、登记索引与目录、发送通知
+    """
+    config = load_config()
+    object_token = job["object_token"]
+    user_id = job["user_id"]
+    user_name = job["user_name"]
+    meeting_id = job["meeting_id"]
+    file_path = job["file_path"]
+    final_file_name = job["file_name"]
+
+    # --- 下载后去重: 内容完全相同的录制已归档过 (例如同一录制以不同文件名重复下载) ---
+    # 仍按正常流程归档到本 Owner 的个人 / 团队目录 (已归档的副本可能在其他用户目录中)，只是以硬链接代替移动 / 复制
+    duplicate_path = _find_archived_copy(sha256)
+    if duplicate_path:
+        logger.info(f"[内容去重] 与已归档文件内容相同，归档时硬链接到: {duplicate_path}")
+
+    # 下载完成后重命名
+    os.rename(job["temp_path"], file_path)
+    _remove_resume_point(job)
+    logger.info(f"下载完成: {file_path} ({file_size} 字节, sha256: {sha256[:12]})")
+
+    # --- 1. NAS 个人归档 (Move) ---
+    # 优先执行个人归档，因为 Move 会改变文件路径
+    display_path = None
+    current_file_path = file_path # 追踪当前文件的实际位置
+    
+    with tracer.span("nas_move"):
+        is_archived, archived_path, nas_folder = NasManager.archive_file(file_path, user_name, user_id,
+                                                                         link_source=duplicate_path)
+    if is_archived:
+        display_path = f"NAS/{nas_folder}"  # 卡片上显示: NAS/zhangsan
+        current_file_path = archived_path # 更新路径，后续操作使用归档后的文件
+        logger.info(f"[流程] 文件已归档至个人目录: {current_file_path}")
+    else:
+         logger.info(f"[流程] 个人归档未成功，继续使用下载目录文件: {current_file_path}")
+         # 登记到归档重试队列，由后台线程在映射表更新 / NAS 恢复后补归档
+         archive_queue.add(file_path, user_id, user_name, meeting_id,
+                           reason="未找到NAS目录或移动失败",
+                           retry_after=config["archive_retry_interval"])
+
+    # --- 2. NAS 团队归档 (Copy) ---
+    # 现在从 current_file_path 复制到团队目录
+    team_file_paths = []
+    target_team_folders = set()
+    tracer.begin("team_copy")
+    try:
+        tenant_token = get_tenant_access_token() # 获取 Tenant Token 用于调用通讯录API
         
-        is_archived, archived_path, nas_folder = NasManager.archive_file(file_path, user_name, user_id)
-        if is_archived:
-            display_path = f"NAS/{nas_folder}"  # 卡片上显示: NAS/zhangsan
-            current_file_path = archived_path # 更新路径，后续操作使用归档后的文件
-            logger.info(f"[流程] 文件已归档至个人目录: {current_file_path}")
+        if tenant_token:
+            # A. 归属到 Owner 的部门 (使用 API 实时查询)
+            logger.info("[API查询] 正在查询 Owner 部门...")
+            owner_depts = get_user_departments_from_api(user_id, tenant_token)
+            if owner_depts:
+                logger.info(f"[API查询] Owner {user_name} 所属部门: {owner_depts}")
+                target_team_folders.update(owner_depts)
         else:
-             logger.info(f"[流程] 个人归档未成功，继续使用下载目录文件: {current_file_path}")
+            logger.error("[团队归档] 无法获取 Tenant Token，跳过部门查询")
 
-        # --- 2. NAS 团队归档 (Copy) ---
-        # 现在从 current_file_path 复制到团队目录
-        try:
-            target_team_folders = set()
-            tenant_token = get_tenant_access_token() # 获取 Tenant Token 用于调用通讯录API
-            
-            if tenant_token:
-                # A. 归属到 Owner 的部门 (使用 API 实时查询)
-                logger.info("[API查询] 正在查询 Owner 部门...")
-                owner_depts = get_user_departments_from_api(user_id, tenant_token)
-                if owner_depts:
-                    logger.info(f"[API查询] Owner {user_name} 所属部门: {owner_depts}")
-                    target_team_folders.update(owner_depts)
+        # 执行复制
+        if target_team_folders:
+            if os.path.exists(current_file_path):
+                team_file_paths = NasManager.save_to_team_folder(current_file_path, list(target_team_folders),
+                                                                 link_source=duplicate_path)
             else:
-                logger.error("[团队归档] 无法获取 Tenant Token，跳过部门查询")
+                 logger.error(f"[团队归档失败] 源文件不存在: {current_file_path}")
+        else:
+            logger.info("[团队归档] 未匹配到任何团队文件夹，跳过")
+            
+    except Exception as e:
+        logger.error(f"[团队归档异常] {e}")
+    tracer.end("team_copy", teams=len(team_file_paths or []))
 
-            # 执行复制
-            if target_team_folders:
-                if os.path.exists(current_file_path):
-                    NasManager.save_to_team_folder(current_file_path, list(target_team_folders))
-                else:
-                     logger.error(f"[团队归档失败] 源文件不存在: {current_file_path}")
-            else:
-                logger.info("[团队归档] 未匹配到任何团队文件夹，跳过")
-                
-        except Exception as e:
-            logger.error(f"[团队归档异常] {e}")
+    # --- 3. 登记内容索引 (供后续按 object_token / 内容哈希去重) ---
+    try:
+        archive_index.record(sha256, [current_file_path] + list(team_file_paths or []),
+                             size=file_size, object_token=object_token)
+    except Exception as e:
+        logger.error(f"[内容索引登记失败] {e}")
+    _record_catalog(object_token, meeting_id, user_id, user_name, job["topic"], job["start_time"], job["duration"],
+                    file_size, current_file_path, team_file_paths, sha256)
 
-        
-        # 发送通知
-        # 将 set 转为 list 传递给通知
-        team_paths_list = list(target_team_folders) if 'target_team_folders' in locals() and target_team_folders else None
-        send_success_notification(user_id, final_file_name, nas_path=display_path, team_paths=team_paths_list)
-        
+    # 发送通知
+    # 将 set 转为 list 传递给通知
+    team_paths_list = list(target_team_folders) if target_team_folders else None
+    with tracer.span("notify"):
+        send_success_notification(user_id, final_file_name, nas_path=display_path, team_paths=team_paths_list,
+                                  pending_archive=not is_archived)
+    if not is_archived:
+        result = "pending_archive"
+    else:
+        result = "duplicate_content" if duplicate_path else "archived"
+    tracer.annotate(result=result, size=file_size)
+
+def cleanup_failed_download(job, error):
+    if isinstance(error, JobCancelled):
+        logger.info(f"[任务管理] {error}")
+    else:
+        logger.error(f"下载异常: {error}")
+    job["tracked"].fail(error)
+    # 链接可能已失效 (提前过期 / 403)，重试时重新获取
+    media_url_cache.invalidate(job["object_token"])
+    # 清理可能的临时文件
+    if os.path.exists(job["temp_path"]):
+         try: os.remove(job["temp_path"])
+         except: pass
+    _remove_resume_point(job)
+
+def _is_disk_full(error):
+    return isinstance(error, OSError) and error.errno in (errno.ENOSPC, errno.EDQUOT)
+
+def _start_download(job):
+    """已取得下载名额和磁盘空间，开始下载；排队期间已被管理接口取消时不再下载"""
+    if not job_registry.advance(job["tracked"], PHASE_DOWNLOADING):
+        raise JobCancelled(f"任务已取消: {job['file_path']} (排队中)")
+
+def _start_finalize(job):
+    """下载完成，开始校验归档；取消请求与下载完成同时发生时以取消为准 (之后不再接受取消)"""
+    if not job_registry.advance(job["tracked"], PHASE_FINALIZING):
+        raise JobCancelled(f"任务已取消: {job['file_path']} (下载完成、归档前)")
+
+def _discard_temp(job):
+    job["resume_from"] = 0
+    _remove_resume_point(job, with_temp=True)
+
+def _fetch_with_disk_admission(job):
+    """
+    预留磁盘空间后下载；写盘时磁盘已满 (例如被其他进程占满) 则删除临时文件，重新排队等待空间
+    返回: (文件大小, sha256)
+    """
+    for attempt in range(1, DISK_FULL_RETRIES + 1):
+        tracer.begin("disk_wait")
+        with staging_area.reserve(job["expected_size"], job["temp_path"]):
+            tracer.end("disk_wait")
+            _start_download(job)
+            logger.info(f"正在下载文件到: {job['file_path']}")
+            download_started = time.perf_counter()
+            ACTIVE_DOWNLOADS.inc()
+            tracer.begin("download")
+            try:
+                file_size, sha256 = fetch_media(job)
+            except Exception as e:
+                record_download_metrics(download_started)
+                if not _is_disk_full(e) or attempt == DISK_FULL_RETRIES:
+                    raise
+                logger.warning(f"[磁盘空间] 写入时磁盘已满，重新等待空间 (第 {attempt} 次): {job['file_path']}")
+                _discard_temp(job)
+                continue
+            finally:
+                ACTIVE_DOWNLOADS.dec()
+            record_download_metrics(download_started, file_size)
+            return file_size, sha256
+
+def download_single_video(object_token, user_id, user_access_token=None, meeting_id=None):
+    """
+    下载单个视频 (准备 -> 下载 -> 归档)
+    """
+    job = prepare_download(object_token, user_id, user_access_token, meeting_id)
+    if not job:
+        return
+
+    try:
+        # 排队等待下载名额 (按优先级 / Owner 公平轮转调度)
+        tracer.begin("download_queue")
+        with download_scheduler.slot(user_id, job["expected_size"]):
+            tracer.end("download_queue")
+            file_size, sha256 = _fetch_with_disk_admission(job)
+
+        _start_finalize(job)
+        inspect_media(job, file_size)
+        finalize_download(job, file_size, sha256)
+    except JobInterrupted:
+        # 进程退出: 保留已下载的部分，由调用方保存任务断点
+        _save_resume_point(job)
+        raise
+    except Exception as e:
+        cleanup_failed_download(job, e)
+
+async def async_download_single_video(object_token, user_id, user_access_token=None, meeting_id=None):
+    """
+    download_single_video 的协程版本 (asyncio 执行模式)
+    准备和归档阶段 (元数据查询、NAS 移动 / 复制) 在线程池中执行，
+    媒体下载在事件循环中通过 httpx 流式写入，与线程模式共用下载调度 (DOWNLOAD_CONCURRENCY)
+    """
+    job = await asyncio.to_thread(prepare_download, object_token, user_id, user_access_token, meeting_id)
+    if not job:
+        return
+
+    try:
+        tracer.begin("download_queue")
+        ticket = await download_scheduler.async_acquire(user_id, job["expected_size"])
+        tracer.end("download_queue")
+        try:
+            file_size, sha256 = await _async_fetch_with_disk_admission(job)
+        finally:
+            download_scheduler.release(ticket)
+
+        _start_finalize(job)
+        await asyncio.to_thread(inspect_media, job, file_size)
+        await asyncio.to_thread(finalize_download, job, file_size, sha256)
+    except JobInterrupted:
+        await asyncio.to_thread(_save_resume_point, job)
+        raise
     except Exception as e:
-        logger.error(f"下载异常: {e}")
-        # 清理可能的临时文件
-        if os.path.exists(temp_file_path):
-             try: os.remove(temp_file_path)
-             except: pass
+        cleanup_failed_download(job, e)
+
+async def _async_fetch_with_disk_admission(job):
+    """_fetch_with_disk_admission 的协程版本 (httpx 流式下载)"""
+    for attempt in range(1, DISK_FULL_RETRIES + 1):
+        tracer.begin("disk_wait")
+        reservation = await staging_area.async_reserve(job["expected_size"], job["temp_path"])
+        tracer.end("disk_wait")
+        try:
+            _start_download(job)
+            logger.info(f"正在下载文件到: {job['file_path']}")
+            download_started = time.perf_counter()
+            ACTIVE_DOWNLOADS.inc()
+            tracer.begin("download")
+            try:
+                file_size, sha256 = await async_fetch_media(job)
+            except Exception as e:
+                record_download_metrics(download_started)
+                if not _is_disk_full(e) or attempt == DISK_FULL_RETRIES:
+                    raise
+                logger.warning(f"[磁盘空间] 写入时磁盘已满，重新等待空间 (第 {attempt} 次): {job['file_path']}")
+                await asyncio.to_thread(_discard_temp, job)
+                continue
+            finally:
+                ACTIVE_DOWNLOADS.dec()
+            record_download_metrics(download_started, file_size)
+            return file_size, sha256
+        finally:
+            staging_area.release(reservation)
@@ -0,0 +1,138 @@
+import os
+import time
+import shutil
+import threading
+from app.utils.logger import logger
+from app.utils.config import load_config
+from app.utils.metrics import HEALTH_PROBE_LATENCY
+from app.utils.feishu_client import get_tenant_access_token, tenant_token_expires_in
+from app.data.token_store import token_store
+from app.core.nas_manager import NasManager
+from app.core.staging import staging_area
+from app.core.download_scheduler import download_scheduler
+from app.core.lifecycle import lifecycle
+
+class _Probe:
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.result = None
+        self.checked_at = 0.0
+        # 正在执行的探测: (开始时间, 完成事件)
+        self.running = None
+
+class HealthMonitor:
+    """
+    就绪检查 (/readyz): 探测下载流程依赖的外部资源，任一项失败或变慢时副本退出负载均衡
+    - 结果缓存 HEALTH_CACHE_TTL 秒，探测频率与 /readyz 的调用频率无关，不给依赖增加负担
+    - 各项在独立的后台线程中并行执行，超过 HEALTH_PROBE_TIMEOUT 未返回视为失败；
+      卡住的探测 (例如 NAS 挂载无响应时 stat 会一直阻塞) 返回之前不会再启动新的线程
+    """
+    def __init__(self):
+        self._probes = []
+        self._lock = threading.Lock()
+
+    def register(self, name, func):
+        """:param func: (config) -> (是否正常, 详情 dict)"""
+        self._probes.append(_Probe(name, func))
+
+    def _execute(self, probe, done):
+        config = load_config()
+        started = time.perf_counter()
+        try:
+            ok, detail = probe.func(config)
+        except Exception as e:
+            ok, detail = False, {"error": str(e)}
+        latency = time.perf_counter() - started
+        HEALTH_PROBE_LATENCY.observe(probe.name, value=latency)
+        if not ok:
+            logger.warning(f"[就绪检查] {probe.name} 异常: {detail}")
+        with self._lock:
+            probe.result = dict(detail, ok=ok, latency_ms=round(latency * 1000, 1))
+            probe.checked_at = time.monotonic()
+            probe.running = None
+        done.set()
+
+    def _start(self, probe, now, ttl):
+        """
+        在持有 _lock 时调用: 结果过期且没有正在执行的探测时启动一次
+        返回: 需要等待的 (开始时间, 完成事件)；已经卡住的探测从它开始的时间算超时，不会让每次检查都等满超时
+        """
+        if probe.result is not None and now - probe.checked_at < ttl:
+            return None
+        if probe.running is None:
+            done = threading.Event()
+            probe.running = (now, done)
+            threading.Thread(target=self._execute, args=(probe, done),
+                             name=f"health-{probe.name}", daemon=True).start()
+        return probe.running
+
+    def _snapshot(self, probe, now, ttl, timeout):
+        with self._lock:
+            if probe.result is not None and now - probe.checked_at < ttl:
+                return dict(probe.result, age_s=round(now - probe.checked_at, 1))
+            started = probe.running[0] if probe.running else now
+        return {"ok": False, "error": f"{time.monotonic() - started:.1f} 秒未返回 (超时 {timeout} 秒)"}
+
+    def check(self):
+        """返回: (是否就绪, {检查项: 结果})"""
+        config = load_config()
+        ttl, timeout = config["health_cache_ttl"], config["health_probe_timeout"]
+        now = time.monotonic()
+        with self._lock:
+            waits = [self._start(probe, now, ttl) for probe in self._probes]
+        for running in waits:
+            if running is not None:
+                started, done = running
+                done.wait(max(started + timeout - time.monotonic(), 0))
+
+        now = time.monotonic()
+        checks = {"accepting": {"ok": lifecycle.accepting()}}
+        for probe in self._probes:
+            checks[probe.name] = self._snapshot(probe, now, ttl, timeout)
+        return all(c["ok"] for c in checks.values()), checks
+
+def _latency_ok(seconds, config):
+    return seconds * 1000 <= config["health_slow_ms"]
+
+def _probe_tenant_token(config):
+    """Tenant Token 可用 (有效期内直接使用缓存，不请求飞书)"""
+    token = get_tenant_access_token()
+    return bool(token), {"expires_in": int(tenant_token_expires_in())}
+
+def _probe_token_store(config):
+    started = time.perf_counter()
+    users = len(token_store.list_user_ids())
+    elapsed = time.perf_counter() - started
+    return _latency_ok(elapsed, config), {"users": users, "read_ms": round(elapsed * 1000, 1)}
+
+def _probe_nas(config):
+    started = time.perf_counter()
+    try:
+        os.stat(NasManager.NAS_ROOT)
+    except OSError as e:
+        return False, {"path": NasManager.NAS_ROOT, "error": str(e)}
+    elapsed = time.perf_counter() - started
+    return _latency_ok(elapsed, config), {"path": NasManager.NAS_ROOT, "stat_ms": round(elapsed * 1000, 1)}
+
+def _probe_disk(config):
+    """下载目录的剩余空间 (扣除进行中的下载还要写入的字节) 不低于 DISK_MIN_FREE"""
+    path = config.get("download_path", "./downloads")
+    os.makedirs(path, exist_ok=True)
+    free = shutil.disk_usage(path).free
+    reserved = staging_area.reserved()
+    return free - reserved >= config["disk_min_free"], {"free": free, "reserved": reserved,
+                                                         "min_free": config["disk_min_free"]}
+
+def _probe_scheduler(config):
+    queued = download_scheduler.queued()
+    return queued <= config["health_max_backlog"], {"queued": queued, "running": download_scheduler.running(),
+                                                    "max_backlog": config["health_max_backlog"]}
+
+# 全局单例
+health_monitor = HealthMonitor()
+health_monitor.register("tenant_token", _probe_tenant_token)
+health_monitor.register("token_store", _probe_token_store)
+health_monitor.register("nas", _probe_nas)
+health_monitor.register("disk", _probe_disk)
+health_monitor.register("scheduler", _probe_scheduler)
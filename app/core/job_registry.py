@@ -0,0 +1,225 @@
+import time
+import threading
+from collections import OrderedDict
+from app.utils.tracing import tracer
+
+# 任务阶段 (进行中)
+PHASE_POLLING = "polling"          # 等待录制生成 (轮询中)
+PHASE_QUEUED = "queued"            # 录制已就绪，等待下载名额 / 磁盘空间
+PHASE_DOWNLOADING = "downloading"
+PHASE_FINALIZING = "finalizing"    # 校验、去重、NAS 归档、发送通知
+ACTIVE_PHASES = (PHASE_POLLING, PHASE_QUEUED, PHASE_DOWNLOADING, PHASE_FINALIZING)
+# 结束阶段: 沿用 Trace 的结束状态 (done / no_recording / unauthorized / invalid_url / error / interrupted)，
+# 另有 failed (下载或归档出错)、cancelled (管理接口取消)、pending_archive (已下载，NAS 归档在重试队列中)
+PHASE_FAILED = "failed"
+PHASE_CANCELLED = "cancelled"
+PHASE_PENDING_ARCHIVE = "pending_archive"
+
+# 内存中保留的已结束任务数
+MAX_FINISHED = 500
+# 下载速度的统计窗口 (秒) / 超过多久没有收到数据时速度显示为 0
+RATE_WINDOW = 1.0
+RATE_STALE = 5.0
+
+class DownloadProgress:
+    """
+    下载进度与取消标记
+    只由下载线程 (或事件循环) 写入，管理接口只读，不加锁: 每个数据块只做一次整数加法，速度每秒计算一次
+    """
+    def __init__(self, total=None):
+        self.total = total
+        self.done = 0
+        self.rate = 0.0
+        self.updated_at = time.monotonic()
+        self.cancelled = False
+        self._window_started = self.updated_at
+        self._window_bytes = 0
+
+    def reset(self, done):
+        """开始 (或重连后继续) 写入: 文件中已有 done 字节"""
+        self.done = done
+        self._window_started = time.monotonic()
+        self._window_bytes = done
+
+    def add(self, n):
+        self.done += n
+        now = time.monotonic()
+        self.updated_at = now
+        if now - self._window_started >= RATE_WINDOW:
+            self.rate = (self.done - self._window_bytes) / (now - self._window_started)
+            self._window_started, self._window_bytes = now, self.done
+
+    def to_dict(self):
+        idle = time.monotonic() - self.updated_at
+        rate = self.rate if idle < RATE_STALE else 0.0
+        data = {"bytes_done": self.done, "bytes_total": self.total, "rate": int(rate), "idle_s": round(idle, 1)}
+        if self.total:
+            data["percent"] = round(self.done * 100.0 / self.total, 1)
+            if rate > 0:
+                data["eta_s"] = int(max(self.total - self.done, 0) / rate)
+        return data
+
+class TrackedJob:
+    """一个会议的归档任务 (从轮询录制到归档完成) 的当前状态"""
+    def __init__(self, meeting_id, owner_id):
+        self.meeting_id = meeting_id
+        self.owner_id = owner_id
+        self.phase = PHASE_POLLING
+        self.attempt = 0
+        self.next_poll_at = None
+        self.object_token = None
+        self.file_path = None
+        self.progress = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    def set_phase(self, phase):
+        self.phase = phase
+        self.updated_at = time.time()
+
+    def fail(self, error):
+        """下载 / 归档出错 (任务随后以 failed 结束，取消的任务以 cancelled 结束)"""
+        self.error = str(error)
+        self.updated_at = time.time()
+
+    @property
+    def cancel_requested(self):
+        return self.progress is not None and self.progress.cancelled
+
+    def to_dict(self):
+        now = time.time()
+        data = {
+            "meeting_id": self.meeting_id,
+            "owner_id": self.owner_id,
+            "phase": self.phase,
+            "attempt": self.attempt,
+            "object_token": self.object_token,
+            "file_path": self.file_path,
+            "error": self.error,
+            "created_at": int(self.created_at),
+            "updated_at": int(self.updated_at),
+            "age_s": int(now - self.created_at),
+        }
+        if self.phase == PHASE_POLLING and self.next_poll_at:
+            data["next_poll_in"] = max(int(self.next_poll_at - now), 0)
+        if self.progress is not None:
+            data.update(self.progress.to_dict())
+            data["cancel_requested"] = self.progress.cancelled
+        return data
+
+class JobRegistry:
+    """
+    进程内的任务登记表 (按会议 ID)，供管理接口查看进度、取消任务
+    阶段变化 (每个任务几次) 时加锁；下载进度由 DownloadProgress 无锁更新
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}
+        self._finished = OrderedDict()
+
+    def _entry(self, meeting_id, owner_id):
+        """在持有 _lock 时调用: 进行中的任务，没有则新建 (已结束的任务重新开始时移回进行中)"""
+        entry = self._active.get(meeting_id)
+        if entry is None:
+            self._finished.pop(meeting_id, None)
+            entry = self._active[meeting_id] = TrackedJob(meeting_id, owner_id)
+        return entry
+
+    def polling(self, meeting_id, owner_id, attempt, next_poll_at=None):
+        """第 attempt 次查询录制 (next_poll_at 为排期时间，None 表示正在查询)"""
+        with self._lock:
+            entry = self._entry(meeting_id, owner_id)
+            entry.attempt = attempt
+            entry.next_poll_at = next_poll_at
+            entry.set_phase(PHASE_POLLING)
+
+    def track_download(self, meeting_id, owner_id, object_token, file_path, total):
+        """
+        录制就绪、准备下载；返回任务状态 (其 progress 交给下载写入)
+        没有会议 ID 的下载不登记，返回的对象只用于统计进度
+        """
+        with self._lock:
+            # 与 request_cancel 互斥: 取消请求不会看到尚未替换的旧 progress
+            entry = self._entry(meeting_id, owner_id) if meeting_id else TrackedJob(meeting_id, owner_id)
+            entry.object_token = object_token
+            entry.file_path = file_path
+            entry.error = None
+            entry.progress = DownloadProgress(total)
+            entry.set_phase(PHASE_QUEUED)
+            return entry
+
+    def advance(self, entry, phase):
+        """下载流程切换阶段 (与 request_cancel 互斥)；已请求取消时不切换并返回 False，调用方停止任务"""
+        with self._lock:
+            if entry.cancel_requested:
+                return False
+            entry.set_phase(phase)
+            return True
+
+    def finish(self, meeting_id, status, result=None):
+        """任务结束 (Trace 结束时调用)；下载出错 / 取消时以实际结果为准，不记为 done"""
+        with self._lock:
+            entry = self._active.pop(meeting_id, None)
+            if entry is None:
+                return
+            if entry.cancel_requested:
+                phase = PHASE_CANCELLED
+            elif entry.error and status == "done":
+                phase = PHASE_FAILED
+            elif result == PHASE_PENDING_ARCHIVE:
+                phase = PHASE_PENDING_ARCHIVE
+            else:
+                phase = status
+            entry.next_poll_at = None
+            entry.set_phase(phase)
+            self._finished[meeting_id] = entry
+            while len(self._finished) > MAX_FINISHED:
+                self._finished.popitem(last=False)
+
+    def mark_archived(self, meeting_id):
+        """归档重试成功: 待归档的任务记为完成"""
+        with self._lock:
+            entry = self._finished.get(meeting_id)
+            if entry is not None and entry.phase == PHASE_PENDING_ARCHIVE:
+                entry.set_phase("done")
+
+    def request_cancel(self, meeting_id):
+        """
+        取消排队中 / 下载中的任务: 置位取消标记，下载在写入下一块数据时停止 (排队中的任务在取得下载名额后结束)
+        返回: 任务状态；任务不在这两个阶段时返回 None
+        """
+        with self._lock:
+            entry = self._active.get(meeting_id)
+            if entry is None or entry.phase not in (PHASE_QUEUED, PHASE_DOWNLOADING) or entry.progress is None:
+                return None
+            entry.progress.cancelled = True
+            entry.updated_at = time.time()
+            return entry
+
+    def in_flight(self):
+        """下载中 / 归档中 (faststart 改写、NAS 移动与团队复制) 的任务数，进程退出时等待这些任务结束"""
+        with self._lock:
+            return sum(1 for e in self._active.values() if e.phase in (PHASE_DOWNLOADING, PHASE_FINALIZING))
+
+    def get(self, meeting_id):
+        with self._lock:
+            return self._active.get(meeting_id) or self._finished.get(meeting_id)
+
+    def list(self, phase=None, owner_id=None):
+        """按阶段 / Owner 过滤，进行中的任务在前 (各自按开始时间)"""
+        with self._lock:
+            entries = list(self._active.values()) + list(reversed(self._finished.values()))
+        return [e for e in entries
+                if (phase is None or e.phase == phase) and (owner_id is None or e.owner_id == owner_id)]
+
+    def counts(self):
+        counts = {}
+        with self._lock:
+            for entry in list(self._active.values()) + list(self._finished.values()):
+                counts[entry.phase] = counts.get(entry.phase, 0) + 1
+        return counts
+
+# 全局单例
+job_registry = JobRegistry()
+tracer.add_finish_hook(lambda trace: job_registry.finish(trace.meeting_id, trace.status, trace.attrs.get("result")))
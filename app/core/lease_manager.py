@@ -0,0 +1,185 @@
+import time
+import random
+import threading
+from app.utils.logger import logger
+from app.utils.config import load_config
+from app.utils.metrics import registry, LEASE_EVENTS
+from app.data.lease_store import lease_store
+from app.core.lifecycle import lifecycle
+from app.utils.exceptions import LeaseUnavailable
+
+# 认领时共享库出错 (例如 SQLite 被锁) 的重试次数 / 首次重试前的等待时间 (秒，按 2 倍递增)
+CLAIM_RETRIES = 3
+CLAIM_RETRY_BACKOFF = 0.2
+
+class LeaseManager:
+    """
+    多副本协调: 每个会议 (从轮询录制到下载归档完成) 同一时间只由一个副本处理
+    - claim: 收到事件 / 补录时认领会议，认领失败说明其他副本正在处理或已处理过
+    - 心跳线程定期续期本副本持有的租约，并接管其他副本宕机后遗留的过期租约
+    - suspend: 进程退出时保存未完成任务的断点，由其他副本或重启后的本副本接管恢复
+    """
+    def __init__(self):
+        self._held = set()
+        self._lock = threading.Lock()
+        self._started = False
+        self._stop_event = threading.Event()
+        self._takeover_enabled = True
+
+    @staticmethod
+    def _key(meeting_id):
+        return f"meeting:{meeting_id}"
+
+    def claim(self, meeting_id, owner_id, reclaim_done=False):
+        """
+        认领会议；reclaim_done=True 时允许重新处理已完成的会议 (用户授权后补录)
+        返回: 是否认领成功
+        共享库出错时重试 CLAIM_RETRIES 次，仍失败则抛出 LeaseUnavailable (不放行，否则每个副本都会处理同一会议)，由调用方稍后重试
+        """
+        config = load_config()
+        key = self._key(meeting_id)
+        with self._lock:
+            if key in self._held:
+                # 本副本正在处理 (共享库中的持有者是自己，acquire 会直接放行，这里先拦下)
+                LEASE_EVENTS.inc("rejected")
+                return False
+        for attempt in range(CLAIM_RETRIES + 1):
+            try:
+                ok, prev_owner = lease_store.acquire(
+                    key, config["replica_id"], config["lease_ttl"],
+                    payload={"meeting_id": meeting_id, "owner_id": owner_id}, reclaim_done=reclaim_done)
+                break
+            except Exception as e:
+                if attempt == CLAIM_RETRIES:
+                    LEASE_EVENTS.inc("store_error")
+                    logger.error(f"[租约] 认领会议 {meeting_id} 失败 (已重试 {CLAIM_RETRIES} 次)，本副本不处理: {e}")
+                    raise LeaseUnavailable(f"租约库不可用，无法认领会议 {meeting_id}: {e}") from e
+                logger.warning(f"[租约] 认领会议 {meeting_id} 失败，稍后重试: {e}")
+                time.sleep(CLAIM_RETRY_BACKOFF * 2 ** attempt)
+        if not ok:
+            LEASE_EVENTS.inc("rejected")
+            logger.info(f"[租约] 会议 {meeting_id} 已由副本 {prev_owner} 处理，本副本跳过")
+            return False
+        LEASE_EVENTS.inc("acquired")
+        with self._lock:
+            self._held.add(key)
+        return True
+
+    def release(self, meeting_id, done=True):
+        """
+        会议处理结束
+        done=True: 下载归档完成，保留期内拒绝重复认领；
+        done=False: 失败 / 取消 / 无录制 / 未授权，放弃租约，飞书重推或其他副本之后可以重新认领
+        """
+        config = load_config()
+        key = self._key(meeting_id)
+        with self._lock:
+            self._held.discard(key)
+        try:
+            if done:
+                lease_store.complete(key, config["replica_id"], config["lease_done_retention"])
+            else:
+                lease_store.delete(key, config["replica_id"])
+        except Exception as e:
+            logger.error(f"[租约] 释放会议 {meeting_id} 租约失败: {e}")
+
+    def suspend(self, meeting_id, owner_id, **resume):
+        """
+        进程退出时任务未完成: 把断点 (轮询次数、优先级、下次查询时间等) 写入租约并立即释放，
+        接管的副本按断点恢复 (见 _takeover / on_takeover)
+        """
+        config = load_config()
+        key = self._key(meeting_id)
+        with self._lock:
+            self._held.discard(key)
+        payload = {"meeting_id": meeting_id, "owner_id": owner_id, "resume": resume}
+        try:
+            lease_store.suspend(key, config["replica_id"], payload)
+            logger.info(f"[租约] 会议 {meeting_id} 已保存断点 {resume}")
+        except Exception as e:
+            logger.error(f"[租约] 保存会议 {meeting_id} 断点失败: {e}")
+
+    def stop_takeover(self):
+        """进程退出中: 继续为进行中的任务续期，但不再接管新的会议"""
+        self._takeover_enabled = False
+
+    def held_count(self):
+        return len(self._held)
+
+    def _heartbeat(self, config):
+        with self._lock:
+            keys = list(self._held)
+        lost = lease_store.renew(keys, config["replica_id"], config["lease_ttl"])
+        for key in lost:
+            # 心跳中断太久 (例如进程长时间卡顿)，租约已被其他副本接管；本副本的任务仍会继续，
+            # 下载结果依赖内容索引去重
+            LEASE_EVENTS.inc("lost")
+            logger.warning(f"[租约] {key} 已被其他副本接管")
+            with self._lock:
+                self._held.discard(key)
+
+    def _takeover(self, config, on_takeover):
+        if not self._takeover_enabled:
+            return
+        for key, prev_owner, payload in lease_store.expired():
+            meeting_id = payload.get("meeting_id")
+            owner_id = payload.get("owner_id")
+            if not meeting_id or not owner_id:
+                continue
+            # 断点只用于这一次恢复，之后再被接管 (例如本副本宕机) 时从头开始轮询
+            resume = payload.pop("resume", None)
+            ok, _ = lease_store.acquire(key, config["replica_id"], config["lease_ttl"], payload=payload)
+            if not ok:
+                continue
+            LEASE_EVENTS.inc("resume" if resume else "takeover")
+            with self._lock:
+                self._held.add(key)
+            if resume:
+                logger.info(f"[租约] 从副本 {prev_owner} 退出时保存的断点恢复会议 {meeting_id}")
+            else:
+                logger.warning(f"[租约] 副本 {prev_owner} 的租约已过期，接管会议 {meeting_id}")
+            try:
+                on_takeover(meeting_id, owner_id, resume)
+            except Exception as e:
+                logger.error(f"[租约] 接管会议 {meeting_id} 失败: {e}")
+
+    def _loop(self, on_takeover):
+        config = load_config()
+        interval = max(config["lease_ttl"] / 3.0, 1.0)
+        rounds = 0
+        # 启动时立即扫描一次: 尽快恢复上一个进程退出时保存的断点
+        try:
+            self._takeover(config, on_takeover)
+        except Exception as e:
+            logger.error(f"[租约心跳异常] {e}")
+        while not self._stop_event.is_set():
+            # 加一点随机抖动，避免多个副本同时扫描过期租约
+            self._stop_event.wait(interval * random.uniform(0.8, 1.0))
+            try:
+                self._heartbeat(config)
+                self._takeover(config, on_takeover)
+                rounds += 1
+                if rounds % 100 == 0:
+                    lease_store.purge_done()
+            except Exception as e:
+                logger.error(f"[租约心跳异常] {e}")
+
+    def start(self, on_takeover):
+        """
+        启动心跳 / 接管线程 (进程内只启动一次)
+        :param on_takeover: 接管过期租约后的回调 (meeting_id, owner_id, resume)，负责重新开始轮询；
+                            resume 为退出时保存的断点 (没有时为 None)
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        t = threading.Thread(target=self._loop, args=(on_takeover,), name="lease-heartbeat", daemon=True)
+        t.start()
+        logger.info(f"[租约] 副本 {load_config()['replica_id']} 心跳线程已启动")
+
+# 全局单例
+lease_manager = LeaseManager()
+lifecycle.add_drain_hook(lease_manager.stop_takeover)
+
+registry.gauge("feishu_leases_held", "本副本持有的会议租约数", callback=lease_manager.held_count)
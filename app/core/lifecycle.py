@@ -0,0 +1,104 @@
+import os
+import time
+import signal
+import _thread
+import threading
+from app.utils.logger import logger
+from app.utils.config import load_config
+
+# 截止时间到达后，等待被中断的下载保存断点的时间 (秒)
+ABORT_GRACE = 5
+
+class Lifecycle:
+    """
+    进程生命周期 (优雅退出)
+    收到 SIGTERM (每次 docker-compose 部署) 后:
+    1. 停止接收新任务: Webhook 返回 503 由飞书稍后重推；等待录制的轮询、等待下载名额的任务保存断点
+    2. 等待进行中的下载及其归档 (NAS 移动 / 团队复制) 在 SHUTDOWN_TIMEOUT 内完成；超时的下载保留已写入的临时文件并记录断点
+    3. 发送完队列中的通知后退出
+    断点保存在共享的租约库中 (立即过期的租约)，重启后的本副本或其他副本通过租约接管流程恢复
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._draining = threading.Event()
+        self._aborting = threading.Event()
+        self._stopped = threading.Event()
+        self._drain_hooks = []
+
+    def add_drain_hook(self, hook):
+        """注册开始退出时执行的回调 (停止调度新任务、保存断点等)，由各模块在 import 时注册"""
+        self._drain_hooks.append(hook)
+
+    def accepting(self):
+        """是否仍在接收新任务"""
+        return not self._draining.is_set()
+
+    def aborting(self):
+        """等待下载完成已超时，进行中的下载应立即保存断点并退出"""
+        return self._aborting.is_set()
+
+    def shutdown(self, timeout=None):
+        """执行优雅退出流程 (只执行一次，重复调用时等待第一次完成)"""
+        with self._lock:
+            if self._draining.is_set():
+                self._stopped.wait()
+                return
+            self._draining.set()
+
+        from app.core.download_scheduler import download_scheduler
+        from app.core.job_registry import job_registry
+        from app.core.notification import notification_dispatcher
+
+        def busy():
+            # 下载名额在下载结束时即释放，归档阶段 (移动 / 复制到 NAS) 只能从任务登记表看到
+            return max(download_scheduler.running(), job_registry.in_flight())
+
+        timeout = load_config()["shutdown_timeout"] if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        logger.warning(f"[退出] 停止接收新任务，等待进行中的下载 / 归档完成 (最长 {timeout:.0f} 秒)")
+        for hook in self._drain_hooks:
+            try:
+                hook()
+            except Exception as e:
+                logger.error(f"[退出] 执行退出回调失败: {e}")
+
+        while busy() > 0 and time.monotonic() < deadline:
+            time.sleep(0.2)
+        if busy() > 0:
+            logger.warning(f"[退出] 仍有 {busy()} 个下载 / 归档未完成，下载保存断点后退出")
+            self._aborting.set()
+            grace = time.monotonic() + ABORT_GRACE
+            while busy() > 0 and time.monotonic() < grace:
+                time.sleep(0.1)
+            if job_registry.in_flight() > 0:
+                # 归档阶段无法中断，文件可能只移动 / 复制了一部分
+                logger.error(f"[退出] 仍有 {job_registry.in_flight()} 个任务在归档中，强制退出可能留下不完整的 NAS 文件")
+
+        if not notification_dispatcher.drain(max(deadline - time.monotonic(), ABORT_GRACE)):
+            logger.warning("[退出] 部分通知未能在退出前发送")
+        logger.info("[退出] 优雅退出完成")
+        self._stopped.set()
+
+    def install_signal_handlers(self):
+        """
+        在主线程中调用: SIGTERM / SIGINT 时在后台线程执行优雅退出，完成后中断主线程 (结束 Waitress 的服务循环)
+        退出过程中再次收到信号则立即退出
+        """
+        def _run():
+            try:
+                self.shutdown()
+            finally:
+                _thread.interrupt_main()
+
+        def _handle(signum, frame):
+            if self._draining.is_set():
+                logger.warning("[退出] 再次收到退出信号，立即退出")
+                os._exit(1)
+            logger.info(f"[退出] 收到信号 {signal.Signals(signum).name}")
+            threading.Thread(target=_run, name="graceful-shutdown", daemon=True).start()
+
+        signal.signal(signal.SIGTERM, _handle)
+        signal.signal(signal.SIGINT, _handle)
+
+# 全局单例
+lifecycle = Lifecycle()
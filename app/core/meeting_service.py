@@ -1,10 +1,28 @@
-import requests
-import lark_oapi as lark
+import asyncio
 from app.utils.logger import logger
 from app.utils.config import load_config
-from app.utils.feishu_client import get_tenant_access_token
+from app.utils.feishu_client import get_tenant_access_token, api_request, open_api_url
+from app.utils.metrics import TOKEN_REFRESHES
+from app.utils.ttl_cache import TTLCache
 from app.data.token_store import token_store
 from app.core.notification import send_auth_failed_notification
+from app.core.async_engine import async_api_request
+from app.utils.exceptions import FeishuDownloaderError
+
+# 会议结束后会议详情和录制链接不再变化: 重试、补录、授权后补下载、重复任务直接复用最近的查询结果
+# 缓存按会议 ID 区分 (不区分调用的用户)，只缓存成功的结果，录制尚未生成时每次都重新查询
+recording_cache = TTLCache("recording")
+meeting_cache = TTLCache("meeting")
+
+def _cache_ttl(result):
+    """成功的查询结果 (code == 0) 缓存 API_CACHE_TTL 秒，其余不缓存"""
+    return load_config()["api_cache_ttl"] if result and result.get("code") == 0 else 0
+
+def _recording_cache_ttl(result):
+    """录制信息只在已生成链接时缓存，否则轮询会一直拿到缓存的未就绪结果"""
+    if _cache_ttl(result) and result.get("data", {}).get("recording", {}).get("url"):
+        return load_config()["api_cache_ttl"]
+    return 0
 
 def refresh_user_token_for_user(user_id, current_refresh_token):
     """
@@ -20,7 +38,7 @@ def refresh_user_token_for_user(user_id, current_refresh_token):
         return None, None
 
     # 2. 调用刷新接口
-    url = "https://open.feishu.cn/open-apis/authen/v1/refresh_access_token"
+    url = open_api_url("authen/v1/refresh_access_token")
     headers = {
         "Authorization": f"Bearer {tenant_token}",
         "Content-Type": "application/json; charset=utf-8"
@@ -31,11 +49,12 @@ def refresh_user_token_for_user(user_id, current_refresh_token):
     }
 
     try:
-        resp = requests.post(url, headers=headers, json=body)
+        resp = api_request("POST", "authen.refresh_access_token", url, headers=headers, json=body)
         data = resp.json()
         
         if data.get("code") != 0:
             logger.error(f"--- [Token刷新失败] Code: {data.get('code')}, Msg: {data.get('msg')} ---")
+            TOKEN_REFRESHES.inc("failure")
             return None, None
             
         # 3. 解析结果
@@ -46,6 +65,7 @@ def refresh_user_token_for_user(user_id, current_refresh_token):
         
         if not new_access_token:
              logger.error(f"--- [Token刷新异常] 响应中缺少 access_token: {data} ---")
+             TOKEN_REFRESHES.inc("failure")
              return None, None
 
         # 4. 保存到 TokenStore
@@ -56,75 +76,133 @@ def refresh_user_token_for_user(user_id, current_refresh_token):
         }
         token_store.save_user_token(user_id, token_data)
         
+        TOKEN_REFRESHES.inc("success")
         logger.info(f"--- [Token刷新成功] 用户 {user_id} Token 已更新 ---")
         return new_access_token, new_refresh_token
 
     except Exception as e:
         logger.error(f"--- [Token刷新请求异常] {e} ---")
+        TOKEN_REFRESHES.inc("failure")
         return None, None
 
 def get_recording_info(meeting_id, user_access_token, user_id=None, silent=False):
     """
     通过 user_access_token 查询会议录制信息
     权限要求: vc:record:readonly
-    增加了 Token 自动刷新机制
+    增加了 Token 自动刷新机制；录制已就绪的结果会缓存 (见 recording_cache)
     :param silent: 是否静默模式 (不打印日志)
     """
-    url = f"https://open.feishu.cn/open-apis/vc/v1/meetings/{meeting_id}/recording"
+    return recording_cache.get_or_load(
+        meeting_id, lambda: _fetch_recording_info(meeting_id, user_access_token, user_id, silent),
+        _recording_cache_ttl)
+
+def _fetch_recording_info(meeting_id, user_access_token, user_id, silent):
+    url = open_api_url(f"vc/v1/meetings/{meeting_id}/recording")
     
     def _do_request(token):
         headers = { "Authorization": f"Bearer {token}" }
-        return requests.get(url, headers=headers)
+        return api_request("GET", "vc.meeting.recording", url, headers=headers)
 
     try:
         resp = _do_request(user_access_token)
         
         # 处理 Token 过期 (401 或 特定错误码)
-        if resp.status_code == 401 or (resp.json().get('code') == 99991677):
-            logger.warning(f"[API授权过期] 尝试刷新用户 {user_id} 的 Token...")
-            if user_id:
-                # 获取当前的 Refresh Token
-                saved_data = token_store.get_user_token(user_id)
-                if saved_data and saved_data.get("refresh_token"):
-                    # 刷新
-                    new_at, _ = refresh_user_token_for_user(user_id, saved_data["refresh_token"])
-                    if new_at:
-                        logger.info("[重试] 使用新 Token 重试 API 请求...")
-                        resp = _do_request(new_at)
-                    else:
-                        logger.error("[刷新失败] 无法获取新 Token")
-                        send_auth_failed_notification(user_id, meeting_id)
-                else:
-                    logger.error("[刷新失败] 未找到 Refresh Token")
-                    send_auth_failed_notification(user_id, meeting_id)
-            else:
-                 logger.error("[刷新失败] 未提供 user_id，无法执行刷新")
+        if _is_token_expired(resp):
+            new_at = _refresh_for_retry(user_id, meeting_id)
+            if new_at:
+                resp = _do_request(new_at)
 
-        if resp.status_code == 200:
-            return resp.json()
-        elif resp.json().get('code') == 121004:
-            # 121004: data not exist (可能场景: 1. 正在生成中 2. 未包含录制文件)
-            # 降级日志为 INFO/DEBUG
-            if not silent:
-                logger.info(f"[状态检测] 会议 {meeting_id} 暂未检测到录制文件 (可能未录制或生成中)，将在后台持续监测...")
-            return None
-        else:
-            logger.error(f"[获取录制信息失败] 用户: {user_id} | Status: {resp.status_code}, Body: {resp.text}")
-            return None
+        return _parse_recording_response(resp, meeting_id, user_id, silent)
     except Exception as e:
         logger.error(f"[API请求异常] {e}")
         return None
 
+async def async_get_recording_info(meeting_id, user_access_token, user_id=None, silent=False):
+    """
+    get_recording_info 的协程版本 (asyncio 执行模式)
+    查询走共享的 httpx 连接池；Token 刷新较少发生，放到线程池中复用同步逻辑
+    """
+    return await recording_cache.async_get_or_load(
+        meeting_id, lambda: _async_fetch_recording_info(meeting_id, user_access_token, user_id, silent),
+        _recording_cache_ttl)
+
+async def _async_fetch_recording_info(meeting_id, user_access_token, user_id, silent):
+    url = open_api_url(f"vc/v1/meetings/{meeting_id}/recording")
+
+    async def _do_request(token):
+        headers = { "Authorization": f"Bearer {token}" }
+        return await async_api_request("GET", "vc.meeting.recording", url, headers=headers)
+
+    try:
+        resp = await _do_request(user_access_token)
+
+        if _is_token_expired(resp):
+            new_at = await asyncio.to_thread(_refresh_for_retry, user_id, meeting_id)
+            if new_at:
+                resp = await _do_request(new_at)
+
+        return _parse_recording_response(resp, meeting_id, user_id, silent)
+    except Exception as e:
+        logger.error(f"[API请求异常] {e}")
+        return None
+
+def _is_token_expired(resp):
+    return resp.status_code == 401 or (resp.json().get('code') == 99991677)
+
+def _refresh_for_retry(user_id, meeting_id):
+    """
+    查询录制时 Token 过期: 刷新用户 Token
+    返回: 新的 user_access_token，刷新失败返回 None (并通知用户重新授权)
+    """
+    logger.warning(f"[API授权过期] 尝试刷新用户 {user_id} 的 Token...")
+    if not user_id:
+        logger.error("[刷新失败] 未提供 user_id，无法执行刷新")
+        return None
+    # 获取当前的 Refresh Token
+    saved_data = token_store.get_user_token(user_id)
+    if saved_data and saved_data.get("refresh_token"):
+        # 刷新
+        new_at, _ = refresh_user_token_for_user(user_id, saved_data["refresh_token"])
+        if new_at:
+            logger.info("[重试] 使用新 Token 重试 API 请求...")
+            return new_at
+        logger.error("[刷新失败] 无法获取新 Token")
+    else:
+        logger.error("[刷新失败] 未找到 Refresh Token")
+    send_auth_failed_notification(user_id, meeting_id)
+    return None
+
+def _parse_recording_response(resp, meeting_id, user_id, silent):
+    if resp.status_code == 200:
+        return resp.json()
+    elif resp.json().get('code') == 121004:
+        # 121004: data not exist (可能场景: 1. 正在生成中 2. 未包含录制文件)
+        # 降级日志为 INFO/DEBUG
+        if not silent:
+            logger.info(f"[状态检测] 会议 {meeting_id} 暂未检测到录制文件 (可能未录制或生成中)，将在后台持续监测...")
+        return None
+    else:
+        logger.error(f"[获取录制信息失败] 用户: {user_id} | Status: {resp.status_code}, Body: {resp.text}")
+        return None
+
 def get_meeting_detail(meeting_id, user_access_token):
     """
     获取会议详细信息 (用于生成文件名)
+    与 get_meeting_participants 调用同一个接口，已缓存带参会人的结果时直接复用
     """
-    url = f"https://open.feishu.cn/open-apis/vc/v1/meetings/{meeting_id}"
+    cached = meeting_cache.get((meeting_id, True))
+    if cached is not None:
+        return cached
+    return meeting_cache.get_or_load(
+        (meeting_id, False), lambda: _fetch_meeting_detail(meeting_id, user_access_token), _cache_ttl)
+
+def _fetch_meeting_detail(meeting_id, user_access_token, params=None):
+    url = open_api_url(f"vc/v1/meetings/{meeting_id}")
     headers = {
         "Authorization": f"Bearer {user_access_token}"
     }
     try:
-        resp = requests.get(url, headers=headers)
+        resp = api_request("GET", "vc.meeting.get", url, headers=headers, params=params)
         if resp.status_code == 200:
             return resp.json()
 
@@ -141,25 +219,71 @@ def get_meeting_detail(meeting_id, user_access_token):
         logger.error(f"[获取会议详情异常] {e}")
     return None
 
+def get_meeting_owner(meeting_id, user_access_token):
+    """
+    会议 Owner 的 user_id (历史补录用: 会议列表中也包含用户只是参会的会议)
+    会议详情中优先使用 owner，没有时使用主持人 host_user；查询失败或两者都没有时返回 None
+    """
+    data = meeting_cache.get_or_load(
+        (meeting_id, "user_id"),
+        lambda: _fetch_meeting_detail(meeting_id, user_access_token, {"user_id_type": "user_id"}), _cache_ttl)
+    if not data or data.get("code") != 0:
+        return None
+    meeting = data.get("data", {}).get("meeting", {})
+    owner = meeting.get("owner") or meeting.get("host_user") or {}
+    return owner.get("id") or None
+
+def list_user_meetings(user_access_token, start_time, end_time, user_id=None, page_size=50):
+    """
+    列出用户在时间范围内已结束的会议 (历史补录用)
+    API: GET /open-apis/vc/v1/meeting_list
+    :param start_time / end_time: Unix 秒
+    返回: 会议列表 (每项至少包含 meeting_id)；接口失败时抛出 FeishuDownloaderError，避免把失败当成"没有会议"
+    """
+    url = open_api_url("vc/v1/meeting_list")
+    headers = {"Authorization": f"Bearer {user_access_token}"}
+    params = {
+        "start_time": str(int(start_time)),
+        "end_time": str(int(end_time)),
+        "meeting_status": 2,  # 2: 已结束
+        "page_size": page_size,
+    }
+    if user_id:
+        params["user_id"] = user_id
+        params["user_id_type"] = "user_id"
+
+    meetings = []
+    page_token = ""
+    while True:
+        if page_token:
+            params["page_token"] = page_token
+        resp = api_request("GET", "vc.meeting_list", url, headers=headers, params=params)
+        data = resp.json()
+        if data.get("code") != 0:
+            raise FeishuDownloaderError(f"获取会议列表失败: {data.get('code')} {data.get('msg')}")
+        body = data.get("data", {})
+        meetings.extend(m for m in body.get("meeting_list", []) if m.get("meeting_id"))
+        page_token = body.get("page_token")
+        if not body.get("has_more") or not page_token:
+            return meetings
+
 def get_meeting_participants(meeting_id, user_access_token):
     """
     获取会议参会人列表 (用于判断是否有HR)
     [折中方案] 使用 GET /open-apis/vc/v1/meetings/{meeting_id}
     如果 API 返回 participants 字段，则使用它（通常是部分数据，但对检测 HR 足够了）
     """
-    url = f"https://open.feishu.cn/open-apis/vc/v1/meetings/{meeting_id}"
-    headers = {
-        "Authorization": f"Bearer {user_access_token}"
-    }
     # 部分接口版本支持 with_participants 参数，尝试加上
     params = {
         "with_participants": "true" 
     }
     
     try:
-        resp = requests.get(url, headers=headers, params=params)
-        data = resp.json()
-        
+        data = meeting_cache.get_or_load(
+            (meeting_id, True), lambda: _fetch_meeting_detail(meeting_id, user_access_token, params), _cache_ttl)
+        if data is None:
+            return []
+
         if data.get("code") == 0:
             # 尝试提取参会人
             # 结构可能是 data.meeting.participants 或 data.meeting.participant_list
@@ -194,10 +318,10 @@ def get_department_names_by_ids(department_ids, tenant_access_token):
     
     for dept_id in department_ids:
         # 缓存优化: 实际项目中这里应该加个 LRU 缓存避免重复查
-        url = f"https://open.feishu.cn/open-apis/contact/v3/departments/{dept_id}"
+        url = open_api_url(f"contact/v3/departments/{dept_id}")
         params = {"department_id_type": "open_department_id"}
         try:
-            resp = requests.get(url, headers=headers, params=params)
+            resp = api_request("GET", "contact.department.get", url, headers=headers, params=params)
             data = resp.json()
             if data.get("code") == 0:
                 name = data.get("data", {}).get("department", {}).get("name")
@@ -217,7 +341,7 @@ def get_user_departments_from_api(user_id, tenant_access_token):
     if not tenant_access_token:
         return []
         
-    url = f"https://open.feishu.cn/open-apis/contact/v3/users/{user_id}"
+    url = open_api_url(f"contact/v3/users/{user_id}")
     headers = {"Authorization": f"Bearer {tenant_access_token}"}
     
     # 动态判断 ID 类型: 以 "ou_" 开头则是 open_id，否则默认为 user_id
@@ -229,7 +353,7 @@ def get_user_departments_from_api(user_id, tenant_access_token):
     }
     
     try:
-        resp = requests.get(url, headers=headers, params=params)
+        resp = api_request("GET", "contact.user.get", url, headers=headers, params=params)
         data = resp.json()
         if data.get("code") == 0:
             user_data = data.get("data", {}).get("user", {})
@@ -247,12 +371,12 @@ def get_user_info(user_id, user_access_token):
     """
     获取用户信息 (用于生成文件名)
     """
-    url = "https://open.feishu.cn/open-apis/authen/v1/user_info"
+    url = open_api_url("authen/v1/user_info")
     headers = {
         "Authorization": f"Bearer {user_access_token}"
     }
     try:
-        resp = requests.get(url, headers=headers)
+        resp = api_request("GET", "authen.user_info", url, headers=headers)
         if resp.status_code == 200:
             return resp.json()
         logger.error(f"[获取用户信息失败] Code: {resp.status_code} Body: {resp.text}")
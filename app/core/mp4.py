@@ -0,0 +1,172 @@
+import os
+import struct
+from app.utils.exceptions import MediaCorrupted
+
+# 需要向下解析子 box 的容器 (只用于定位 chunk offset 表 stco / co64)
+CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+# faststart 时需要整个读入内存的 moov 上限 (超过则跳过，保持原文件)
+MAX_MOOV_SIZE = 256 * 1024 * 1024
+# 移动 mdat 时的读写块大小
+COPY_BUFFER_SIZE = 4 * 1024 * 1024
+
+class Box:
+    def __init__(self, box_type, offset, size, header_size):
+        self.type = box_type
+        self.offset = offset
+        self.size = size
+        self.header_size = header_size
+
+    @property
+    def end(self):
+        return self.offset + self.size
+
+    def __repr__(self):
+        return f"Box({self.type.decode('latin-1')}, offset={self.offset}, size={self.size})"
+
+def _check_type(box_type, offset):
+    if not all(0x20 <= c <= 0x7e for c in box_type):
+        raise MediaCorrupted(f"第 {offset} 字节处不是合法的 box 类型: {box_type!r}")
+
+def _iter_boxes(read_header, start, end):
+    """
+    遍历 [start, end) 范围内相邻的 box，要求它们正好铺满整个范围
+    :param read_header: (offset, n) -> 从 offset 起最多 n 个字节
+    """
+    offset = start
+    while offset < end:
+        if end - offset < 8:
+            raise MediaCorrupted(f"第 {offset} 字节处剩余 {end - offset} 字节，不足一个 box 头")
+        header = read_header(offset, 16)
+        size, box_type = struct.unpack(">I4s", header[:8])
+        _check_type(box_type, offset)
+        header_size = 8
+        if size == 1:
+            if len(header) < 16:
+                raise MediaCorrupted(f"box {box_type!r} 的 64 位长度不完整 (第 {offset} 字节)")
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            # 长度为 0: 延伸到文件 (父 box) 末尾
+            size = end - offset
+        if size < header_size:
+            raise MediaCorrupted(f"box {box_type!r} 长度 {size} 无效 (第 {offset} 字节)")
+        if offset + size > end:
+            raise MediaCorrupted(f"box {box_type!r} 不完整: 需要 {size} 字节，只剩 {end - offset} 字节 (第 {offset} 字节)")
+        yield Box(box_type, offset, size, header_size)
+        offset += size
+
+def read_top_level(f, file_size):
+    """顶层 box 列表；结构不完整时抛出 MediaCorrupted"""
+    def _read(offset, n):
+        f.seek(offset)
+        return f.read(n)
+    return list(_iter_boxes(_read, 0, file_size))
+
+def _chunk_offset_tables(moov):
+    """
+    在内存中的 moov 数据里查找所有 stco / co64 表
+    返回: [(表类型, 条目起始位置 (相对 moov), 条目数)]
+    """
+    tables = []
+    traks = 0
+
+    def _read(offset, n):
+        return bytes(moov[offset:offset + n])
+
+    def _walk(start, end, depth):
+        nonlocal traks
+        for box in _iter_boxes(_read, start, end):
+            body = box.offset + box.header_size
+            if box.type == b"trak" and depth == 0:
+                traks += 1
+            if box.type in CONTAINER_BOXES:
+                _walk(body, box.end, depth + 1)
+            elif box.type in (b"stco", b"co64"):
+                if box.end - body < 8:
+                    raise MediaCorrupted(f"{box.type.decode()} 表头不完整")
+                count = struct.unpack_from(">I", moov, body + 4)[0]
+                width = 4 if box.type == b"stco" else 8
+                if body + 8 + count * width > box.end:
+                    raise MediaCorrupted(f"{box.type.decode()} 表声明 {count} 个条目，超出 box 长度")
+                tables.append((box.type, body + 8, count))
+
+    moov_box = next(_iter_boxes(_read, 0, len(moov)))
+    _walk(moov_box.header_size, moov_box.end, 0)
+    if not traks:
+        raise MediaCorrupted("moov 中没有任何轨道 (trak)")
+    return tables
+
+def _chunk_offsets(moov, tables):
+    for box_type, start, count in tables:
+        fmt = ">%d%s" % (count, "I" if box_type == b"stco" else "Q")
+        yield box_type, start, struct.unpack_from(fmt, moov, start)
+
+def inspect(path):
+    """
+    校验 MP4 结构: 顶层 box 正好铺满整个文件，存在 moov 和 mdat，
+    moov 可以完整解析且所有 chunk offset 都落在文件范围内
+    返回: {"size", "boxes", "faststart": moov 是否已在 mdat 之前}
+    :raises MediaCorrupted: 结构不完整 (下载被截断、服务端返回了非 MP4 内容等)
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        boxes = read_top_level(f, file_size)
+        moov = next((b for b in boxes if b.type == b"moov"), None)
+        mdat = next((b for b in boxes if b.type == b"mdat"), None)
+        if moov is None:
+            raise MediaCorrupted("缺少 moov (索引信息)，文件可能不完整")
+        if mdat is None:
+            raise MediaCorrupted("缺少 mdat (媒体数据)")
+        if moov.size > MAX_MOOV_SIZE:
+            raise MediaCorrupted(f"moov 大小异常: {moov.size} 字节")
+        f.seek(moov.offset)
+        data = f.read(moov.size)
+    for box_type, _, offsets in _chunk_offsets(data, _chunk_offset_tables(data)):
+        if offsets and max(offsets) >= file_size:
+            raise MediaCorrupted(f"{box_type.decode()} 中的 chunk offset {max(offsets)} 超出文件长度 {file_size}")
+    return {"size": file_size, "boxes": boxes, "faststart": moov.offset < mdat.offset}
+
+def faststart(path):
+    """
+    把位于 mdat 之后的 moov 移到 mdat 之前 (播放器无需读完整个文件即可开始播放)
+    原地改写: moov 读入内存，mdat 起到 moov 之间的数据从后往前整体后移 moov 的长度，
+    再把修正了 chunk offset 的 moov 写到原 mdat 的位置；文件长度不变，只占用一个读写缓冲区的内存
+    返回: True 已改写 / False 无需改写或无法改写 (stco 偏移超过 4GB 等，保持原文件)
+    :raises MediaCorrupted: 结构不完整
+    """
+    with open(path, "r+b") as f:
+        boxes = read_top_level(f, os.path.getsize(path))
+        moov = next((b for b in boxes if b.type == b"moov"), None)
+        mdat = next((b for b in boxes if b.type == b"mdat"), None)
+        if moov is None or mdat is None:
+            raise MediaCorrupted("缺少 moov 或 mdat")
+        if moov.offset < mdat.offset or moov.size > MAX_MOOV_SIZE:
+            return False
+
+        f.seek(moov.offset)
+        data = bytearray(f.read(moov.size))
+        region_start, region_end, shift = mdat.offset, moov.offset, moov.size
+
+        # 修正 chunk offset: 指向被后移区域的偏移加上 moov 的长度
+        for box_type, start, offsets in _chunk_offsets(data, _chunk_offset_tables(data)):
+            patched = [o + shift if region_start <= o < region_end else o for o in offsets]
+            if box_type == b"stco" and patched and max(patched) > 0xFFFFFFFF:
+                # 32 位 stco 放不下新偏移 (需要改成 co64，moov 长度会变)，不做改写
+                return False
+            fmt = ">%d%s" % (len(patched), "I" if box_type == b"stco" else "Q")
+            struct.pack_into(fmt, data, start, *patched)
+
+        # 从后往前移动: 每次写入的位置都在尚未读取的数据之后，不会覆盖还没搬走的内容
+        pos = region_end
+        while pos > region_start:
+            n = min(COPY_BUFFER_SIZE, pos - region_start)
+            pos -= n
+            f.seek(pos)
+            chunk = f.read(n)
+            f.seek(pos + shift)
+            f.write(chunk)
+        f.seek(region_start)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return True
@@ -1,9 +1,64 @@
 import os
 import json
+import errno
 import shutil
 import pwd
-from pypinyin import lazy_pinyin
+import time
 from app.utils.logger import logger
+from app.utils.metrics import NAS_OPERATION_LATENCY
+
+# os.copy_file_range 只在 Linux 上可用 (Python 3.8+)，其他平台直接使用 shutil.copyfile
+COPY_RANGE_SUPPORTED = hasattr(os, "copy_file_range")
+# copy_file_range 单次调用复制的最大字节数
+COPY_RANGE_CHUNK = 64 * 1024 * 1024
+# copy_file_range 不适用时的错误 (跨文件系统、文件系统或内核不支持)，改用 sendfile
+_COPY_RANGE_UNSUPPORTED = (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL, errno.EBADF)
+
+def _copy_range(src, dst):
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        copied = 0
+        while copied < size:
+            n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(COPY_RANGE_CHUNK, size - copied))
+            if n == 0:
+                # 部分文件系统 (如 procfs / 旧版 CIFS) 返回 0 而不是报错
+                raise OSError(errno.EINVAL, "copy_file_range 未复制任何数据")
+            copied += n
+
+def copy_file(src, dst):
+    """
+    复制文件 (团队归档、跨卷移动)，数据不经过用户态，与 shutil.copy2 一样保留权限和修改时间
+    - os.copy_file_range: 同一文件系统上由文件系统直接完成 (btrfs / XFS reflink、NFS 4.2 服务端复制)
+    - 不适用时回退到 shutil.copyfile (Linux 上使用 os.sendfile)
+    """
+    if COPY_RANGE_SUPPORTED:
+        try:
+            _copy_range(src, dst)
+        except OSError as e:
+            if e.errno not in _COPY_RANGE_UNSUPPORTED:
+                raise
+            shutil.copyfile(src, dst)
+    else:
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+    return dst
+
+def link_file(src, dst):
+    """
+    以硬链接归档与已归档文件内容相同的录制 (不再占用一份空间)
+    返回: 是否成功；跨文件系统 / 文件系统不支持 / 目标已有其他文件时返回 False，由调用方改为移动 / 复制
+    """
+    try:
+        if os.path.exists(dst):
+            # 目标已经是同一个文件 (例如同一录制重复下载) 时无需再链接
+            return os.path.samefile(src, dst)
+        started = time.perf_counter()
+        os.link(src, dst)
+        NAS_OPERATION_LATENCY.observe("link", value=time.perf_counter() - started)
+        return True
+    except OSError as e:
+        logger.info(f"[NAS硬链接] 无法链接 {src} -> {dst}，改为移动 / 复制: {e}")
+        return False
 
 class NasManager:
     # 容器映射路径 (对应宿主机 /vol1)
@@ -74,7 +129,8 @@ class NasManager:
         # 清洗名字
         clean_name = user_name.strip().lower()
 
-        # 拼音转换 (张三 -> zhangsan)
+        # 拼音转换 (张三 -> zhangsan)；pypinyin 加载词典较慢，用到时才导入
+        from pypinyin import lazy_pinyin
         pinyin_list = lazy_pinyin(clean_name)
         pinyin_name = "".join(pinyin_list).lower()
         
@@ -119,14 +175,17 @@ class NasManager:
             logger.warning(f"[NAS匹配] 目录遍历匹配失败: {e}")
 
     @staticmethod
-    def save_to_team_folder(source_file_path, department_names):
+    def save_to_team_folder(source_file_path, department_names, link_source=None):
         """
         将文件复制到团队文件夹
         :param source_file_path: 源文件路径 (已下载的视频文件)
         :param department_names: 部门名称列表 ["Skyris技术部门", "Skyris管理层"]
+        :param link_source: 内容相同的已归档文件，优先硬链接到团队文件夹，失败时再复制
+        返回: 成功复制的目标文件路径列表
         """
+        copied_paths = []
         if not department_names:
-            return
+            return copied_paths
 
         file_name = os.path.basename(source_file_path)
 
@@ -140,19 +199,29 @@ class NasManager:
             # 检查团队文件夹是否存在
             if os.path.exists(team_folder_path) and os.path.isdir(team_folder_path):
                 target_file_path = os.path.join(team_folder_path, file_name)
+                if link_source and link_file(link_source, target_file_path):
+                    copied_paths.append(target_file_path)
+                    logger.info(f"[NAS团队归档] 内容已归档过，硬链接到: {target_file_path}")
+                    continue
                 try:
-                    shutil.copy2(source_file_path, target_file_path)
+                    started = time.perf_counter()
+                    copy_file(source_file_path, target_file_path)
+                    NAS_OPERATION_LATENCY.observe("copy", value=time.perf_counter() - started)
+                    copied_paths.append(target_file_path)
                     logger.info(f"[NAS团队归档] 成功复制文件到: {target_file_path}")
                 except Exception as e:
                     logger.error(f"[NAS团队归档] 复制失败 {dept_name}: {e}")
             else:
                 logger.debug(f"[NAS团队归档] 忽略: 团队文件夹不存在 ({dept_name})")
 
+        return copied_paths
+
 
     @staticmethod
-    def archive_file(local_file_path, user_name, user_id):
+    def archive_file(local_file_path, user_name, user_id, link_source=None):
         """
         将文件归档到 NAS
+        :param link_source: 内容相同的已归档文件，优先硬链接到用户目录 (删除下载的文件)，失败时再移动
         返回: (是否成功, 最终路径, 匹配到的文件夹名)
         """
         folder_name = NasManager.get_nas_folder(user_name, user_id)
@@ -165,9 +234,18 @@ class NasManager:
             filename = os.path.basename(local_file_path)
             # 目标: /nas_data/zhangsan/filename.mp4
             nas_path = os.path.join(NasManager.NAS_ROOT, folder_name, filename)
+
+            if link_source and link_file(link_source, nas_path):
+                # 硬链接与已归档文件共用 inode，不再修改权限
+                os.remove(local_file_path)
+                logger.info(f"[NAS归档] 内容已归档过，硬链接: {link_source} -> {nas_path}")
+                return True, nas_path, folder_name
             
             # 移动文件
-            shutil.move(local_file_path, nas_path)
+            started = time.perf_counter()
+            # 下载目录与 NAS 不在同一文件系统时 move 会复制后删除源文件
+            shutil.move(local_file_path, nas_path, copy_function=copy_file)
+            NAS_OPERATION_LATENCY.observe("move", value=time.perf_counter() - started)
             
             # 修改权限 (确保 NAS 用户能读写，通常设为 6666 或 777)
             # 注意：在 Docker 挂载卷中 chown 可能无效，但 chmod 通常可以
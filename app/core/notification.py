@@ -1,62 +1,272 @@
 import json
 import os
+import time
+import heapq
+import itertools
+import threading
 import requests
 from app.utils.logger import logger
-from app.utils.feishu_client import get_tenant_access_token
+from app.utils.config import load_config
+from app.utils.feishu_client import (
+    get_tenant_access_token, invalidate_tenant_access_token, api_request, open_api_url
+)
+from app.utils.metrics import registry, NOTIFICATION_LATENCY, NOTIFICATIONS, AUTH_NOTICES
+from app.data.auth_notice_store import auth_notice_store
+from app.core.bandwidth import TokenBucket
 
-def send_success_notification(user_id, file_name, nas_path=None, team_paths=None):
+# Tenant Token 无效 / 过期的业务错误码 (清除缓存后重试)
+_TOKEN_INVALID_CODES = {99991661, 99991663, 99991664}
+# 一张汇总卡片最多合并的条目数，达到后立即发送
+MAX_DIGEST_ITEMS = 20
+
+class CardTemplate:
     """
-    发送下载成功通知卡片
-    :param team_paths: list of str, 例如 ["Skyris技术部门", "Skyris管理层"]
+    预编译的卡片模板: 固定结构在加载时序列化一次，发送时只替换占位字段
+    (消息接口的 content 本身是 JSON 字符串，渲染结果可以直接使用)
     """
-    token = get_tenant_access_token()
-    if not token:
-        return
+    def __init__(self, card, fields):
+        self._fields = [(json.dumps(f"${{{name}}}"), name) for name in fields]
+        self._text = json.dumps(card, ensure_ascii=False)
+
+    def render(self, **values):
+        text = self._text
+        for placeholder, name in self._fields:
+            text = text.replace(placeholder, json.dumps(values[name], ensure_ascii=False))
+        return text
 
-    # 构建提示文本
-    content_lines = []
-    content_lines.append(f"✅ **会议录制已自动存档**")
-    content_lines.append(f"📄 文件名：{file_name}")
+def _text_card(color, title, fields=("text",)):
+    return CardTemplate({
+        "config": {"wide_screen_mode": True},
+        "header": {"template": color, "title": {"content": title, "tag": "plain_text"}},
+        "elements": [{"tag": "div", "text": {"content": "${text}", "tag": "lark_md"}}],
+    }, fields)
+
+_SUCCESS_CARD = _text_card("blue", "下载完成通知")
+_SUCCESS_DIGEST_CARD = _text_card("blue", "${title}", fields=("title", "text"))
+_FOLLOWUP_CARD = _text_card("green", "补归档完成通知")
+_AUTH_FAILED_CARD = CardTemplate({
+    "config": {"wide_screen_mode": True},
+    "header": {"template": "red", "title": {"content": "❌ 自动归档失败 (需要重新授权)", "tag": "plain_text"}},
+    "elements": [
+        {
+            "tag": "div",
+            "text": {"content": "${text}", "tag": "plain_text"}
+        },
+        {
+            "tag": "action",
+            "actions": [{
+                "tag": "button",
+                "text": {"content": "🔐 点击重新授权", "tag": "plain_text"},
+                "type": "primary",
+                "url": "${auth_url}"
+            }]
+        }
+    ]
+}, ["text", "auth_url"])
 
-    if nas_path:
+def _success_lines(item, with_header=True):
+    lines = []
+    if with_header:
+        lines.append("✅ **会议录制已自动存档**")
+    lines.append(f"📄 文件名：{item['file_name']}")
+    if item["nas_path"]:
         # 个人归档
-        content_lines.append(f"👤 **个人目录**: `{nas_path}`")
+        lines.append(f"👤 **个人目录**: `{item['nas_path']}`")
     else:
-        content_lines.append(f"💾 **服务器存储**: `downloads/{file_name}`")
-
-    if team_paths:
+        lines.append(f"💾 **服务器存储**: `downloads/{item['file_name']}`")
+        if item["pending_archive"] and with_header:
+            lines.append("⏳ 暂未匹配到您的 NAS 目录，系统将在后台自动重试归档，完成后会再次通知您。")
+    if item["team_paths"]:
         # 团队归档
-        # 为了美观，如果有多个团队，可以用逗号分隔或者换行
-        teams_str = ", ".join([f"`{t}`" for t in team_paths])
-        content_lines.append(f"🏢 **团队共享**: {teams_str}")
+        teams_str = ", ".join([f"`{t}`" for t in item["team_paths"]])
+        lines.append(f"🏢 **团队共享**: {teams_str}")
+    return lines
 
-    full_text = "\n".join(content_lines)
+def _render_success(items):
+    if len(items) == 1:
+        return _SUCCESS_CARD.render(text="\n".join(_success_lines(items[0])))
+    # 同一用户短时间内归档了多个录制: 合并为一张汇总卡片
+    blocks = ["\n".join(_success_lines(item, with_header=False)) for item in items]
+    if any(item["pending_archive"] for item in items):
+        blocks.append("⏳ 部分录制暂未匹配到您的 NAS 目录，系统将在后台自动重试归档，完成后会再次通知您。")
+    return _SUCCESS_DIGEST_CARD.render(title=f"下载完成通知 ({len(items)} 个录制)",
+                                       text=f"✅ **{len(items)} 个会议录制已自动存档**\n\n" + "\n\n".join(blocks))
 
-    # 卡片内容
-    card_content = {
-        "config": {
-            "wide_screen_mode": True
-        },
-        "elements": [
-            {
-                "tag": "div",
-                "text": {
-                    "content": full_text,
-                    "tag": "lark_md"
-                }
-            }
-        ],
+def _render_followup(items):
+    lines = ["📦 **会议录制已补归档至 NAS**"]
+    for item in items:
+        lines.append(f"📄 文件名：{item['file_name']}")
+        lines.append(f"👤 **个人目录**: `{item['nas_path']}`")
+    return _FOLLOWUP_CARD.render(text="\n".join(lines))
+
+def _render_auth_failed(items):
+    item = items[-1]
+    text = "检测到您的飞书授权已失效或 Token 已过期，机器人无法自动下载会议录制。"
+    if item["missed"]:
+        text += f"\n\n共有 {item['missed']} 个会议录制未能归档，重新授权后将自动补下载。"
+    return _AUTH_FAILED_CARD.render(text=text + "\n\n请点击下方按钮重新授权：", auth_url=item["auth_url"])
+
+# 消息类型 -> (渲染函数, 日志标签, 是否合并同一用户的多条消息)
+_KINDS = {
+    "success": (_render_success, "消息", True),
+    "archive_followup": (_render_followup, "补归档通知", True),
+    "auth_failed": (_render_auth_failed, "授权失败通知", False),
+}
+
+class _Message:
+    def __init__(self, kind, user_id):
+        self.kind = kind
+        self.user_id = user_id
+        self.items = []
+        self.attempts = 0
+        self.due = 0.0
+
+class NotificationDispatcher:
+    """
+    卡片消息发送队列: 调用方只入队，不阻塞下载 / 归档流程
+    - 同一用户在 NOTIFY_DIGEST_WINDOW 秒内的同类通知合并为一张汇总卡片
+    - 固定数量的发送线程 (NOTIFY_WORKERS) 共用一个 HTTP 连接池和缓存的 Tenant Token
+    - 全局限速 NOTIFY_RATE 条/秒；网络错误 / 限流 / 5xx 按指数退避重试
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._open = {}
+        self._seq = itertools.count()
+        self._inflight = 0
+        self._started = False
+        self._config = None
+        self._session = None
+        self._limiter = None
 
-        "header": {
-            "template": "blue",
-            "title": {
-                "content": "下载完成通知",
-                "tag": "plain_text"
+    def _get_config(self):
+        if self._config is None:
+            config = load_config()
+            self._config = {
+                "window": config["notify_digest_window"],
+                "workers": max(config["notify_workers"], 1),
+                "max_retries": config["notify_max_retries"],
             }
-        }
-    }
+            rate = config["notify_rate"]
+            self._limiter = TokenBucket(rate, burst=max(rate, 1))
+            self._session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self._config["workers"])
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+        return self._config
+
+    def _start(self):
+        """在持有 _cond 时调用: 第一次入队时启动发送线程"""
+        if self._started:
+            return
+        self._started = True
+        for i in range(self._get_config()["workers"]):
+            threading.Thread(target=self._worker, name=f"notifier-{i}", daemon=True).start()
+
+    def _push(self, message, due):
+        message.due = due
+        heapq.heappush(self._heap, (due, next(self._seq), message))
+        # drain() 也在等待同一个条件变量，需要唤醒全部等待者
+        self._cond.notify_all()
+
+    def submit(self, kind, user_id, item):
+        config = self._get_config()
+        coalesce = _KINDS[kind][2] and config["window"] > 0
+        now = time.monotonic()
+        with self._cond:
+            self._start()
+            key = (kind, user_id)
+            message = self._open.get(key) if coalesce else None
+            if message is None:
+                message = _Message(kind, user_id)
+                message.items.append(item)
+                if coalesce:
+                    self._open[key] = message
+                self._push(message, now + config["window"] if coalesce else now)
+            else:
+                message.items.append(item)
+                if len(message.items) >= MAX_DIGEST_ITEMS:
+                    # 已达到单张卡片上限: 立即发送 (旧的堆条目出队时会被跳过)
+                    self._open.pop(key, None)
+                    self._push(message, now)
 
-    url = "https://open.feishu.cn/open-apis/im/v1/messages"
+    def _next(self):
+        """取出下一条到期的消息 (阻塞)"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    due, _, message = heapq.heappop(self._heap)
+                    if due != message.due:
+                        continue
+                    key = (message.kind, message.user_id)
+                    if self._open.get(key) is message:
+                        del self._open[key]
+                    self._inflight += 1
+                    return message
+                self._cond.wait(timeout=self._heap[0][0] - now if self._heap else None)
+
+    def _worker(self):
+        while True:
+            message = self._next()
+            try:
+                self._limiter.consume(1)
+                retry = self._send(message)
+            except Exception as e:
+                logger.error(f"[通知发送异常] {e}")
+                retry = True
+            with self._cond:
+                self._inflight -= 1
+                if retry and message.attempts < self._get_config()["max_retries"]:
+                    message.attempts += 1
+                    self._push(message, time.monotonic() + 2 ** message.attempts)
+                else:
+                    NOTIFICATIONS.inc(message.kind, "failed" if retry else "sent")
+                self._cond.notify_all()
+
+    def _send(self, message):
+        """发送一条消息，返回是否需要重试"""
+        render, log_tag, _ = _KINDS[message.kind]
+        started = time.perf_counter()
+        try:
+            token = get_tenant_access_token()
+            if not token:
+                return True
+            return _post_card(token, message.user_id, render(message.items), log_tag, session=self._session)
+        finally:
+            NOTIFICATION_LATENCY.observe(message.kind, value=time.perf_counter() - started)
+
+    def _queued(self):
+        """在持有 _cond 时调用: 等待发送的消息数 (不含重新入堆后遗留的旧条目)"""
+        return sum(1 for due, _, message in self._heap if due == message.due)
+
+    def pending(self):
+        with self._cond:
+            return self._queued() + self._inflight
+
+    def drain(self, timeout=30):
+        """立即发送所有待合并的消息并等待发送完成 (进程退出前调用)；返回是否全部发送"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            now = time.monotonic()
+            for message in list(self._open.values()):
+                self._push(message, now)
+            self._open.clear()
+            while self._queued() or self._inflight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+        return True
+
+def _post_card(token, user_id, content, log_tag, session=None):
+    """
+    发送卡片消息
+    API: POST /open-apis/im/v1/messages
+    :param content: 已渲染的卡片 JSON 字符串
+    :return: 是否需要重试 (网络异常 / 限流 / 服务端错误 / Token 失效)
+    """
+    url = open_api_url("im/v1/messages")
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json; charset=utf-8"
@@ -65,81 +275,77 @@ def send_success_notification(user_id, file_name, nas_path=None, team_paths=None
     body = {
         "receive_id": user_id,
         "msg_type": "interactive",
-        "content": json.dumps(card_content)
+        "content": content
     }
 
     try:
-        resp = requests.post(url, headers=headers, params=params, json=body)
-        if resp.status_code != 200:
-             logger.error(f"[消息发送失败] {resp.json()}")
-        else:
-             logger.info(f"[消息发送成功] 通知已发送给用户 {user_id}")
+        resp = api_request("POST", "im.message.create", url, headers=headers, params=params, json=body,
+                           session=session, timeout=10)
     except Exception as e:
-        logger.error(f"[消息发送异常] {e}")
+        logger.error(f"[{log_tag}发送异常] {e}")
+        return True
+    if resp.status_code == 200:
+        logger.info(f"[{log_tag}发送成功] 已通知用户 {user_id}")
+        return False
+    try:
+        data = resp.json()
+    except ValueError:
+        data = {}
+    logger.error(f"[{log_tag}发送失败] {data or resp.status_code}")
+    if data.get("code") in _TOKEN_INVALID_CODES:
+        invalidate_tenant_access_token()
+        return True
+    return resp.status_code == 429 or resp.status_code >= 500
+
+# 全局单例
+notification_dispatcher = NotificationDispatcher()
+
+registry.gauge("feishu_notification_queue_depth", "待发送的卡片消息数 (含等待合并)",
+               callback=notification_dispatcher.pending)
+
+def send_success_notification(user_id, file_name, nas_path=None, team_paths=None, pending_archive=False):
+    """
+    发送下载成功通知卡片 (入队，同一用户短时间内的多条通知合并为一张汇总卡片)
+    :param team_paths: list of str, 例如 ["Skyris技术部门", "Skyris管理层"]
+    :param pending_archive: 个人归档未成功、已加入归档重试队列
+    """
+    notification_dispatcher.submit("success", user_id, {
+        "file_name": file_name,
+        "nas_path": nas_path,
+        "team_paths": list(team_paths) if team_paths else None,
+        "pending_archive": pending_archive,
+    })
 
 def send_auth_failed_notification(user_id, meeting_id=None):
     """
     发送授权失败/过期通知，引导用户重新授权
-    meeting_id: 这里传入是为了在用户点击授权时，透传回 callback 进行补发下载
+    meeting_id: 记录为待补录会议，用户重新授权后补发下载
+    同一用户在 AUTH_NOTICE_WINDOW 秒内只发送一次 (记录持久化，重启 / 多副本后仍然有效)，
+    期间错过的会议累计到同一张卡片的授权链接中
     """
-    token = get_tenant_access_token()
-    if not token:
+    config = load_config()
+    try:
+        send, missed = auth_notice_store.register(user_id, meeting_id, config["auth_notice_window"])
+    except Exception as e:
+        logger.error(f"[授权失败通知] 读取发送记录失败，直接发送: {e}")
+        send, missed = True, [meeting_id] if meeting_id else []
+    if not send:
+        AUTH_NOTICES.inc("suppressed")
+        logger.info(f"[授权失败通知] 用户 {user_id} 近期已通知过，本次不再发送 (待补录会议 {len(missed)} 个)")
         return
-    
+    AUTH_NOTICES.inc("sent")
+
     # 优先从环境变量获取外部地址，否则使用默认 (用户请求的 IP)
     # TODO: 这里写死了 IP，最好放到 Config 里
-    base_url = os.getenv("EXTERNAL_URL", "http://223.254.147.69:29090") 
-    
-    # 构建带 meeting_id 的授权链接
-    auth_url = f"{base_url}/auth/start"
-    if meeting_id:
-        auth_url += f"?meeting_id={meeting_id}"
-
-    card_content = {
-        "config": { "wide_screen_mode": True },
-        "header": {
-            "template": "red",
-            "title": { "content": "❌ 自动归档失败 (需要重新授权)", "tag": "plain_text" }
-        },
-        "elements": [
-            {
-                "tag": "div",
-                "text": {
-                    "content": f"检测到您的飞书授权已失效或 Token 已过期，机器人无法自动下载会议录制。\n\n请点击下方按钮重新授权：",
-                    "tag": "plain_text"
-                }
-            },
-            {
-                "tag": "action",
-                "actions": [
-                    {
-                        "tag": "button",
-                        "text": { "content": "🔐 点击重新授权", "tag": "plain_text" },
-                        "type": "primary",
-                        "url": auth_url
-                    }
-                ]
-            }
-        ]
-    }
+    base_url = os.getenv("EXTERNAL_URL", "http://223.254.147.69:29090")
 
-    url = "https://open.feishu.cn/open-apis/im/v1/messages"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json; charset=utf-8"
-    }
-    params = {"receive_id_type": "user_id"}
-    body = {
-        "receive_id": user_id,
-        "msg_type": "interactive",
-        "content": json.dumps(card_content)
-    }
+    # 授权回调时按用户取出全部待补录会议 (包括发卡片之后才错过的)
+    auth_url = f"{base_url}/auth/start?remedy=1"
 
-    try:
-        resp = requests.post(url, headers=headers, params=params, json=body)
-        if resp.status_code != 200:
-             logger.error(f"[授权失败通知发送失败] {resp.json()}")
-        else:
-             logger.info(f"[授权失败通知发送成功] 已通知用户 {user_id}")
-    except Exception as e:
-        logger.error(f"[授权失败通知发送异常] {e}")
+    notification_dispatcher.submit("auth_failed", user_id, {"auth_url": auth_url, "missed": len(missed)})
+
+def send_archive_followup_notification(user_id, file_name, nas_path):
+    """
+    补归档成功通知 (文件此前滞留在服务器下载目录，现已移动到 NAS 个人目录)
+    """
+    notification_dispatcher.submit("archive_followup", user_id, {"file_name": file_name, "nas_path": nas_path})
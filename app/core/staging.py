@@ -0,0 +1,226 @@
+import os
+import time
+import shutil
+import asyncio
+import threading
+from contextlib import contextmanager
+from app.utils.logger import logger
+from app.utils.config import load_config
+from app.utils.exceptions import DownloadError, JobInterrupted
+from app.utils.metrics import registry, DISK_ADMISSION_WAIT, STAGING_EVICTIONS
+from app.data.archive_queue import archive_queue
+from app.data.archive_index import archive_index
+from app.data.recording_catalog import recording_catalog
+from app.core.lifecycle import lifecycle
+
+# 空间不足时多久重新检查一次 (秒)；有下载结束时会提前唤醒
+RECHECK_INTERVAL = 15
+# 超过该时间且不属于任何进行中下载的 .downloading 文件视为残留 (秒)
+ORPHAN_TEMP_AGE = 3600
+TEMP_SUFFIX = ".downloading"
+# 退出时中断的下载: 临时文件旁的断点记录 (<临时文件>.resume)，保留期内不清理，等待续传
+RESUME_SUFFIX = ".resume"
+RESUME_RETENTION = 86400
+
+class _Reservation:
+    def __init__(self, size, temp_path):
+        self.size = size
+        self.temp_path = temp_path
+
+class StagingArea:
+    """
+    下载目录 (DOWNLOAD_PATH) 的磁盘空间管理
+    - 准入控制: 下载前按预计文件大小预留空间，剩余空间 (扣除进行中下载尚未写入的部分) 低于 DISK_MIN_FREE
+      或下载目录超出 STAGING_QUOTA 时排队等待，而不是写到一半磁盘满导致所有下载一起失败
+    - 空间不足时按最久未使用顺序清理: 残留的临时文件、内容已有其他归档副本的文件
+      (等待补归档的文件是个人归档的唯一来源，不会被清理)
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._reservations = []
+        self._config = None
+
+    def _get_config(self):
+        if self._config is None:
+            config = load_config()
+            self._config = {
+                "path": config.get("download_path", "./downloads"),
+                "min_free": config["disk_min_free"],
+                "quota": config["staging_quota"],
+                "default_size": config["disk_default_reservation"],
+                "timeout": config["disk_wait_timeout"],
+            }
+        return self._config
+
+    def _outstanding(self):
+        """进行中的下载还需要写入的字节数 (预留大小 - 临时文件已写入的大小)"""
+        total = 0
+        for r in self._reservations:
+            try:
+                written = os.path.getsize(r.temp_path)
+            except OSError:
+                written = 0
+            total += max(r.size - written, 0)
+        return total
+
+    def usage(self):
+        """下载目录当前占用的字节数"""
+        total = 0
+        try:
+            with os.scandir(self._get_config()["path"]) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False):
+                        total += entry.stat().st_size
+        except OSError:
+            pass
+        return total
+
+    def reserved(self):
+        with self._cond:
+            return self._outstanding()
+
+    def _shortfall(self, size):
+        """在持有 _cond 时调用: 放行 size 字节的下载还差多少空间 (<= 0 表示可以放行)"""
+        config = self._get_config()
+        os.makedirs(config["path"], exist_ok=True)
+        needed = self._outstanding() + size
+        shortfall = config["min_free"] + needed - shutil.disk_usage(config["path"]).free
+        if config["quota"] > 0:
+            shortfall = max(shortfall, self.usage() + needed - config["quota"])
+        return shortfall
+
+    def _try_reserve(self, size, temp_path):
+        with self._cond:
+            shortfall = self._shortfall(size)
+            if shortfall > 0:
+                shortfall -= self.evict(shortfall)
+            if shortfall > 0:
+                return None
+            reservation = _Reservation(size, temp_path)
+            self._reservations.append(reservation)
+            return reservation
+
+    def _on_wait(self, size, started, warned):
+        if not lifecycle.accepting():
+            raise JobInterrupted("进程正在退出，取消等待磁盘空间")
+        if not warned:
+            logger.warning(f"[磁盘空间] 空间不足，下载排队等待 (预留 {size / 1024 / 1024:.0f}MB, "
+                           f"进行中 {len(self._reservations)} 个)")
+        if time.monotonic() - started > self._get_config()["timeout"]:
+            raise DownloadError(f"等待磁盘空间超时 (需要 {size} 字节)")
+
+    @contextmanager
+    def reserve(self, expected_size, temp_path):
+        """
+        预留下载所需的磁盘空间 (阻塞等待)
+        :param expected_size: 探测到的文件大小，None 时按 DISK_DEFAULT_RESERVATION 预留
+        """
+        size = expected_size or self._get_config()["default_size"]
+        started = time.monotonic()
+        warned = False
+        reservation = self._try_reserve(size, temp_path)
+        while reservation is None:
+            self._on_wait(size, started, warned)
+            warned = True
+            with self._cond:
+                self._cond.wait(timeout=RECHECK_INTERVAL)
+            reservation = self._try_reserve(size, temp_path)
+        DISK_ADMISSION_WAIT.observe(value=time.monotonic() - started)
+        try:
+            yield
+        finally:
+            self.release(reservation)
+
+    async def async_reserve(self, expected_size, temp_path):
+        """协程版本: 等待期间不占用线程，返回预留记录，用完后调用 release"""
+        size = expected_size or self._get_config()["default_size"]
+        started = time.monotonic()
+        warned = False
+        reservation = await asyncio.to_thread(self._try_reserve, size, temp_path)
+        while reservation is None:
+            self._on_wait(size, started, warned)
+            warned = True
+            await asyncio.sleep(RECHECK_INTERVAL)
+            reservation = await asyncio.to_thread(self._try_reserve, size, temp_path)
+        DISK_ADMISSION_WAIT.observe(value=time.monotonic() - started)
+        return reservation
+
+    def release(self, reservation):
+        with self._cond:
+            if reservation in self._reservations:
+                self._reservations.remove(reservation)
+            self._cond.notify_all()
+
+    def wake(self):
+        """唤醒等待空间的下载 (进程退出时让它们立即结束等待)"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def _eviction_candidates(self):
+        """可清理的文件 [(最近使用时间, 路径, 大小, 原因)]"""
+        active = {r.temp_path for r in self._reservations}
+        pending = archive_queue.paths()
+        now = time.time()
+        candidates = []
+        try:
+            with os.scandir(self._get_config()["path"]) as it:
+                entries = [e for e in it if e.is_file(follow_symlinks=False)]
+        except OSError:
+            return candidates
+        for entry in entries:
+            path = entry.path
+            stat = entry.stat()
+            last_used = max(stat.st_atime, stat.st_mtime)
+            if path.endswith(TEMP_SUFFIX):
+                # 进程崩溃 / 强制退出留下的临时文件；有断点记录的在保留期内等待续传
+                age = ORPHAN_TEMP_AGE
+                if os.path.exists(path + RESUME_SUFFIX):
+                    age = RESUME_RETENTION
+                if path not in active and now - stat.st_mtime > age:
+                    candidates.append((last_used, path, stat.st_size, "orphan"))
+                continue
+            if path.endswith(RESUME_SUFFIX):
+                continue
+            if path in pending:
+                continue
+            sha256 = archive_index.get_hash_by_path(path)
+            if not sha256:
+                # 未登记的文件来源不明，不自动删除
+                continue
+            if any(p != path for p in archive_index.get_paths(sha256)):
+                candidates.append((last_used, path, stat.st_size, "archived"))
+        candidates.sort()
+        return candidates
+
+    def evict(self, need_bytes):
+        """按最久未使用顺序清理文件，直到释放 need_bytes 字节；返回实际释放的字节数"""
+        freed = 0
+        for _, path, size, reason in self._eviction_candidates():
+            if freed >= need_bytes:
+                break
+            if reason == "archived":
+                sha256 = archive_index.get_hash_by_path(path)
+                others = [p for p in archive_index.get_paths(sha256) if p != path] if sha256 else []
+                if not others:
+                    continue
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"[磁盘空间] 清理失败 {path}: {e}")
+                continue
+            if reason == "orphan" and os.path.exists(path + RESUME_SUFFIX):
+                os.remove(path + RESUME_SUFFIX)
+            if reason == "archived":
+                archive_index.remove_path(path)
+                recording_catalog.update_personal_path(path, others[0])
+            freed += size
+            STAGING_EVICTIONS.inc(reason)
+            logger.info(f"[磁盘空间] 已清理 {path} ({size} 字节, {reason})")
+        return freed
+
+# 全局单例
+staging_area = StagingArea()
+lifecycle.add_drain_hook(staging_area.wake)
+
+registry.gauge("feishu_staging_bytes", "下载目录占用的字节数", callback=staging_area.usage)
+registry.gauge("feishu_disk_reserved_bytes", "进行中下载预留但尚未写入的字节数", callback=staging_area.reserved)
@@ -0,0 +1,106 @@
+import os
+import time
+import sqlite3
+import threading
+from app.utils.logger import logger
+
+# 内容寻址索引: 与 Token 一样存放在 user_token 目录 (已持久化)
+DATA_DIR = "user_token"
+INDEX_DB = os.path.join(DATA_DIR, "archive_index.db")
+
+class ArchiveIndex:
+    """
+    已归档文件的内容索引 (SQLite)
+    - content_paths: sha256 -> 归档路径 (一个内容可对应多个路径: 个人目录 + 团队目录)
+    - object_tokens: 妙记 object_token -> sha256
+    """
+    def __init__(self, db_path=INDEX_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _get_conn(self):
+        # 第一次使用时才创建数据库，避免 import 时就访问磁盘
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS content_paths (
+                    sha256 TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER,
+                    created_at INTEGER,
+                    PRIMARY KEY (sha256, path)
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_content_path ON content_paths(path)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS object_tokens (
+                    object_token TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    created_at INTEGER
+                )""")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get_hash_by_token(self, object_token):
+        with self._lock:
+            row = self._get_conn().execute(
+                "SELECT sha256 FROM object_tokens WHERE object_token = ?", (object_token,)).fetchone()
+        return row[0] if row else None
+
+    def get_paths(self, sha256, existing_only=True):
+        """返回该内容已归档的路径列表 (默认只返回磁盘上仍然存在的)"""
+        with self._lock:
+            rows = self._get_conn().execute(
+                "SELECT path FROM content_paths WHERE sha256 = ? ORDER BY created_at", (sha256,)).fetchall()
+        paths = [r[0] for r in rows]
+        if existing_only:
+            paths = [p for p in paths if os.path.exists(p)]
+        return paths
+
+    def has_path(self, path):
+        with self._lock:
+            row = self._get_conn().execute(
+                "SELECT 1 FROM content_paths WHERE path = ? LIMIT 1", (path,)).fetchone()
+        return row is not None
+
+    def get_hash_by_path(self, path):
+        with self._lock:
+            row = self._get_conn().execute(
+                "SELECT sha256 FROM content_paths WHERE path = ? LIMIT 1", (path,)).fetchone()
+        return row[0] if row else None
+
+    def record(self, sha256, paths, size=None, object_token=None):
+        """登记一次归档结果"""
+        now = int(time.time())
+        with self._lock:
+            conn = self._get_conn()
+            for p in paths:
+                conn.execute(
+                    "INSERT OR REPLACE INTO content_paths (sha256, path, size, created_at) VALUES (?, ?, ?, ?)",
+                    (sha256, p, size, now))
+            if object_token:
+                conn.execute(
+                    "INSERT OR REPLACE INTO object_tokens (object_token, sha256, created_at) VALUES (?, ?, ?)",
+                    (object_token, sha256, now))
+            conn.commit()
+        logger.debug(f"[内容索引] 已登记 {sha256[:12]} -> {paths}")
+
+    def replace_path(self, old_path, new_path):
+        """文件被移动后更新路径 (例如归档重试线程把文件从下载目录移到 NAS)"""
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute("UPDATE OR REPLACE content_paths SET path = ? WHERE path = ?", (new_path, old_path))
+            conn.commit()
+
+    def remove_path(self, path):
+        """文件被删除后移除路径 (例如下载目录清理已有其他副本的文件)"""
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute("DELETE FROM content_paths WHERE path = ?", (path,))
+            conn.commit()
+
+# 全局单例
+archive_index = ArchiveIndex()
@@ -0,0 +1,114 @@
+import json
+import os
+import time
+import threading
+from app.utils.logger import logger
+
+# 归档重试队列与 Token 一样存放在 user_token 目录 (已通过 Docker Volume 持久化)
+DATA_DIR = "user_token"
+QUEUE_FILE = os.path.join(DATA_DIR, "archive_queue.json")
+lock = threading.Lock()
+
+class ArchiveQueue:
+    """
+    NAS 个人归档失败的文件队列
+    结构: { 本地文件路径: {user_id, user_name, meeting_id, file_name, attempts, ...} }
+    目录在第一次写入时才创建，import 时不访问磁盘
+    """
+    def add(self, file_path, user_id, user_name, meeting_id=None, reason="", retry_after=0):
+        """登记一个待归档文件 (同一路径重复登记只更新信息)"""
+        with lock:
+            items = self._load()
+            now = int(time.time())
+            entry = items.get(file_path, {"attempts": 0, "created_at": now})
+            entry.update({
+                "file_name": os.path.basename(file_path),
+                "user_id": user_id,
+                "user_name": user_name,
+                "meeting_id": meeting_id,
+                "last_error": reason,
+                "next_retry_at": now + int(retry_after),
+            })
+            items[file_path] = entry
+            self._save(items)
+        logger.info(f"[归档重试队列] 已登记: {file_path} ({reason})")
+
+    def remove(self, file_path):
+        with lock:
+            items = self._load()
+            if items.pop(file_path, None) is not None:
+                self._save(items)
+
+    def mark_failed(self, file_path, reason, retry_after):
+        """记录一次失败的重试，并设置下次重试时间"""
+        with lock:
+            items = self._load()
+            entry = items.get(file_path)
+            if not entry:
+                return
+            entry["attempts"] = entry.get("attempts", 0) + 1
+            entry["last_error"] = reason
+            entry["next_retry_at"] = int(time.time()) + int(retry_after)
+            self._save(items)
+
+    def reset_schedule(self):
+        """映射表更新 / NAS 恢复时调用: 所有条目立即可重试"""
+        with lock:
+            items = self._load()
+            now = int(time.time())
+            for entry in items.values():
+                entry["next_retry_at"] = now
+            self._save(items)
+
+    def retry_now(self, meeting_id):
+        """管理接口: 该会议的待归档文件立即可重试；返回这些文件的路径"""
+        with lock:
+            items = self._load()
+            now = int(time.time())
+            paths = [p for p, e in items.items() if e.get("meeting_id") == meeting_id]
+            for path in paths:
+                items[path]["next_retry_at"] = now
+            if paths:
+                self._save(items)
+        return paths
+
+    def due_items(self, limit):
+        """返回已到重试时间的条目 [(file_path, entry), ...]，按登记时间排序"""
+        with lock:
+            items = self._load()
+        now = int(time.time())
+        due = [(p, e) for p, e in items.items() if e.get("next_retry_at", 0) <= now]
+        due.sort(key=lambda x: x[1].get("created_at", 0))
+        return due[:limit]
+
+    def items(self):
+        """所有待归档条目 {file_path: entry}"""
+        with lock:
+            return self._load()
+
+    def paths(self):
+        """所有待归档文件的路径"""
+        with lock:
+            return set(self._load())
+
+    def size(self):
+        with lock:
+            return len(self._load())
+
+    def _load(self):
+        try:
+            with open(QUEUE_FILE, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, FileNotFoundError):
+            return {}
+
+    def _save(self, items):
+        # 先写临时文件再替换，避免进程中断导致队列文件损坏
+        os.makedirs(DATA_DIR, exist_ok=True)
+        tmp_file = QUEUE_FILE + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(items, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_file, QUEUE_FILE)
+
+# 全局单例
+archive_queue = ArchiveQueue()
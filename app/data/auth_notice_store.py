@@ -0,0 +1,86 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# 与 Token 一样存放在 user_token 目录 (已持久化，多副本共享)
+DATA_DIR = "user_token"
+NOTICE_DB = os.path.join(DATA_DIR, "auth_notices.db")
+# 每个用户最多记录的待补录会议数
+MAX_MISSED_MEETINGS = 100
+
+class AuthNoticeStore:
+    """
+    授权失效通知记录 (SQLite)
+    - last_sent_at: 上次给该用户发送授权失效卡片的时间，用于限制发送频率 (重启 / 多副本后仍然有效)
+    - missed: 授权失效期间错过的会议，用户重新授权后一次性补录
+    """
+    def __init__(self, db_path=NOTICE_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _get_conn(self):
+        # 第一次使用时才创建数据库，避免 import 时就访问磁盘
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            # isolation_level=None: 手动 BEGIN IMMEDIATE，多副本同时判断是否发送时不会都发
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=10)
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS auth_notices (
+                    user_id TEXT PRIMARY KEY,
+                    last_sent_at REAL NOT NULL DEFAULT 0,
+                    missed TEXT NOT NULL DEFAULT '[]',
+                    suppressed INTEGER NOT NULL DEFAULT 0
+                )""")
+            self._conn = conn
+        return self._conn
+
+    def register(self, user_id, meeting_id, window):
+        """
+        登记一次授权失效
+        返回: (是否应该发送通知, 当前待补录的会议列表)
+        距上次发送不足 window 秒时不发送，只记录会议并累计被抑制的次数
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT last_sent_at, missed, suppressed FROM auth_notices WHERE user_id = ?",
+                                   (user_id,)).fetchone()
+                last_sent_at, missed, suppressed = (row[0], json.loads(row[1]), row[2]) if row else (0, [], 0)
+                if meeting_id and meeting_id not in missed:
+                    missed = (missed + [meeting_id])[-MAX_MISSED_MEETINGS:]
+                send = now - last_sent_at >= window
+                if send:
+                    last_sent_at = now
+                else:
+                    suppressed += 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO auth_notices (user_id, last_sent_at, missed, suppressed) VALUES (?, ?, ?, ?)",
+                    (user_id, last_sent_at, json.dumps(missed), suppressed))
+                conn.execute("COMMIT")
+                return send, missed
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def pop_missed(self, user_id):
+        """用户重新授权: 取出待补录的会议并清除记录 (之后再失效会立即通知)"""
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT missed FROM auth_notices WHERE user_id = ?", (user_id,)).fetchone()
+                conn.execute("DELETE FROM auth_notices WHERE user_id = ?", (user_id,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return json.loads(row[0]) if row else []
+
+# 全局单例
+auth_notice_store = AuthNoticeStore()
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+from app.utils.logger import logger
+
+# 持久化模式下的事件暂存库: 与 Token 一样存放在 user_token 目录 (已持久化)
+DATA_DIR = "user_token"
+QUEUE_DB = os.path.join(DATA_DIR, "event_queue.db")
+
+class EventQueue:
+    """
+    Webhook 事件收件箱
+    请求线程只负责把原始请求体放进队列，由后台消费线程解析并分发
+    - 默认仅保存在内存中 (进程退出时未处理的事件丢失，飞书已收到 200 不会重推)
+    - durable=True 时先写入 SQLite 再入内存队列，消费完成后删除，重启后自动重放未处理的事件
+    - 处理失败的事件按退避时间重新入队，超过最大次数后移入死信 (持久化模式下为 dead_events 表，否则只记录日志)
+    """
+    def __init__(self, db_path=QUEUE_DB):
+        self.db_path = db_path
+        self._queue = None
+        self._durable = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def configure(self, max_size, durable=False):
+        """创建内存队列；持久化模式下重放上次未处理完的事件"""
+        with self._lock:
+            if self._queue is not None:
+                return
+            self._queue = queue.Queue(maxsize=max_size)
+            self._durable = durable
+        if durable:
+            self._replay()
+
+    def _get_conn(self):
+        # 第一次使用时才创建数据库，避免 import 时就访问磁盘
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL 下 NORMAL 只在 checkpoint 时 fsync，写入一条事件只需一次追加
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    body BLOB NOT NULL,
+                    headers TEXT,
+                    received_at REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0
+                )""")
+            # 旧版本创建的表没有 attempts 列
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(events)")]
+            if "attempts" not in columns:
+                conn.execute("ALTER TABLE events ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dead_events (
+                    id INTEGER PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    headers TEXT,
+                    received_at REAL,
+                    attempts INTEGER,
+                    error TEXT,
+                    failed_at REAL
+                )""")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _replay(self):
+        with self._lock:
+            rows = self._get_conn().execute(
+                "SELECT id, body, headers, received_at, attempts FROM events ORDER BY id").fetchall()
+        for item_id, body, headers, received_at, attempts in rows:
+            try:
+                self._queue.put_nowait((item_id, bytes(body), json.loads(headers or "{}"), received_at, attempts))
+            except queue.Full:
+                logger.warning("[事件队列] 待重放事件超过队列容量，剩余事件下次启动时处理")
+                break
+        if rows:
+            logger.info(f"[事件队列] 重放上次未处理的事件 {len(rows)} 个")
+
+    def put(self, body, headers=None):
+        """
+        事件入队 (在 Webhook 请求线程中调用，不做任何解析)
+        返回: 是否成功入队；队列已满返回 False (由调用方返回 503，飞书稍后重推)
+        """
+        if self._queue.full():
+            return False
+        received_at = time.time()
+        item_id = None
+        if self._durable:
+            with self._lock:
+                conn = self._get_conn()
+                cursor = conn.execute(
+                    "INSERT INTO events (body, headers, received_at) VALUES (?, ?, ?)",
+                    (body, json.dumps(headers or {}), received_at))
+                conn.commit()
+                item_id = cursor.lastrowid
+        try:
+            self._queue.put_nowait((item_id, body, headers or {}, received_at, 0))
+        except queue.Full:
+            self.ack(item_id)
+            return False
+        return True
+
+    def get(self, timeout=None):
+        """取出一个事件: (item_id, body, headers, received_at, attempts)；超时返回 None"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def ack(self, item_id):
+        """事件处理完成 (持久化模式下从暂存库删除)"""
+        if item_id is None:
+            return
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute("DELETE FROM events WHERE id = ?", (item_id,))
+            conn.commit()
+
+    def retry(self, item, delay):
+        """
+        处理失败: 记录失败次数，delay 秒后重新入队
+        持久化模式下失败次数写入暂存库，进程在等待期间退出时重启后照常重放
+        """
+        item_id, body, headers, received_at, attempts = item
+        attempts += 1
+        if item_id is not None:
+            with self._lock:
+                conn = self._get_conn()
+                conn.execute("UPDATE events SET attempts = ? WHERE id = ?", (attempts, item_id))
+                conn.commit()
+        # 重新入队时队列可能已满，在 Timer 线程中阻塞等待，不占用消费线程
+        t = threading.Timer(float(delay), self._queue.put, args=((item_id, body, headers, received_at, attempts),))
+        t.daemon = True
+        t.start()
+
+    def dead_letter(self, item, error):
+        """多次处理失败的事件: 持久化模式下移入 dead_events 表 (供人工排查后重新投递)，否则只记录日志"""
+        item_id, body, headers, received_at, attempts = item
+        if item_id is None:
+            logger.error(f"[事件队列] 事件处理失败 {attempts + 1} 次，已放弃: {error} | {body[:500]!r}")
+            return
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO dead_events (id, body, headers, received_at, attempts, error, failed_at) "
+                "SELECT id, body, headers, received_at, ?, ?, ? FROM events WHERE id = ?",
+                (attempts + 1, str(error), time.time(), item_id))
+            conn.execute("DELETE FROM events WHERE id = ?", (item_id,))
+            conn.commit()
+        logger.error(f"[事件队列] 事件处理失败 {attempts + 1} 次，已移入死信表 dead_events (id: {item_id}): {error}")
+
+    def ready(self):
+        """消费线程是否已启动 (未启动时 Webhook 回退到同步处理)"""
+        return self._queue is not None
+
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+# 全局单例
+event_queue = EventQueue()
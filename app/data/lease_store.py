@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from app.utils.logger import logger
+from app.utils.config import load_config
+
+class LeaseStore:
+    """
+    多副本任务租约 (SQLite)
+    - running: 某个副本正在处理，expires_at 之前由持有者心跳续期；过期后其他副本可以接管
+    - done: 已处理完成，在保留期内拒绝重复认领 (飞书重推 / 多个副本同时收到事件)
+    """
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _get_conn(self):
+        # 第一次使用时才创建数据库，避免 import 时就访问磁盘
+        if self._conn is None:
+            # 租约库必须放在所有副本共享的卷上 (默认 user_token/leases.db)
+            if not self.db_path:
+                self.db_path = load_config()["lease_db_path"]
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            # isolation_level=None: 手动 BEGIN IMMEDIATE，认领时先拿写锁再判断，避免两个副本同时认领成功
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=10)
+            # 共享卷可能是 NFS / SMB，不使用依赖共享内存的 WAL 模式
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    payload TEXT,
+                    updated_at REAL
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_lease_state ON leases(state, expires_at)")
+            self._conn = conn
+        return self._conn
+
+    def acquire(self, key, owner, ttl, payload=None, reclaim_done=False):
+        """
+        认领任务
+        成功条件: 无记录 / 自己持有 / 他人租约已过期 / (reclaim_done 时) 已完成
+        返回: (是否成功, 原持有者)；原持有者非空且不是自己表示接管了过期租约
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT owner, state, expires_at FROM leases WHERE key = ?", (key,)).fetchone()
+                if row:
+                    prev_owner, state, expires_at = row
+                    if state == "done" and not reclaim_done:
+                        conn.execute("ROLLBACK")
+                        return False, prev_owner
+                    if state == "running" and prev_owner != owner and expires_at > now:
+                        conn.execute("ROLLBACK")
+                        return False, prev_owner
+                else:
+                    prev_owner = None
+                conn.execute(
+                    "INSERT OR REPLACE INTO leases (key, owner, state, expires_at, payload, updated_at) "
+                    "VALUES (?, ?, 'running', ?, ?, ?)",
+                    (key, owner, now + ttl, json.dumps(payload or {}, ensure_ascii=False), now))
+                conn.execute("COMMIT")
+                return True, prev_owner
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def renew(self, keys, owner, ttl):
+        """心跳: 续期自己持有的租约；返回已不再属于自己的 key (被接管或已删除)"""
+        if not keys:
+            return []
+        now = time.time()
+        lost = []
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for key in keys:
+                    cursor = conn.execute(
+                        "UPDATE leases SET expires_at = ?, updated_at = ? "
+                        "WHERE key = ? AND owner = ? AND state = 'running'",
+                        (now + ttl, now, key, owner))
+                    if cursor.rowcount == 0:
+                        lost.append(key)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return lost
+
+    def complete(self, key, owner, retention):
+        """任务处理完成: 标记为 done，保留期内拒绝重复认领"""
+        now = time.time()
+        with self._lock:
+            self._get_conn().execute(
+                "UPDATE leases SET state = 'done', expires_at = ?, updated_at = ? WHERE key = ? AND owner = ?",
+                (now + retention, now, key, owner))
+
+    def suspend(self, key, owner, payload):
+        """
+        保存断点并立即释放租约 (进程退出时任务未完成)
+        租约置为已过期，任意副本 (包括重启后的本副本) 在下一次接管扫描时按 payload 恢复任务
+        """
+        now = time.time()
+        with self._lock:
+            self._get_conn().execute(
+                "UPDATE leases SET expires_at = 0, payload = ?, updated_at = ? "
+                "WHERE key = ? AND owner = ? AND state = 'running'",
+                (json.dumps(payload, ensure_ascii=False), now, key, owner))
+
+    def delete(self, key, owner):
+        """放弃租约 (任务未完成，允许之后重新认领)"""
+        with self._lock:
+            self._get_conn().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def expired(self, limit=20):
+        """已过期的 running 租约 (持有者已宕机或失联): [(key, owner, payload)]"""
+        with self._lock:
+            rows = self._get_conn().execute(
+                "SELECT key, owner, payload FROM leases WHERE state = 'running' AND expires_at < ? "
+                "ORDER BY expires_at LIMIT ?", (time.time(), limit)).fetchall()
+        result = []
+        for key, owner, payload in rows:
+            try:
+                result.append((key, owner, json.loads(payload or "{}")))
+            except ValueError:
+                logger.warning(f"[租约] 无法解析租约数据: {key}")
+        return result
+
+    def purge_done(self):
+        """清理超过保留期的 done 记录"""
+        with self._lock:
+            cursor = self._get_conn().execute(
+                "DELETE FROM leases WHERE state = 'done' AND expires_at < ?", (time.time(),))
+        return cursor.rowcount
+
+# 全局单例
+lease_store = LeaseStore()
@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from app.utils.logger import logger
+
+# 归档目录 (Catalog): 与 Token 一样存放在 user_token 目录 (已持久化)
+DATA_DIR = "user_token"
+CATALOG_DB = os.path.join(DATA_DIR, "recording_catalog.db")
+
+# 允许作为查询条件的精确匹配字段 (均已建索引)
+EXACT_FILTERS = ("meeting_id", "object_token", "owner_id", "sha256")
+
+class RecordingCatalog:
+    """
+    已归档录制的目录 (SQLite)，每个 object_token 一条记录
+    用于运维查询 (/api/recordings)，替代遍历 /nas_data 和 grep 日志
+    """
+    def __init__(self, db_path=CATALOG_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _get_conn(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS recordings (
+                    object_token TEXT PRIMARY KEY,
+                    meeting_id TEXT,
+                    owner_id TEXT,
+                    owner_name TEXT,
+                    topic TEXT,
+                    start_time INTEGER,
+                    duration INTEGER,
+                    size INTEGER,
+                    personal_path TEXT,
+                    team_paths TEXT,
+                    sha256 TEXT,
+                    archived_at INTEGER
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rec_meeting ON recordings(meeting_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rec_owner_start ON recordings(owner_id, start_time)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rec_start ON recordings(start_time)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rec_sha256 ON recordings(sha256)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rec_personal_path ON recordings(personal_path)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def upsert(self, object_token, meeting_id=None, owner_id=None, owner_name=None, topic=None,
+               start_time=None, duration=None, size=None, personal_path=None, team_paths=None, sha256=None):
+        """登记 / 更新一条归档记录"""
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute("""
+                INSERT OR REPLACE INTO recordings
+                (object_token, meeting_id, owner_id, owner_name, topic, start_time, duration, size,
+                 personal_path, team_paths, sha256, archived_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (object_token, meeting_id, owner_id, owner_name, topic, start_time, duration, size,
+                 personal_path, json.dumps(team_paths or [], ensure_ascii=False), sha256, int(time.time())))
+            conn.commit()
+        logger.debug(f"[归档目录] 已登记: {object_token} -> {personal_path}")
+
+    def update_personal_path(self, old_path, new_path):
+        """文件被移动后更新路径 (例如归档重试线程补归档)"""
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute("UPDATE recordings SET personal_path = ? WHERE personal_path = ?", (new_path, old_path))
+            conn.commit()
+
+    def has_meeting(self, meeting_id):
+        with self._lock:
+            row = self._get_conn().execute(
+                "SELECT 1 FROM recordings WHERE meeting_id = ? LIMIT 1", (meeting_id,)).fetchone()
+        return row is not None
+
+    def query(self, filters=None, start_from=None, start_to=None, topic=None, page=1, page_size=20):
+        """
+        分页查询归档记录，按会议开始时间倒序
+        :param filters: 精确匹配条件 {字段: 值}，字段限定为 EXACT_FILTERS
+        :param topic: 会议主题模糊匹配
+        返回: (记录列表, 总数)
+        """
+        where = []
+        args = []
+        for key, value in (filters or {}).items():
+            if key in EXACT_FILTERS and value:
+                where.append(f"{key} = ?")
+                args.append(value)
+        if start_from is not None:
+            where.append("start_time >= ?")
+            args.append(int(start_from))
+        if start_to is not None:
+            where.append("start_time < ?")
+            args.append(int(start_to))
+        if topic:
+            where.append("topic LIKE ?")
+            args.append(f"%{topic}%")
+        where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+
+        with self._lock:
+            conn = self._get_conn()
+            total = conn.execute(f"SELECT COUNT(*) FROM recordings {where_sql}", args).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM recordings {where_sql} ORDER BY start_time DESC LIMIT ? OFFSET ?",
+                args + [page_size, (page - 1) * page_size]).fetchall()
+
+        items = []
+        for row in rows:
+            item = dict(row)
+            item["team_paths"] = json.loads(item["team_paths"] or "[]")
+            items.append(item)
+        return items, total
+
+# 全局单例
+recording_catalog = RecordingCatalog()
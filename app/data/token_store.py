@@ -10,17 +10,10 @@ TOKEN_FILE = os.path.join(DATA_DIR, "user_tokens.json")
 lock = threading.Lock()
 
 class TokenStore:
-    def __init__(self):
-        # 确保 user_token 目录存在
-        if not os.path.exists(DATA_DIR):
-            os.makedirs(DATA_DIR)
-        self._ensure_file_exists()
-
-    def _ensure_file_exists(self):
-        if not os.path.exists(TOKEN_FILE):
-            with open(TOKEN_FILE, "w") as f:
-                json.dump({}, f)
-
+    """
+    用户 Token 存储 (JSON 文件)
+    目录和文件在第一次保存 Token 时才创建 (文件不存在视为没有 Token)，import 时不访问磁盘
+    """
     def save_user_token(self, user_id, token_data):
         """保存用户的 Token"""
         with lock:
@@ -28,6 +21,7 @@ class TokenStore:
             # 记录保存时间，方便计算过期
             token_data['updated_at'] = int(time.time())
             tokens[user_id] = token_data
+            os.makedirs(DATA_DIR, exist_ok=True)
             with open(TOKEN_FILE, "w") as f:
                 json.dump(tokens, f, indent=4)
             logger.info(f"[TokenStore] 已保存用户 {user_id} 的 Token")
@@ -38,6 +32,11 @@ class TokenStore:
             tokens = self._load_tokens()
             return tokens.get(user_id)
 
+    def list_user_ids(self):
+        """所有已授权用户的 user_id (历史补录等批量任务使用)"""
+        with lock:
+            return list(self._load_tokens().keys())
+
     def _load_tokens(self):
         try:
             with open(TOKEN_FILE, "r") as f:
@@ -1,9 +1,19 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 # 加载 .env 文件
 load_dotenv()
 
+def parse_size(text):
+    """容量 / 带宽字符串 -> 字节数 (带宽为 字节/秒): "10M" / "512K" / "1G" / "10MB/s" / "1048576"""
+    # 先去掉 "/S" 后缀再去掉一个 "B" ("10MB/s" -> "10M")
+    text = str(text).strip().upper().removesuffix("/S").removesuffix("B")
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text or 0))
+
 def load_config():
     """
     读取环境变量配置 (支持 .env 文件)
@@ -14,5 +24,90 @@ def load_config():
         # 不再使用加密 Key
         "encrypt_key": "", 
         "verification_token": os.getenv("APP_VERIFICATION_TOKEN", os.getenv("VERIFICATION_TOKEN")),
-        "download_path": os.getenv("DOWNLOAD_PATH", "./downloads")
+        "download_path": os.getenv("DOWNLOAD_PATH", "./downloads"),
+        # 飞书开放平台域名 (私有化部署 / Lark 国际版 / 本地压测 Stub 时修改)
+        "feishu_base_url": os.getenv("FEISHU_BASE_URL", "https://open.feishu.cn").rstrip("/"),
+        # 会议详情 / 录制信息 / 媒体下载链接的缓存时间 (秒，0 为不缓存；下载链接不超过其签名有效期)
+        "api_cache_ttl": float(os.getenv("API_CACHE_TTL", "600")),
+        # Webhook 快速确认: 请求线程只校验 Token 并入队，SDK 解析和事件处理由后台线程完成
+        "webhook_fast_ack": os.getenv("WEBHOOK_FAST_ACK", "1").strip().lower() not in ("0", "false", "no", "off"),
+        "event_queue_max_size": int(os.getenv("EVENT_QUEUE_MAX_SIZE", "10000")),
+        # 事件队列持久化到 SQLite (重启后重放未处理的事件)
+        "event_queue_durable": os.getenv("EVENT_QUEUE_DURABLE", "0").strip().lower() in ("1", "true", "yes", "on"),
+        "event_consumer_threads": int(os.getenv("EVENT_CONSUMER_THREADS", "2")),
+        # 事件处理失败的最大尝试次数 / 首次重试前的等待时间 (秒，按 2 倍递增，最长 5 分钟)
+        "event_max_attempts": int(os.getenv("EVENT_MAX_ATTEMPTS", "5")),
+        "event_retry_backoff": float(os.getenv("EVENT_RETRY_BACKOFF", "5")),
+        # 多副本协调: 副本标识 (默认 主机名-进程号) / 租约共享库 / 租约有效期 (秒，持有者每 1/3 周期心跳续期)
+        "replica_id": os.getenv("REPLICA_ID") or f"{socket.gethostname()}-{os.getpid()}",
+        "lease_db_path": os.getenv("LEASE_DB_PATH", "user_token/leases.db"),
+        "lease_ttl": float(os.getenv("LEASE_TTL", "60")),
+        # 已完成的会议在多长时间内拒绝重复处理 (秒)
+        "lease_done_retention": int(os.getenv("LEASE_DONE_RETENTION", str(7 * 86400))),
+        # 全局下载带宽上限 (字节/秒，如 10M，0 为不限) 与分时段配置，例如 "mon-fri 09:00-18:00=10M; 18:00-09:00=0"
+        "bandwidth_limit": parse_size(os.getenv("BANDWIDTH_LIMIT", "0")),
+        "bandwidth_schedule": os.getenv("BANDWIDTH_SCHEDULE", ""),
+        # 历史补录: 并发处理的会议数 / 补录下载总带宽 (字节/秒，0 为不限)，避免挤占实时归档
+        "backfill_concurrency": int(os.getenv("BACKFILL_CONCURRENCY", "2")),
+        "backfill_bandwidth": parse_size(os.getenv("BACKFILL_BANDWIDTH", "5M")),
+        # 收到会议结束事件后，第一次查询录制前的等待时间 (秒)
+        "poll_initial_delay": float(os.getenv("POLL_INITIAL_DELAY", "30")),
+        # 执行模式: thread (默认，每个任务一个线程) / async (事件循环线程 + 协程，适合大量会议同时等待录制)
+        "execution_mode": os.getenv("EXECUTION_MODE", "thread").strip().lower(),
+        # 下载调度: 同时下载的录制文件数上限 (兼容旧的 ASYNC_MAX_DOWNLOADS)
+        "download_concurrency": int(os.getenv("DOWNLOAD_CONCURRENCY", os.getenv("ASYNC_MAX_DOWNLOADS", "8"))),
+        # 调度策略: fair (优先级 + Owner 公平轮转，默认) / fifo (按到达顺序)
+        "download_policy": os.getenv("DOWNLOAD_POLICY", "fair").strip().lower(),
+        # 排队超过该时间 (秒) 的下载任务提升为最高优先级，避免大文件 / 补录任务饿死
+        "download_aging_seconds": float(os.getenv("DOWNLOAD_AGING_SECONDS", "600")),
+        # 预计文件小的优先下载 (先用 Range 请求探测 Content-Length)
+        "download_sjf": os.getenv("DOWNLOAD_SJF", "0").strip().lower() in ("1", "true", "yes", "on"),
+        # 下载卡顿检测: 连续 DOWNLOAD_READ_TIMEOUT 秒收不到数据，或最近 DOWNLOAD_STALL_WINDOW 秒平均速度
+        # 低于 DOWNLOAD_STALL_RATE (不含限速等待) 时断开，重新获取下载链接并从已写入的位置续传，最多重连 N 次
+        "download_read_timeout": float(os.getenv("DOWNLOAD_READ_TIMEOUT", "60")),
+        "download_stall_rate": parse_size(os.getenv("DOWNLOAD_STALL_RATE", "32K")),
+        "download_stall_window": float(os.getenv("DOWNLOAD_STALL_WINDOW", "120")),
+        "download_stall_retries": int(os.getenv("DOWNLOAD_STALL_RETRIES", "3")),
+        # Linux 上对明文 HTTP 的媒体流使用 splice 零拷贝写入 (需要 Python 3.10+；HTTPS / 不支持时自动使用普通写入)
+        "download_zero_copy": os.getenv("DOWNLOAD_ZERO_COPY", "0").strip().lower() in ("1", "true", "yes", "on"),
+        # 下载完成后校验 MP4 结构 (box 完整、存在 moov / mdat)；MP4_FASTSTART=1 时把文件末尾的 moov 原地移到开头
+        "mp4_verify": os.getenv("MP4_VERIFY", "1").strip().lower() not in ("0", "false", "no", "off"),
+        "mp4_faststart": os.getenv("MP4_FASTSTART", "0").strip().lower() in ("1", "true", "yes", "on"),
+        # 下载目录磁盘空间: 至少保留的剩余空间 / 下载目录总配额 (0 为不限) / 无法探测文件大小时预留的空间
+        "disk_min_free": parse_size(os.getenv("DISK_MIN_FREE", "2G")),
+        "staging_quota": parse_size(os.getenv("STAGING_QUOTA", "0")),
+        "disk_default_reservation": parse_size(os.getenv("DISK_DEFAULT_RESERVATION", "1G")),
+        # 等待磁盘空间的最长时间 (秒)，超时后下载失败
+        "disk_wait_timeout": float(os.getenv("DISK_WAIT_TIMEOUT", str(6 * 3600))),
+        # 卡片通知: 同一用户多条通知的合并窗口 (秒，0 为不合并) / 发送线程数 / 全局发送速率 (条/秒) / 失败重试次数
+        "notify_digest_window": float(os.getenv("NOTIFY_DIGEST_WINDOW", "10")),
+        "notify_workers": int(os.getenv("NOTIFY_WORKERS", "2")),
+        "notify_rate": float(os.getenv("NOTIFY_RATE", "5")),
+        "notify_max_retries": int(os.getenv("NOTIFY_MAX_RETRIES", "3")),
+        # 同一用户授权失效通知的最短间隔 (秒)，期间错过的会议合并到同一张卡片
+        "auth_notice_window": int(os.getenv("AUTH_NOTICE_WINDOW", str(6 * 3600))),
+        # 收到 SIGTERM 后等待进行中的下载完成的最长时间 (秒)，超时的下载保存断点后退出
+        # 需小于容器的停止等待时间 (docker-compose stop_grace_period)
+        "shutdown_timeout": float(os.getenv("SHUTDOWN_TIMEOUT", "90")),
+        # 就绪检查 (/readyz): 结果缓存时间(秒) / 单项探测超时(秒) / Token 存储读取与 NAS stat 的耗时上限(毫秒) /
+        # 等待下载名额的任务数上限，超过时副本报告未就绪
+        "health_cache_ttl": float(os.getenv("HEALTH_CACHE_TTL", "10")),
+        "health_probe_timeout": float(os.getenv("HEALTH_PROBE_TIMEOUT", "2")),
+        "health_slow_ms": float(os.getenv("HEALTH_SLOW_MS", "500")),
+        "health_max_backlog": int(os.getenv("HEALTH_MAX_BACKLOG", "50")),
+        # 运维接口 (/api/recordings 等) 的访问令牌，未配置时运维接口不可用
+        "admin_token": os.getenv("ADMIN_TOKEN", ""),
+        # 归档重试队列: 扫描间隔(秒) / 每批处理数量 / 两次移动之间的间隔(秒)
+        "archive_retry_interval": int(os.getenv("ARCHIVE_RETRY_INTERVAL", "300")),
+        "archive_retry_batch_size": int(os.getenv("ARCHIVE_RETRY_BATCH_SIZE", "5")),
+        "archive_retry_move_interval": float(os.getenv("ARCHIVE_RETRY_MOVE_INTERVAL", "2")),
+        # 日志: 默认级别 / 按模块设置级别 (如 "downloader=DEBUG,waitress=ERROR") / 格式 text 或 json (JSON Lines)
+        # LOG_ASYNC=1 (默认) 时日志由后台线程格式化和写入，打日志的线程只入队
+        "log_level": os.getenv("LOG_LEVEL", "INFO"),
+        "log_levels": os.getenv("LOG_LEVELS", ""),
+        "log_format": os.getenv("LOG_FORMAT", "text").strip().lower(),
+        "log_async": os.getenv("LOG_ASYNC", "1").strip().lower() not in ("0", "false", "no", "off"),
+        # 任务耗时追踪: 内存中保留最近 N 个任务; 配置文件路径后同时写入 JSON Lines
+        "trace_buffer_size": int(os.getenv("TRACE_BUFFER_SIZE", "500")),
+        "trace_log_file": os.getenv("TRACE_LOG_FILE", ""),
     }
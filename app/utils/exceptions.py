@@ -9,3 +9,23 @@ class TokenExpiredError(FeishuDownloaderError):
 class DownloadError(FeishuDownloaderError):
     """Raised when download fails"""
     pass
+
+class DownloadStalled(DownloadError):
+    """Raised when a download stream stays below the minimum throughput for the stall window"""
+    pass
+
+class MediaCorrupted(DownloadError):
+    """Raised when a downloaded media file is truncated or its MP4 box structure is invalid"""
+    pass
+
+class JobCancelled(DownloadError):
+    """Raised when a download is cancelled through the admin job-control API"""
+    pass
+
+class LeaseUnavailable(FeishuDownloaderError):
+    """Raised when the shared lease store keeps failing while claiming a meeting (the caller should retry later)"""
+    pass
+
+class JobInterrupted(FeishuDownloaderError):
+    """Raised when a job is stopped by graceful shutdown (its progress is checkpointed for resume)"""
+    pass
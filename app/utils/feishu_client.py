@@ -1,31 +1,95 @@
+import time
+import threading
 import requests
-import lark_oapi as lark
 from app.utils.config import load_config
 from app.utils.logger import logger
+from app.utils.metrics import API_REQUESTS, API_LATENCY
+
+def open_api_url(path):
+    """
+    拼接 OpenAPI 完整地址，例如 open_api_url("im/v1/messages")
+    域名由 FEISHU_BASE_URL 配置 (默认 https://open.feishu.cn，压测时可指向本地 Stub Server)
+    """
+    return f"{load_config()['feishu_base_url']}/open-apis/{path}"
+
+def api_request(method, endpoint, url, **kwargs):
+    """
+    调用飞书 OpenAPI 并记录耗时与返回码指标
+    :param endpoint: 指标中的接口名 (如 "vc.meeting.recording")，不要带 ID 等高基数字段
+    :param session: 可选的 requests.Session (复用连接池)，默认每次新建连接
+    其余参数原样传给 requests.request，返回 requests.Response
+    """
+    session = kwargs.pop("session", None) or requests
+    started = time.perf_counter()
+    try:
+        resp = session.request(method, url, **kwargs)
+    except Exception:
+        API_LATENCY.observe(endpoint, value=time.perf_counter() - started)
+        API_REQUESTS.inc(endpoint, "exception")
+        raise
+    API_LATENCY.observe(endpoint, value=time.perf_counter() - started)
+    API_REQUESTS.inc(endpoint, response_code(resp))
+    return resp
+
+def response_code(resp):
+    """
+    指标中的返回码: 优先使用业务 code (如 99991677 Token 过期)，无法解析时使用 HTTP 状态码
+    同时适用于 requests 和 httpx 的 Response
+    """
+    code = str(resp.status_code)
+    if "json" in resp.headers.get("Content-Type", ""):
+        try:
+            code = str(resp.json().get("code", code))
+        except (ValueError, AttributeError):
+            pass
+    return code
+
+# Tenant Token 缓存 (有效期 2 小时，提前 5 分钟刷新)
+_tenant_token = {"token": None, "expires_at": 0}
+_tenant_token_lock = threading.Lock()
+TENANT_TOKEN_REFRESH_MARGIN = 300
 
 def get_tenant_access_token():
     """
     获取 tenant access token (用于机器人发消息)
+    Token 在有效期内缓存复用，不再每次发消息都请求一次
     """
-    config = load_config()
-    # 虽然这里构建了 Client，但主要是为了配置，实际请求用的 requests raw call
-    # 也可以直接用 client.auth.v3.tenant_access_token.internal(...) 如果版本匹配
-    
-    url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
-    headers = {"Content-Type": "application/json; charset=utf-8"}
-    body = {
-        "app_id": config.get("app_id"),
-        "app_secret": config.get("app_secret")
-    }
-    
-    try:
-        resp = requests.post(url, headers=headers, json=body)
-        data = resp.json()
-        if data.get("code") == 0:
-            return data.get("tenant_access_token")
-        else:
-            logger.error(f"[Tenant Token Error] {data}")
-            return None
-    except Exception as e:
-         logger.error(f"[Tenant Token Exception] {e}")
-         return None
+    with _tenant_token_lock:
+        if _tenant_token["token"] and time.time() < _tenant_token["expires_at"]:
+            return _tenant_token["token"]
+
+        config = load_config()
+        url = open_api_url("auth/v3/tenant_access_token/internal")
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        body = {
+            "app_id": config.get("app_id"),
+            "app_secret": config.get("app_secret")
+        }
+
+        try:
+            resp = api_request("POST", "auth.tenant_access_token", url, headers=headers, json=body)
+            data = resp.json()
+            if data.get("code") == 0:
+                token = data.get("tenant_access_token")
+                expire = int(data.get("expire", 7200))
+                _tenant_token["token"] = token
+                _tenant_token["expires_at"] = time.time() + max(expire - TENANT_TOKEN_REFRESH_MARGIN, 60)
+                return token
+            else:
+                logger.error(f"[Tenant Token Error] {data}")
+                return None
+        except Exception as e:
+             logger.error(f"[Tenant Token Exception] {e}")
+             return None
+
+def tenant_token_expires_in():
+    """缓存的 tenant access token 距离刷新的剩余秒数 (没有缓存时为 0)"""
+    if not _tenant_token["token"]:
+        return 0
+    return max(_tenant_token["expires_at"] - time.time(), 0)
+
+def invalidate_tenant_access_token():
+    """接口返回 Token 无效时调用，下次获取时重新请求"""
+    with _tenant_token_lock:
+        _tenant_token["token"] = None
+        _tenant_token["expires_at"] = 0
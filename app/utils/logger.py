@@ -1,33 +1,136 @@
 import os
+import json
+import time
+import queue
+import atexit
 import logging
 import logging.handlers
+from app.utils.config import load_config
+
+# 日志上下文提供者: 返回要附加到每条日志上的字段 (例如当前任务的 job_id / meeting_id)
+# 由 tracing 等模块注册，避免 logger 反向依赖这些模块
+_context_providers = []
+
+def add_context_provider(provider):
+    """注册日志上下文提供者: provider() -> dict (在打日志的线程 / 协程中调用)"""
+    _context_providers.append(provider)
+
+class ContextFilter(logging.Filter):
+    """
+    在打日志的线程中执行: 附加任务上下文字段，并按模块过滤日志级别
+    (所有模块共用一个 logger，按记录的源文件模块名 record.module 区分，例如 downloader / event_handler)
+    """
+    def __init__(self, default_level=logging.INFO, module_levels=None):
+        super().__init__()
+        self.default_level = default_level
+        self.module_levels = module_levels or {}
+
+    def filter(self, record):
+        if record.levelno < self.module_levels.get(record.module, self.default_level):
+            return False
+        for provider in _context_providers:
+            try:
+                for key, value in (provider() or {}).items():
+                    setattr(record, key, value)
+            except Exception:
+                pass
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """JSON Lines 格式，每行一条日志，附带 job_id / meeting_id 等上下文字段"""
+    CONTEXT_FIELDS = ("job_id", "meeting_id", "owner_id", "backfill_job")
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "module": record.module,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key in self.CONTEXT_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+def parse_levels(text):
+    """ "downloader=DEBUG,waitress=ERROR" -> {"downloader": 10, "waitress": 40}"""
+    levels = {}
+    for part in filter(None, (p.strip() for p in (text or "").split(","))):
+        name, _, level = part.partition("=")
+        level = logging.getLevelName(level.strip().upper())
+        if isinstance(level, int):
+            levels[name.strip()] = level
+    return levels
+
+def setup_logger(name=__name__, async_mode=None, log_format=None, log_file=None):
+    """
+    创建应用 logger
+    默认 (LOG_ASYNC=1) 日志调用只把记录放入队列，格式化和写文件 / 控制台由后台线程完成，
+    下载 / 轮询 / Webhook 线程不会因为磁盘 I/O 和 Handler 锁而阻塞
+    :param async_mode / log_format / log_file: 覆盖配置 (压测对比用)
+    """
+    config = load_config()
+    async_mode = config["log_async"] if async_mode is None else async_mode
+    log_format = log_format or config["log_format"]
 
-def setup_logger(name=__name__):
     # 确保日志目录存在
-    log_dir = "logs"
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
+    if log_file is None:
+        log_dir = "logs"
+        if not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+        log_file = os.path.join(log_dir, "app.log")
 
-    log_file = os.path.join(log_dir, "app.log")
-    
     # 防止重复添加 Handler
     logger = logging.getLogger(name)
     if not logger.handlers:
-        logger.setLevel(logging.INFO)
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        
+        # LOG_LEVELS 中的模块名同时作为第三方库的 logger 名 (例如 waitress=ERROR)
+        module_levels = parse_levels(config["log_levels"])
+        for module_name, level in module_levels.items():
+            if module_name != name:
+                logging.getLogger(module_name).setLevel(level)
+        base_level = logging.getLevelName(config["log_level"].upper())
+        base_level = base_level if isinstance(base_level, int) else logging.INFO
+        # logger 本身放行到最低的模块级别，再由 ContextFilter 按模块过滤
+        logger.setLevel(min([base_level] + list(module_levels.values())))
+
+        if log_format == "json":
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
         file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=10*1024*1024, backupCount=5, encoding='utf-8')
         file_handler.setFormatter(formatter)
-        
+
         stream_handler = logging.StreamHandler()
         stream_handler.setFormatter(formatter)
-        
-        logger.addHandler(file_handler)
-        logger.addHandler(stream_handler)
+
+        context_filter = ContextFilter(base_level, module_levels)
+        if async_mode:
+            log_queue = queue.SimpleQueue()
+            queue_handler = logging.handlers.QueueHandler(log_queue)
+            queue_handler.addFilter(context_filter)
+            logger.addHandler(queue_handler)
+            listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler,
+                                                      respect_handler_level=True)
+            listener.start()
+            # 进程退出前写完队列中剩余的日志
+            atexit.register(listener.stop)
+            logger.listener = listener
+        else:
+            file_handler.addFilter(context_filter)
+            stream_handler.addFilter(context_filter)
+            logger.addHandler(file_handler)
+            logger.addHandler(stream_handler)
 
         # 禁止日志传播到 Root Logger，防止控制台出现重复日志
         logger.propagate = False
-        
+
     return logger
 
 # 创建一个默认的 logger 供模块直接使用
@@ -0,0 +1,237 @@
+import bisect
+import threading
+
+# 默认直方图分桶 (秒)，覆盖从几毫秒的 API 调用到数十分钟的大文件下载
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 1800)
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"{self.name} 需要标签 {self.label_names}，实际传入 {labels}")
+        return tuple(str(v) for v in labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._render_samples())
+        return lines
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    metric_type = "counter"
+
+    def __init__(self, name, documentation, label_names=()):
+        super().__init__(name, documentation, label_names)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        if not items and not self.label_names:
+            items = [((), 0)]
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+class Gauge(_Metric):
+    """
+    可增可减的瞬时值
+    也可以传入 callback，在 /metrics 被抓取时才计算 (例如线程数、队列深度)，平时零开销
+    """
+    metric_type = "gauge"
+
+    def __init__(self, name, documentation, label_names=(), callback=None):
+        super().__init__(name, documentation, label_names)
+        self._values = {}
+        self._callback = callback
+
+    def set(self, *labels, value):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def _render_samples(self):
+        if self._callback is not None:
+            try:
+                return [f"{self.name} {_format_value(self._callback())}"]
+            except Exception:
+                return []
+        with self._lock:
+            items = list(self._values.items())
+        if not items and not self.label_names:
+            items = [((), 0)]
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+class Histogram(_Metric):
+    """固定分桶直方图 (observe 只做一次二分查找 + 加锁累加)"""
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, *labels, value):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各分桶计数..., +Inf 计数], sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_samples(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = _format_labels(self.label_names, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=(), callback=None):
+        return self._register(Gauge(name, documentation, label_names, callback))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def render(self):
+        """Prometheus 文本格式 (text/plain; version=0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# 全局单例
+registry = MetricsRegistry()
+
+# --- 业务指标定义 (集中在这里，便于查阅) ---
+WEBHOOK_EVENTS = registry.counter(
+    "feishu_webhook_events_total", "收到的会议结束事件数", ("result",))
+EVENT_QUEUE_WAIT = registry.histogram(
+    "feishu_event_queue_wait_seconds", "Webhook 事件从确认到开始分发的排队时间")
+EVENT_DISPATCH_LATENCY = registry.histogram(
+    "feishu_event_dispatch_seconds", "Webhook 事件解析 + 处理耗时 (后台消费线程)")
+EVENT_DISPATCH_FAILURES = registry.counter(
+    "feishu_event_dispatch_failures_total", "Webhook 事件处理失败 (retried 稍后重试 / dead_lettered 放弃)", ("result",))
+LEASE_EVENTS = registry.counter(
+    "feishu_lease_events_total", "多副本会议租约事件 (acquired / rejected / takeover / lost / store_error)", ("result",))
+POLL_ATTEMPTS = registry.counter(
+    "feishu_recording_poll_attempts_total", "录制状态轮询次数", ("result",))
+POLL_ATTEMPTS_PER_MEETING = registry.histogram(
+    "feishu_recording_poll_attempts_per_meeting", "单个会议轮询到录制就绪 / 放弃所用的次数", ("result",),
+    buckets=(1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11))
+API_REQUESTS = registry.counter(
+    "feishu_api_requests_total", "飞书 OpenAPI 调用次数 (按接口和返回码)", ("endpoint", "code"))
+API_LATENCY = registry.histogram(
+    "feishu_api_latency_seconds", "飞书 OpenAPI 调用耗时", ("endpoint",))
+API_CACHE = registry.counter(
+    "feishu_api_cache_total",
+    "飞书 API 查询缓存 (hit: 命中 / coalesced: 等待进行中的同一请求 / miss: 实际调用)", ("cache", "result"))
+TOKEN_REFRESHES = registry.counter(
+    "feishu_user_token_refreshes_total", "用户 Token 刷新次数", ("result",))
+DOWNLOAD_BYTES = registry.counter(
+    "feishu_download_bytes_total", "录制文件下载字节数")
+DOWNLOAD_DURATION = registry.histogram(
+    "feishu_download_duration_seconds", "单个录制文件下载耗时", ("result",))
+DOWNLOAD_THROUGHPUT = registry.histogram(
+    "feishu_download_throughput_bytes_per_second", "单个录制文件平均下载速度",
+    buckets=(64e3, 256e3, 1e6, 4e6, 10e6, 25e6, 50e6, 100e6, 250e6))
+NAS_OPERATION_LATENCY = registry.histogram(
+    "feishu_nas_operation_seconds", "NAS 文件移动 / 复制 / 硬链接耗时", ("op",))
+HEALTH_PROBE_LATENCY = registry.histogram(
+    "feishu_health_probe_seconds", "就绪检查各项探测耗时", ("check",))
+NOTIFICATION_LATENCY = registry.histogram(
+    "feishu_notification_seconds", "卡片消息发送耗时 (含获取 Tenant Token)", ("type",))
+NOTIFICATIONS = registry.counter(
+    "feishu_notifications_total", "卡片消息发送结果 (合并后的条数)", ("type", "result"))
+AUTH_NOTICES = registry.counter(
+    "feishu_auth_failed_notices_total", "授权失效通知 (sent: 已发送 / suppressed: 窗口期内被抑制)", ("result",))
+DOWNLOAD_STALLS = registry.counter(
+    "feishu_download_stalls_total",
+    "下载连接卡顿 / 中断次数 (slow: 速度过低 / timeout: 读超时 / disconnect: 连接断开)", ("reason",))
+DOWNLOAD_SINK = registry.counter(
+    "feishu_download_sink_total",
+    "媒体流写入方式 (splice: 零拷贝 / buffered: 经过用户态缓冲区)", ("sink",))
+MEDIA_CHECKS = registry.counter(
+    "feishu_media_checks_total",
+    "下载后的录制文件检查 (valid: 结构完整 / invalid: 不完整 / faststart: 已把 moov 移到文件开头 / "
+    "faststart_skipped: 无法改写)", ("result",))
+DOWNLOAD_QUEUE_WAIT = registry.histogram(
+    "feishu_download_queue_wait_seconds", "下载任务等待调度名额的时间 (按优先级)", ("priority",))
+DISK_ADMISSION_WAIT = registry.histogram(
+    "feishu_disk_admission_wait_seconds", "下载前等待磁盘空间预留的时间")
+STAGING_EVICTIONS = registry.counter(
+    "feishu_staging_evictions_total", "下载目录清理的文件数 (orphan: 残留临时文件 / archived: 已有其他副本)", ("reason",))
+SHUTDOWN_CHECKPOINTS = registry.counter(
+    "feishu_shutdown_checkpoints_total",
+    "退出时保存断点的任务数 (poll: 等待录制 / queued: 等待下载名额 / download: 下载中断)", ("kind",))
+ACTIVE_DOWNLOADS = registry.gauge(
+    "feishu_active_downloads", "正在下载的录制数")
+registry.gauge(
+    "feishu_live_threads", "进程内存活线程数", callback=threading.active_count)
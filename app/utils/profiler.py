@@ -0,0 +1,203 @@
+import os
+import re
+import sys
+import time
+import threading
+import traceback
+import tracemalloc
+from collections import Counter
+from app.utils.logger import logger
+from app.utils.tracing import tracer
+
+# 采样间隔默认值 / 下限 (秒)
+DEFAULT_INTERVAL = 0.01
+MIN_INTERVAL = 0.001
+# 采样最长持续时间 (秒)，忘记停止时自动结束，避免一直占用 CPU
+MAX_DURATION = 600
+# tracemalloc 默认保存的调用栈深度
+DEFAULT_MALLOC_FRAMES = 10
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _thread_group(name):
+    """按线程名归类 (去掉编号)，同一类线程合并到火焰图的同一个根节点，例如 waitress-3 -> waitress"""
+    return re.sub(r"-\d+", "", name or "unknown")
+
+class SamplingProfiler:
+    """
+    采样 CPU 分析: 后台线程按固定间隔读取所有线程的调用栈 (sys._current_frames)，
+    统计每个调用栈出现的次数，输出 collapsed stack 格式 (flamegraph.pl / speedscope 可直接打开)
+    未启动时没有任何开销；采样中只有采样线程在工作，不修改其他线程
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stacks = Counter()
+        self._labels = {}
+        self._samples = 0
+        self._interval = DEFAULT_INTERVAL
+        self._started_at = None
+        self._stopped_at = None
+
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=DEFAULT_INTERVAL, duration=MAX_DURATION):
+        """开始采样，清空上一次的结果；已在采样时返回 False"""
+        with self._lock:
+            if self.running():
+                return False
+            self._interval = max(float(interval), MIN_INTERVAL)
+            self._stacks = Counter()
+            self._samples = 0
+            self._started_at = time.time()
+            self._stopped_at = None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(min(float(duration), MAX_DURATION),),
+                                            name="profiler-sampler", daemon=True)
+            self._thread.start()
+        logger.info(f"[Profiler] 开始采样 (间隔 {self._interval * 1000:.1f}ms)")
+        return True
+
+    def stop(self):
+        """停止采样 (未在采样时直接返回上一次的结果)"""
+        with self._lock:
+            thread = self._thread
+            self._stop.set()
+        if thread is not None:
+            thread.join()
+        return self.collapsed()
+
+    def _frame_label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            if path.startswith(PROJECT_ROOT):
+                path = os.path.relpath(path, PROJECT_ROOT)
+            else:
+                path = "/".join(path.replace("\\", "/").split("/")[-2:])
+            label = self._labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+        return label
+
+    def _run(self, duration):
+        own = threading.get_ident()
+        deadline = time.monotonic() + duration
+        while not self._stop.wait(self._interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(_thread_group(names.get(ident)))
+                stack.reverse()
+                self._stacks[";".join(stack)] += 1
+            self._samples += 1
+            if time.monotonic() > deadline:
+                logger.info("[Profiler] 达到最长采样时间，自动停止")
+                break
+        self._stopped_at = time.time()
+        logger.info(f"[Profiler] 采样结束，共 {self._samples} 次")
+
+    def collapsed(self):
+        """collapsed stack 文本: 每行 "线程;外层函数;...;内层函数 次数" """
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self._stacks.items()))
+
+    def status(self):
+        return {
+            "running": self.running(),
+            "interval_ms": round(self._interval * 1000, 3),
+            "samples": self._samples,
+            "stacks": len(self._stacks),
+            "started_at": int(self._started_at) if self._started_at else None,
+            "stopped_at": int(self._stopped_at) if self._stopped_at else None,
+        }
+
+class MemoryProfiler:
+    """
+    tracemalloc 内存快照对比
+    tracemalloc 开启后每次内存分配都有额外开销，因此默认关闭，排查时手动开启，用完关闭
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline = None
+
+    def start(self, frames=DEFAULT_MALLOC_FRAMES):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                logger.info(f"[Profiler] 开启 tracemalloc (栈深度 {frames})")
+            self._baseline = tracemalloc.take_snapshot()
+
+    def stop(self):
+        with self._lock:
+            self._baseline = None
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                logger.info("[Profiler] 关闭 tracemalloc")
+
+    def snapshot_diff(self, limit=30, key_type="lineno"):
+        """
+        与上一次快照 (或开启时的基线) 对比，返回增长最多的分配位置，并把当前快照作为下一次的基线
+        :param key_type: lineno / filename / traceback
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing() or self._baseline is None:
+                return None
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            stats = snapshot.compare_to(self._baseline, key_type)
+            self._baseline = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [{
+                "size_diff": s.size_diff,
+                "size": s.size,
+                "count_diff": s.count_diff,
+                "count": s.count,
+                "traceback": [f"{f.filename}:{f.lineno}" for f in s.traceback],
+            } for s in stats[:limit]],
+        }
+
+    def status(self):
+        traced, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {"tracing": tracemalloc.is_tracing(), "traced_bytes": traced, "peak_bytes": peak}
+
+def thread_dump():
+    """所有线程的当前调用栈，并标注正在处理的归档任务 (会议 ID / Owner / 当前阶段)"""
+    frames = sys._current_frames()
+    jobs = tracer.thread_jobs()
+    threads = []
+    for t in threading.enumerate():
+        frame = frames.get(t.ident)
+        entry = {
+            "name": t.name,
+            "ident": t.ident,
+            "daemon": t.daemon,
+            "stack": traceback.format_stack(frame) if frame is not None else [],
+        }
+        trace = jobs.get(t.ident)
+        if trace is not None:
+            entry["job"] = {
+                "job_id": trace.job_id,
+                "meeting_id": trace.meeting_id,
+                "owner_id": trace.owner_id,
+                "running_for": round(trace.duration, 3),
+                "open_stages": trace.open_stages,
+                "last_stage": trace.last_stage,
+                "attrs": trace.attrs,
+            }
+        threads.append(entry)
+    threads.sort(key=lambda e: ("job" not in e, e["name"]))
+    return threads
+
+# 全局单例
+sampling_profiler = SamplingProfiler()
+memory_profiler = MemoryProfiler()
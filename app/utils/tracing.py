@@ -0,0 +1,219 @@
+import json
+import time
+import uuid
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from app.utils.config import load_config
+from app.utils.logger import logger, add_context_provider
+
+class Trace:
+    """
+    单个会议归档任务的耗时记录
+    从收到会议结束事件开始，到发送通知卡片结束，每个阶段记录为一个 span
+    """
+    def __init__(self, meeting_id, owner_id):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.meeting_id = meeting_id
+        self.owner_id = owner_id
+        self.started_at = time.time()
+        self.status = "running"
+        self.attrs = {}
+        self._t0 = time.perf_counter()
+        self._duration = None
+        self._open = {}
+        # [(name, 相对开始时间, 耗时, attrs)]
+        self.spans = []
+
+    def begin(self, name):
+        """开始一个跨线程的 span (例如等待录制生成，跨越多个 Timer 线程)"""
+        self._open.setdefault(name, time.perf_counter())
+
+    def end(self, name, **attrs):
+        started = self._open.pop(name, None)
+        if started is not None:
+            self.spans.append((name, started - self._t0, time.perf_counter() - started, attrs))
+
+    @contextmanager
+    def span(self, name, **attrs):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((name, started - self._t0, time.perf_counter() - started, attrs))
+
+    def finish(self, status):
+        # 未结束的 span 以当前时间结束
+        for name in list(self._open):
+            self.end(name, unfinished=True)
+        self.status = status
+        self._duration = time.perf_counter() - self._t0
+
+    @property
+    def open_stages(self):
+        """尚未结束的跨线程阶段 (例如 wait_recording)"""
+        return list(self._open)
+
+    @property
+    def last_stage(self):
+        return self.spans[-1][0] if self.spans else None
+
+    @property
+    def duration(self):
+        return self._duration if self._duration is not None else time.perf_counter() - self._t0
+
+    def to_dict(self):
+        breakdown = {}
+        for name, _, cost, _ in self.spans:
+            breakdown[name] = round(breakdown.get(name, 0.0) + cost, 3)
+        return {
+            "job_id": self.job_id,
+            "meeting_id": self.meeting_id,
+            "owner_id": self.owner_id,
+            "started_at": int(self.started_at),
+            "status": self.status,
+            "duration": round(self.duration, 3),
+            "attrs": self.attrs,
+            "breakdown": breakdown,
+            "spans": [
+                {"name": n, "offset": round(o, 3), "duration": round(d, 3), "attrs": a}
+                for n, o, d, a in self.spans
+            ],
+        }
+
+class Tracer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 当前绑定的 Trace: 使用 ContextVar 而不是 threading.local，
+        # 这样在 asyncio 执行模式下每个协程任务 (以及 asyncio.to_thread) 都能拿到自己的 Trace
+        self._current = contextvars.ContextVar("feishu_trace", default=None)
+        # meeting_id -> 进行中的 Trace
+        self._active = {}
+        # 线程 ident -> 该线程当前处理的 Trace (线程转储时标注线程在处理哪个任务)
+        self._threads = {}
+        self._completed = None
+        self._log_file = None
+        self._finish_hooks = []
+
+    def add_finish_hook(self, hook):
+        """注册任务结束时执行的回调 hook(trace)，由各模块在 import 时注册"""
+        self._finish_hooks.append(hook)
+
+    def _ensure_config(self):
+        if self._completed is None:
+            config = load_config()
+            self._completed = deque(maxlen=config["trace_buffer_size"])
+            self._log_file = config["trace_log_file"] or None
+
+    def start(self, meeting_id, owner_id):
+        """获取会议进行中的 Trace，没有则新建，并绑定到当前线程 / 协程"""
+        with self._lock:
+            trace = self._active.get(meeting_id)
+            if trace is None:
+                trace = self._active[meeting_id] = Trace(meeting_id, owner_id)
+        self._current.set(trace)
+        if not _in_event_loop():
+            # 事件循环线程同时执行多个任务的协程，不按线程标注
+            self._threads[threading.get_ident()] = trace
+        return trace
+
+    def detach(self):
+        """解除当前线程与 Trace 的绑定 (线程会被复用时调用，例如 Waitress 工作线程)"""
+        self._current.set(None)
+        self._threads.pop(threading.get_ident(), None)
+
+    def current(self):
+        return self._current.get()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """在当前线程绑定的 Trace 上记录一个 span；未绑定时不做任何事"""
+        trace = self.current()
+        if trace is None:
+            yield
+            return
+        with trace.span(name, **attrs):
+            yield
+
+    def begin(self, name):
+        """在当前线程绑定的 Trace 上开始一个阶段 (适合中途有多个 return 的代码段)"""
+        trace = self.current()
+        if trace is not None:
+            trace.begin(name)
+
+    def end(self, name, **attrs):
+        trace = self.current()
+        if trace is not None:
+            trace.end(name, **attrs)
+
+    def annotate(self, **attrs):
+        trace = self.current()
+        if trace is not None:
+            trace.attrs.update(attrs)
+
+    def finish(self, status):
+        """结束当前线程绑定的 Trace，写入环形缓冲区 (以及可选的 JSON Lines 文件)"""
+        trace = self.current()
+        if trace is None:
+            return
+        self._current.set(None)
+        if self._threads.get(threading.get_ident()) is trace:
+            self._threads.pop(threading.get_ident(), None)
+        trace.finish(status)
+        self._ensure_config()
+        with self._lock:
+            if self._active.get(trace.meeting_id) is trace:
+                del self._active[trace.meeting_id]
+            self._completed.append(trace)
+        if self._log_file:
+            try:
+                with open(self._log_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+            except Exception as e:
+                logger.warning(f"[Trace] 写入文件失败: {e}")
+        for hook in self._finish_hooks:
+            try:
+                hook(trace)
+            except Exception as e:
+                logger.error(f"[Trace] 执行结束回调失败: {e}")
+
+    def thread_jobs(self):
+        """{线程 ident: 该线程正在处理的任务}，只包含仍在进行中的任务"""
+        alive = {t.ident for t in threading.enumerate()}
+        for ident in [i for i in list(self._threads) if i not in alive]:
+            self._threads.pop(ident, None)
+        return {ident: trace for ident, trace in list(self._threads.items()) if trace.status == "running"}
+
+    def slowest(self, limit=20, include_active=False):
+        """按总耗时倒序返回最近完成的任务"""
+        self._ensure_config()
+        with self._lock:
+            traces = list(self._completed)
+            if include_active:
+                traces.extend(self._active.values())
+        traces.sort(key=lambda t: t.duration, reverse=True)
+        return [t.to_dict() for t in traces[:limit]]
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+# 全局单例
+tracer = Tracer()
+
+def _log_context():
+    """日志上下文: 当前线程 / 协程绑定的任务 (JSON 日志中输出 job_id / meeting_id 等字段)"""
+    trace = tracer.current()
+    if trace is None:
+        return None
+    context = {"job_id": trace.job_id, "meeting_id": trace.meeting_id, "owner_id": trace.owner_id}
+    if "backfill_job" in trace.attrs:
+        context["backfill_job"] = trace.attrs["backfill_job"]
+    return context
+
+add_context_provider(_log_context)
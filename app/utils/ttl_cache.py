@@ -0,0 +1,147 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from app.utils.metrics import API_CACHE
+
+_MISS = object()
+
+class _Flight:
+    """某个 key 正在进行中的一次加载，其他调用方等待并共用它的结果"""
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        # 协程等待时的 (loop, future)
+        self.waiters = []
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+class TTLCache:
+    """
+    进程内短期缓存，用于飞书 API 的查询结果 (会议详情、录制信息、媒体下载链接)
+    - 同一个 key 同时只有一个请求在进行，其他调用方 (线程或协程) 等待并共用它的结果
+    - 只缓存 ttl > 0 的结果: ttl 可以是秒数，或根据结果计算秒数的函数 (失败结果返回 0 即不缓存)
+    - 超过 max_entries 时淘汰最久未使用的条目
+    """
+    def __init__(self, name, max_entries=2000):
+        self.name = name
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        """在持有 _lock 时调用: 未命中或已过期返回 _MISS"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISS
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return _MISS
+        self._entries.move_to_end(key)
+        return value
+
+    def _join(self, key):
+        """
+        命中缓存返回 (value, None, False)；否则返回 (_MISS, flight, 是否由自己加载)
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not _MISS:
+                API_CACHE.inc(self.name, "hit")
+                return value, None, False
+            flight = self._inflight.get(key)
+            if flight is not None:
+                API_CACHE.inc(self.name, "coalesced")
+                return _MISS, flight, False
+            flight = self._inflight[key] = _Flight()
+        API_CACHE.inc(self.name, "miss")
+        return _MISS, flight, True
+
+    def _complete(self, key, flight, ttl):
+        if flight.error is None:
+            ttl = ttl(flight.value) if callable(ttl) else ttl
+            if flight.value is not None and ttl and ttl > 0:
+                self.put(key, flight.value, ttl)
+        with self._lock:
+            self._inflight.pop(key, None)
+            flight.event.set()
+            waiters, flight.waiters = flight.waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._lookup(key)
+        return default if value is _MISS else value
+
+    def put(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_load(self, key, loader, ttl):
+        """
+        读取缓存；未命中时调用 loader() 加载 (同一 key 并发调用时只加载一次)
+        loader 抛出的异常同样传给正在等待的调用方，异常结果不缓存
+        """
+        value, flight, leader = self._join(key)
+        if flight is None:
+            return value
+        if not leader:
+            flight.event.wait()
+            return flight.result()
+        try:
+            flight.value = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._complete(key, flight, ttl)
+        return flight.value
+
+    async def async_get_or_load(self, key, loader, ttl):
+        """get_or_load 的协程版本: loader 为返回协程的函数，等待其他调用方的加载时不占用线程"""
+        value, flight, leader = self._join(key)
+        if flight is None:
+            return value
+        if not leader:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            with self._lock:
+                if flight.event.is_set():
+                    future.set_result(None)
+                else:
+                    flight.waiters.append((loop, future))
+            await future
+            return flight.result()
+        try:
+            flight.value = await loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            self._complete(key, flight, ttl)
+        return flight.value
@@ -0,0 +1,48 @@
+"""
+历史补录: 为已授权用户归档指定时间范围内的历史会议录制
+
+用法:
+    python3 backfill.py --start 2026-01-01 --end 2026-03-31
+    python3 backfill.py --start 2026-01-01 --user ou_xxx --user ou_yyy
+
+已归档的会议会自动跳过；与正在运行的服务共享 user_token/ 目录时，
+通过会议租约保证同一会议不会被服务和补录重复下载。
+并发数 / 带宽由 BACKFILL_CONCURRENCY / BACKFILL_BANDWIDTH 控制。
+"""
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from app.data.token_store import token_store
+from app.core.backfill import BackfillJob, run_backfill
+from app.core.notification import notification_dispatcher
+
+def parse_date(text):
+    return int(time.mktime(datetime.strptime(text, "%Y-%m-%d").timetuple()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="历史会议录制补录")
+    parser.add_argument("--start", required=True, type=parse_date, help="开始日期 YYYY-MM-DD")
+    parser.add_argument("--end", type=parse_date, help="结束日期 YYYY-MM-DD (不含当天，默认为现在)")
+    parser.add_argument("--user", action="append", help="只补录指定 user_id，可重复；默认全部已授权用户")
+    args = parser.parse_args(argv)
+
+    end_time = args.end or int(time.time())
+    if args.start >= end_time:
+        print("开始日期必须早于结束日期")
+        return 1
+
+    user_ids = args.user or token_store.list_user_ids()
+    if not user_ids:
+        print("没有已授权的用户")
+        return 1
+
+    job = run_backfill(BackfillJob(user_ids, args.start, end_time))
+    # 发出还在合并窗口中的通知再退出
+    notification_dispatcher.drain()
+    print(json.dumps(job.to_dict(), ensure_ascii=False, indent=2))
+    return 0 if job.counts["failed"] == 0 else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+启动耗时压测: 在独立的 Python 进程中用 `-X importtime` 导入指定模块，统计导入总耗时和最重的依赖包
+
+容器启动 (run.py -> create_app) 和命令行脚本 (export_feishu_users.py 等只用到 app.utils 的工具函数)
+都要先导入 app 包。lark-oapi / pypinyin 等大型依赖应在用到时才导入，这里检查它们没有被提前加载。
+
+用法 (在项目根目录执行):
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --target app.api.routes --repeat 5
+    python -m benchmarks.bench_import --budget app.api.routes=500 --budget app.utils.feishu_client=300
+
+输出指标:
+    import_ms     导入耗时中位数 (毫秒，-X importtime 统计的累计耗时，不含解释器启动)
+    top_packages  自身耗时最多的顶层包
+    forbidden     导入后已加载的禁止模块 (应为空)
+有超出 --budget 的目标或加载了禁止模块时退出码为 1，可放在 CI 中防止启动耗时回退
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_TARGETS = ["app", "app.utils.feishu_client", "app.api.routes", "app.core.downloader"]
+# 这些模块只应在真正用到时导入 (处理 Webhook 事件 / 用户授权 / 匹配 NAS 目录)
+DEFAULT_FORBIDDEN = ["lark_oapi", "pypinyin"]
+
+def parse_importtime(stderr):
+    """解析 -X importtime 输出 -> [(模块名, 自身耗时 us, 累计耗时 us, 是否为顶层导入)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # 被其他模块间接导入的行按嵌套层级缩进
+        top_level = not name[1:].startswith(" ")
+        rows.append((name.strip(), int(self_us), int(cumulative_us), top_level))
+    return rows
+
+def measure(target, workdir):
+    """在新进程中导入一次 target，返回 (累计耗时 us, 各模块耗时)"""
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    # 在临时目录中运行: 导入 logger 时会创建 logs/ 目录
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {target}"],
+                          cwd=workdir, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {target} 失败:\n{proc.stderr[-2000:]}")
+    rows = parse_importtime(proc.stderr)
+    # import a.b.c 依次导入 a、a.b、a.b.c，各为一行顶层记录，合计才是完整耗时
+    parts = target.split(".")
+    chain = {".".join(parts[:i]) for i in range(1, len(parts) + 1)}
+    total = sum(cumulative for name, _, cumulative, top_level in rows if top_level and name in chain)
+    return total, rows
+
+def run_target(target, args, workdir):
+    totals = []
+    rows = []
+    for _ in range(args.repeat):
+        total, rows = measure(target, workdir)
+        totals.append(total)
+
+    packages = {}
+    for name, self_us, _, _ in rows:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    loaded = {row[0] for row in rows}
+    forbidden = sorted(m for m in args.forbid if m in loaded)
+
+    import_ms = statistics.median(totals) / 1000
+    budget = args.budgets.get(target)
+    return {
+        "target": target,
+        "import_ms": round(import_ms, 1),
+        "runs_ms": [round(t / 1000, 1) for t in totals],
+        "modules": len(rows),
+        "top_packages": [{"package": p, "self_ms": round(us / 1000, 1)} for p, us in heaviest],
+        "forbidden": forbidden,
+        "budget_ms": budget,
+        "ok": not forbidden and (budget is None or import_ms <= budget),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="模块导入耗时压测 (-X importtime)")
+    parser.add_argument("--target", action="append", help="要导入的模块，可重复；默认 " + ", ".join(DEFAULT_TARGETS))
+    parser.add_argument("--repeat", type=int, default=3, help="每个模块导入的次数 (取中位数)")
+    parser.add_argument("--top", type=int, default=8, help="输出自身耗时最多的前 N 个顶层包")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                        help="导入耗时上限 (毫秒)，超出时退出码为 1")
+    parser.add_argument("--forbid", action="append", help="导入后不应被加载的模块；默认 " + ", ".join(DEFAULT_FORBIDDEN))
+    parser.add_argument("--json", action="store_true", help="仅输出 JSON")
+    args = parser.parse_args(argv)
+
+    args.forbid = args.forbid or DEFAULT_FORBIDDEN
+    args.budgets = {}
+    for item in args.budget:
+        module, _, ms = item.partition("=")
+        args.budgets[module.strip()] = float(ms)
+
+    workdir = tempfile.mkdtemp(prefix="feishu-bench-import-")
+    try:
+        results = [run_target(target, args, workdir) for target in (args.target or DEFAULT_TARGETS)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"python": sys.version.split()[0], "repeat": args.repeat, "results": results}
+    print(json.dumps(report, ensure_ascii=False, indent=None if args.json else 2))
+    return 0 if all(r["ok"] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
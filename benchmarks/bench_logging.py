@@ -0,0 +1,115 @@
+"""
+日志压测: 多个线程同时高频打日志，对比同步 Handler 与队列 Handler (LOG_ASYNC) 下打日志线程的单次调用耗时
+
+同步模式下每次调用都在打日志的线程里格式化、写文件并检查轮转，多个线程争用 Handler 锁；
+队列模式下打日志的线程只把记录放入队列，格式化和写入由后台线程完成。
+
+用法 (在项目根目录执行):
+    python -m benchmarks.bench_logging --threads 16 --messages 5000
+    python -m benchmarks.bench_logging --format json
+
+输出指标:
+    call latency      单次 logger.info 调用耗时分位 (打日志线程视角)
+    calls/sec         所有线程合计的日志调用吞吐
+    flush time        队列模式下调用结束后后台线程写完剩余日志的时间
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import shutil
+import argparse
+import tempfile
+import threading
+
+# 压测过程中会切换到临时工作目录，先把项目根目录固定到 sys.path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.bench_webhook import percentile
+
+def run_mode(async_mode, args, workdir):
+    from app.utils.logger import setup_logger
+    name = f"bench_logging_{'async' if async_mode else 'sync'}_{args.format}"
+    log_file = os.path.join(workdir, f"{name}.log")
+    # 控制台输出重定向到文件 (与容器中 stdout 被收集的开销接近，不刷屏)
+    stderr = sys.stderr
+    sys.stderr = open(os.path.join(workdir, f"{name}.stderr"), "w", encoding="utf-8")
+    try:
+        bench_logger = setup_logger(name, async_mode=async_mode, log_format=args.format, log_file=log_file)
+    finally:
+        console, sys.stderr = sys.stderr, stderr
+
+    latencies = [[] for _ in range(args.threads)]
+    barrier = threading.Barrier(args.threads)
+
+    def worker(index):
+        samples = latencies[index]
+        barrier.wait()
+        for i in range(args.messages):
+            started = time.perf_counter()
+            bench_logger.info(f"[压测] 线程 {index} 第 {i} 条日志: 正在下载文件到 downloads/meeting_{i}.mp4")
+            samples.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    flush_started = time.perf_counter()
+    listener = getattr(bench_logger, "listener", None)
+    if listener is not None:
+        atexit.unregister(listener.stop)
+        listener.stop()
+    flush_time = time.perf_counter() - flush_started
+    for handler in list(bench_logger.handlers):
+        handler.close()
+        bench_logger.removeHandler(handler)
+    console.close()
+
+    samples = [s for thread_samples in latencies for s in thread_samples]
+    return {
+        "mode": "async" if async_mode else "sync",
+        "calls": len(samples),
+        "calls_per_sec": round(len(samples) / elapsed) if elapsed else 0,
+        "call_latency_us": {
+            "p50": round(percentile(samples, 50) * 1e6, 1),
+            "p99": round(percentile(samples, 99) * 1e6, 1),
+            "max": round(max(samples) * 1e6, 1),
+        },
+        "wall_time_s": round(elapsed, 3),
+        "flush_time_s": round(flush_time, 3),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="同步 / 队列日志 Handler 压测")
+    parser.add_argument("--threads", type=int, default=16, help="并发打日志的线程数")
+    parser.add_argument("--messages", type=int, default=5000, help="每个线程的日志条数")
+    parser.add_argument("--format", default="text", choices=["text", "json"])
+    parser.add_argument("--json", action="store_true", help="仅输出 JSON")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="feishu-bench-logging-")
+    # app 的默认 logger 在导入时创建 logs/ 目录，切换到临时目录避免污染项目目录
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        report = {
+            "threads": args.threads,
+            "messages_per_thread": args.messages,
+            "format": args.format,
+            "results": [run_mode(False, args, workdir), run_mode(True, args, workdir)],
+        }
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, ensure_ascii=False, indent=None if args.json else 2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
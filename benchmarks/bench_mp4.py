@@ -0,0 +1,157 @@
+"""
+录制文件校验 / faststart 压测: 生成一个 moov 在末尾的大 MP4 (与飞书录制相同的布局)，
+统计结构校验 (MP4_VERIFY) 和原地 faststart 改写 (MP4_FASTSTART) 的耗时与内存，并验证改写结果
+
+合成文件: ftyp + mdat (每 1MB 一个 chunk，chunk 开头写入编号) + moov (两个轨道的 stco / co64 表指向各 chunk)
+改写后重新校验结构，并按修正后的 chunk offset 读回编号，确认每个偏移仍指向原来的 chunk。
+
+用法 (在项目根目录执行):
+    python -m benchmarks.bench_mp4 --size 2G
+    python -m benchmarks.bench_mp4 --size 6G --dir /volume1/tmp     # 超过 4GB 时使用 co64
+
+输出指标:
+    inspect_ms        结构校验耗时 (只读取 box 头和 moov，与文件大小基本无关)
+    faststart_sec     原地改写耗时 / faststart_mb_s 改写吞吐
+    copy_sec          同一文件整体复制一次的耗时 (参照: 生成新文件的 faststart 工具至少需要这么久，且占用双倍磁盘)
+    peak_alloc_mb     改写过程中 Python 分配的内存峰值 (tracemalloc)
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import struct
+import argparse
+import tempfile
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.feishu_stub import parse_size
+from app.core import mp4
+
+CHUNK_SIZE = 1024 * 1024
+MARKER = struct.Struct(">4sQ")
+TRACKS = 2
+
+def _box(box_type, body):
+    return struct.pack(">I4s", 8 + len(body), box_type) + body
+
+def _moov(offsets, wide):
+    """两个轨道交替引用 chunk (模拟视频 / 音频交错存放)"""
+    traks = b""
+    for track in range(TRACKS):
+        entries = offsets[track::TRACKS]
+        table = struct.pack(">II", 0, len(entries)) + struct.pack(">%d%s" % (len(entries), "Q" if wide else "I"), *entries)
+        stbl = _box(b"stbl", _box(b"co64" if wide else b"stco", table))
+        traks += _box(b"trak", _box(b"mdia", _box(b"minf", stbl)))
+    return _box(b"moov", traks)
+
+def generate(path, size):
+    """生成合成 MP4；返回 chunk 个数"""
+    ftyp = _box(b"ftyp", b"isom" + struct.pack(">I", 0x200) + b"isommp42")
+    wide = size > 0xFFFFFFFF
+    mdat_start = len(ftyp)
+    payload_start = mdat_start + 16
+    # moov 长度由 chunk 数决定，先按上限估算 chunk 数再收尾
+    count = max((size - payload_start) // CHUNK_SIZE, TRACKS)
+    while True:
+        moov_size = len(_moov([0] * count, wide))
+        payload = size - payload_start - moov_size
+        if payload >= count * MARKER.size:
+            break
+        count -= 1
+    offsets = [payload_start + i * (payload // count) for i in range(count)]
+    filler = memoryview(bytes(range(256)) * (CHUNK_SIZE // 256))
+    with open(path, "wb") as f:
+        f.write(ftyp)
+        f.write(struct.pack(">I4sQ", 1, b"mdat", 16 + payload))
+        for i, offset in enumerate(offsets):
+            end = offsets[i + 1] if i + 1 < count else payload_start + payload
+            f.write(MARKER.pack(b"CHNK", i))
+            remaining = end - offset - MARKER.size
+            while remaining > 0:
+                piece = filler[:min(remaining, len(filler))]
+                f.write(piece)
+                remaining -= len(piece)
+        f.write(_moov(offsets, wide))
+    return count
+
+def verify(path, count):
+    """改写后: 结构完整、moov 在 mdat 之前、每个 chunk offset 读回的编号与原顺序一致"""
+    info = mp4.inspect(path)
+    assert info["faststart"], "moov 仍在 mdat 之后"
+    with open(path, "rb") as f:
+        moov = next(b for b in info["boxes"] if b.type == b"moov")
+        f.seek(moov.offset)
+        data = f.read(moov.size)
+        checked = 0
+        for track, (_, _, offsets) in enumerate(mp4._chunk_offsets(data, mp4._chunk_offset_tables(data))):
+            for j, offset in enumerate(offsets):
+                f.seek(offset)
+                tag, index = MARKER.unpack(f.read(MARKER.size))
+                assert tag == b"CHNK" and index == j * TRACKS + track, f"偏移 {offset} 处不是第 {j * TRACKS + track} 个 chunk"
+                checked += 1
+    assert checked == count, "chunk 个数不一致"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MP4 结构校验 / 原地 faststart 压测")
+    parser.add_argument("--size", default="2G", help="合成文件大小，如 2G / 6G")
+    parser.add_argument("--dir", default=tempfile.gettempdir(), help="合成文件所在目录 (需要约 2 倍文件大小的空闲空间)")
+    parser.add_argument("--keep", action="store_true", help="保留合成文件")
+    parser.add_argument("--json", action="store_true", help="仅输出 JSON")
+    args = parser.parse_args(argv)
+
+    size = parse_size(args.size)
+    workdir = tempfile.mkdtemp(prefix="feishu-bench-mp4-", dir=args.dir)
+    path = os.path.join(workdir, "recording.mp4")
+    try:
+        started = time.perf_counter()
+        count = generate(path, size)
+        generate_sec = time.perf_counter() - started
+
+        started = time.perf_counter()
+        copy_path = path + ".copy"
+        shutil.copyfile(path, copy_path)
+        copy_sec = time.perf_counter() - started
+        os.remove(copy_path)
+
+        started = time.perf_counter()
+        info = mp4.inspect(path)
+        inspect_ms = (time.perf_counter() - started) * 1000
+        assert not info["faststart"]
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        moved = mp4.faststart(path)
+        faststart_sec = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert moved, "faststart 未改写文件"
+        assert os.path.getsize(path) == size
+
+        verify(path, count)
+        report = {
+            "size_mb": round(size / 1024 / 1024, 1),
+            "chunks": count,
+            "chunk_table": "co64" if size > 0xFFFFFFFF else "stco",
+            "generate_sec": round(generate_sec, 2),
+            "inspect_ms": round(inspect_ms, 2),
+            "faststart_sec": round(faststart_sec, 2),
+            "faststart_mb_s": round(size / 1024 / 1024 / faststart_sec, 1),
+            "copy_sec": round(copy_sec, 2),
+            "peak_alloc_mb": round(peak / 1024 / 1024, 1),
+            "verified": True,
+        }
+        if args.keep:
+            report["path"] = path
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(report, ensure_ascii=False, indent=None if args.json else 2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
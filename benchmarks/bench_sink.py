@@ -0,0 +1,150 @@
+"""
+下载写入 CPU 压测: 从本地 Stub 的 Range 媒体服务下载大文件，对比普通写入与 splice 零拷贝写入 (DOWNLOAD_ZERO_COPY)
+每 GB 消耗的 CPU 时间，以及团队归档复制 (shutil.copyfile / copy_file_range) 的 CPU 时间
+
+Stub 在独立进程中运行，统计的 CPU 只包含下载进程自身 (用户态 + 内核态)。
+两种写入方式都要计算 SHA-256 (内容去重)，hash_only 为单独对同一文件计算哈希的 CPU，即下载的 CPU 下限。
+
+用法 (在项目根目录执行，仅 Linux):
+    python -m benchmarks.bench_sink --size 1G
+    python -m benchmarks.bench_sink --size 2G --repeat 5 --copy-dir /volume1/team
+
+输出指标 (取 --repeat 次的中位数):
+    cpu_s_per_gb      每 GB 的 CPU 秒数 (user / sys 分别列出)
+    wall_mb_s         吞吐 (受 Stub 生成数据速度限制，仅供参考)
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import hashlib
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import requests
+from benchmarks.feishu_stub import parse_size
+from app.core.download_sink import stream_to_file, SPLICE_SUPPORTED
+from app.core.nas_manager import copy_file
+
+GB = 1024 ** 3
+
+def _cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime, usage.ru_stime
+
+def measure(size, func):
+    """运行 func，返回 {cpu_s_per_gb, user, sys, wall_mb_s} 和 func 的返回值"""
+    user, system = _cpu()
+    started = time.perf_counter()
+    result = func()
+    wall = time.perf_counter() - started
+    user2, system2 = _cpu()
+    return {
+        "user": (user2 - user) * GB / size,
+        "sys": (system2 - system) * GB / size,
+        "wall_mb_s": size / 1024 / 1024 / wall,
+    }, result
+
+def summarize(samples):
+    row = {key: round(statistics.median(s[key] for s in samples), 3) for key in ("user", "sys")}
+    row["cpu_s_per_gb"] = round(row["user"] + row["sys"], 3)
+    row["wall_mb_s"] = round(statistics.median(s["wall_mb_s"] for s in samples), 1)
+    return row
+
+def start_stub(size):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, "-m", "benchmarks.feishu_stub", "--port", str(port), "--media-size", str(size)],
+                            cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(f"{base_url}/stub/stats", timeout=1)
+            return proc, base_url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("Stub 启动失败")
+
+def download(url, path, zero_copy):
+    with requests.get(url, stream=True, timeout=(10, 60)) as r:
+        r.raise_for_status()
+        return stream_to_file(r, path, zero_copy=zero_copy)
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="普通写入 / splice 零拷贝写入的 CPU 压测")
+    parser.add_argument("--size", default="1G", help="媒体文件大小，如 1G / 2G")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dir", default=tempfile.gettempdir(), help="下载目录")
+    parser.add_argument("--copy-dir", help="团队归档复制的目标目录 (默认与下载目录相同，可指定 NAS 卷对比跨卷复制)")
+    parser.add_argument("--json", action="store_true", help="仅输出 JSON")
+    args = parser.parse_args(argv)
+    if not SPLICE_SUPPORTED:
+        print("当前平台不支持 os.splice (仅 Linux)", file=sys.stderr)
+        return 1
+
+    size = parse_size(args.size)
+    workdir = tempfile.mkdtemp(prefix="feishu-bench-sink-", dir=args.dir)
+    copy_dir = tempfile.mkdtemp(prefix="feishu-bench-sink-copy-", dir=args.copy_dir or args.dir)
+    stub, base_url = start_stub(size)
+    try:
+        results = {}
+        digests = set()
+        path = os.path.join(workdir, "recording.mp4")
+        for mode in ("buffered", "splice"):
+            samples = []
+            for i in range(args.repeat):
+                url = f"{base_url}/stub-media/obcnbench{i}.mp4"
+                sample, (file_size, sha256) = measure(size, lambda: download(url, path, mode == "splice"))
+                assert file_size == size
+                samples.append(sample)
+                digests.add((i, sha256))
+            results[mode] = summarize(samples)
+        # 两种写入方式得到的哈希必须一致
+        assert len(digests) == args.repeat, "splice 写入的 SHA-256 与普通写入不一致"
+
+        results["hash_only"] = summarize([measure(size, lambda: hash_file(path))[0] for _ in range(args.repeat)])
+
+        target = os.path.join(copy_dir, "recording.mp4")
+        copies = {}
+        for name, func in (("copyfile", shutil.copyfile), ("copy_file_range", copy_file)):
+            samples = []
+            for _ in range(args.repeat):
+                if os.path.exists(target):
+                    os.remove(target)
+                samples.append(measure(size, lambda: func(path, target))[0])
+            copies[name] = summarize(samples)
+        assert hash_file(target) == hash_file(path)
+
+        report = {
+            "size_mb": round(size / 1024 / 1024, 1),
+            "repeat": args.repeat,
+            "download": results,
+            "nas_copy": copies,
+        }
+    finally:
+        stub.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+        shutil.rmtree(copy_dir, ignore_errors=True)
+    print(json.dumps(report, ensure_ascii=False, indent=None if args.json else 2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
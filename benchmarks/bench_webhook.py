@@ -0,0 +1,310 @@
+"""
+端到端压测: 向 /webhook/event 发送 N 个 all_meeting_ended 事件，统计从收到事件到归档完成的全链路表现
+
+整个流程都在本地完成: 飞书 OpenAPI 与媒体下载由 benchmarks.feishu_stub 模拟，
+服务本身以 Waitress 在后台线程启动，下载目录 / NAS 目录 / Token 文件都放在临时目录中。
+
+用法 (在项目根目录执行):
+    python -m benchmarks.bench_webhook --events 200 --concurrency 20 --media-size 5M
+
+输出指标:
+    events/sec        Webhook 接收吞吐
+    ack latency       Webhook 返回 200 的耗时分位
+                      (对比 --env WEBHOOK_FAST_ACK=0 即可看到快速确认模式在突发流量下的效果)
+    time-to-archive   从收到事件到发送完成通知的耗时分位 (包含 POLL_INITIAL_DELAY)
+                      --heavy-events 时分别统计大文件 / 普通录制 (对比 --env DOWNLOAD_POLICY=fifo)
+    API calls/rec     每个录制平均调用的 OpenAPI 次数
+    peak threads/RSS  进程峰值线程数与内存
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 压测过程中会切换到临时工作目录，先把项目根目录固定到 sys.path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.feishu_stub import start_in_thread, parse_size
+
+VERIFICATION_TOKEN = "bench-verification-token"
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(int(round(pct / 100.0 * (len(values) - 1))), len(values) - 1)
+    return values[k]
+
+def read_rss_kb():
+    """当前 / 峰值 RSS (KB)，读取 /proc/self/status (仅 Linux)"""
+    rss = hwm = 0
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1])
+                elif line.startswith("VmHWM:"):
+                    hwm = int(line.split()[1])
+    except OSError:
+        pass
+    return rss, hwm
+
+class ResourceSampler(threading.Thread):
+    def __init__(self, interval=0.05):
+        super().__init__(name="bench-sampler", daemon=True)
+        self.interval = interval
+        self.peak_threads = 0
+        self.peak_rss_kb = 0
+        self.peak_event_queue_depth = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        from app.data.event_queue import event_queue
+        while not self._stop_event.is_set():
+            self.peak_event_queue_depth = max(self.peak_event_queue_depth, event_queue.depth())
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            rss, hwm = read_rss_kb()
+            self.peak_rss_kb = max(self.peak_rss_kb, rss, hwm)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+def build_event(i, owner_id, prefix="bench"):
+    meeting_id = f"{prefix}{i:06d}"
+    return meeting_id, {
+        "schema": "2.0",
+        "header": {
+            "event_id": f"bench-event-{i}",
+            "token": VERIFICATION_TOKEN,
+            "create_time": str(int(time.time() * 1000)),
+            "event_type": "vc.meeting.all_meeting_ended_v1",
+            "tenant_key": "bench",
+            "app_id": "cli_bench",
+        },
+        "event": {
+            "meeting": {
+                "id": meeting_id,
+                "topic": f"压测会议 {meeting_id}",
+                "meeting_no": str(100000000 + i),
+                "owner": {"id": {"user_id": owner_id}},
+            }
+        },
+    }
+
+def prepare_environment(workdir, stub_url, args):
+    """在 import app 之前设置环境变量，使所有数据落在临时目录"""
+    os.chdir(workdir)
+    os.environ.update({
+        "FEISHU_BASE_URL": stub_url,
+        "APP_ID": "cli_bench",
+        "APP_SECRET": "bench-secret",
+        "APP_VERIFICATION_TOKEN": VERIFICATION_TOKEN,
+        "DOWNLOAD_PATH": os.path.join(workdir, "downloads"),
+        "POLL_INITIAL_DELAY": str(args.poll_delay),
+        "TRACE_BUFFER_SIZE": str(max(args.events * 2, 500)),
+    })
+    for key, value in (args.env or []):
+        os.environ[key] = value
+
+def setup_nas_and_tokens(workdir, owners):
+    from app.core.nas_manager import NasManager
+    from app.data.token_store import token_store
+
+    nas_root = os.path.join(workdir, "nas")
+    os.makedirs(os.path.join(nas_root, "@team", "Bench团队"), exist_ok=True)
+    mapping = {}
+    for owner in owners:
+        os.makedirs(os.path.join(nas_root, owner), exist_ok=True)
+        mapping[owner] = owner
+    NasManager.NAS_ROOT = nas_root
+    os.makedirs(os.path.dirname(NasManager.MAPPING_FILE), exist_ok=True)
+    with open(NasManager.MAPPING_FILE, "w", encoding="utf-8") as f:
+        json.dump(mapping, f)
+
+    for owner in owners:
+        token_store.save_user_token(owner, {
+            "user_access_token": f"u-stub-{owner}",
+            "refresh_token": f"ur-stub-{owner}",
+            "expires_in": 7200,
+            "name": owner,
+        })
+
+def run(args):
+    media_size = parse_size(args.media_size)
+    stub_server, stub_state, stub_url = start_in_thread(
+        media_size=media_size, latency_ms=args.latency_ms, error_rate=args.error_rate,
+        unauthorized_rate=args.unauthorized_rate, ready_after_polls=1,
+        media_rate=parse_size(args.media_rate), stall_rate=args.stall_rate, stall_seconds=args.stall_seconds)
+
+    workdir = tempfile.mkdtemp(prefix="feishu-bench-")
+    prepare_environment(workdir, stub_url, args)
+    owners = [f"benchuser{i}" for i in range(args.owners)]
+    heavy_owner = "benchheavy"
+
+    # 延迟导入: 环境变量必须先于 app 的配置读取
+    import requests
+    from waitress import create_server
+    from app import create_app
+    from app.utils.logger import logger
+    from app.utils.tracing import tracer
+    from app.core.notification import notification_dispatcher
+
+    logger.setLevel(getattr(logging, args.log_level))
+    logging.getLogger("waitress").setLevel(logging.ERROR)
+    setup_nas_and_tokens(workdir, owners + [heavy_owner])
+    if args.heavy_events:
+        # 模拟一个用户连续结束多个长会议: 这些录制的文件更大，且先于其他事件到达
+        stub_state.config["media_size_rules"] = [["heavy", parse_size(args.heavy_media_size)]]
+
+    server = create_server(create_app(), host="127.0.0.1", port=0, threads=args.server_threads)
+    threading.Thread(target=server.run, name="bench-waitress", daemon=True).start()
+    webhook_url = f"http://127.0.0.1:{server.effective_port}/webhook/event"
+    stub_state.reset()
+
+    sampler = ResourceSampler()
+    sampler.start()
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=args.concurrency, pool_maxsize=args.concurrency)
+    session.mount("http://", adapter)
+
+    ack_latencies = []
+    failures = [0]
+    lock = threading.Lock()
+
+    def fire(i):
+        if i < args.heavy_events:
+            _, body = build_event(i, heavy_owner, prefix="heavy")
+        else:
+            _, body = build_event(i, owners[i % len(owners)])
+        started = time.perf_counter()
+        resp = session.post(webhook_url, data=json.dumps(body), headers={"Content-Type": "application/json"})
+        cost = time.perf_counter() - started
+        with lock:
+            ack_latencies.append(cost)
+            if resp.status_code != 200:
+                failures[0] += 1
+
+    fire_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(fire, range(args.events + args.heavy_events)))
+    fire_elapsed = time.perf_counter() - fire_started
+
+    # 等待所有任务完成 (Trace 结束)
+    deadline = time.time() + args.timeout
+    completed = []
+    while time.time() < deadline:
+        completed = [t for t in tracer.slowest(limit=(args.events + args.heavy_events) * 2)
+                     if t["status"] != "running"]
+        if len(completed) >= args.events + args.heavy_events:
+            break
+        time.sleep(0.2)
+    total_elapsed = time.perf_counter() - fire_started
+    # 通知在合并窗口后异步发送，统计接口调用前等待发送完毕
+    notification_dispatcher.drain(timeout=max(deadline - time.time(), 1))
+
+    sampler.stop()
+    stats = stub_state.stats()
+    server.close()
+    stub_server.shutdown()
+
+    archive_times = [t["duration"] for t in completed]
+    light_times = [t["duration"] for t in completed if not t["meeting_id"].startswith("heavy")]
+    heavy_times = [t["duration"] for t in completed if t["meeting_id"].startswith("heavy")]
+    archived = [t for t in completed if t["attrs"].get("result") in ("archived", "pending_archive")]
+    report = {
+        "events": args.events,
+        "concurrency": args.concurrency,
+        "media_size_bytes": media_size,
+        "webhook_failures": failures[0],
+        "events_per_sec": round(args.events / fire_elapsed, 1) if fire_elapsed else 0,
+        "ack_latency_ms": {
+            "p50": round(percentile(ack_latencies, 50) * 1000, 2),
+            "p99": round(percentile(ack_latencies, 99) * 1000, 2),
+            "max": round(max(ack_latencies) * 1000, 2) if ack_latencies else 0,
+        },
+        "peak_event_queue_depth": sampler.peak_event_queue_depth,
+        "completed_jobs": len(completed),
+        "archived_jobs": len(archived),
+        "status_counts": {},
+        "time_to_archive_s": {
+            "p50": round(percentile(archive_times, 50), 3),
+            "p90": round(percentile(archive_times, 90), 3),
+            "p99": round(percentile(archive_times, 99), 3),
+            "max": round(max(archive_times), 3) if archive_times else 0,
+        },
+        "poll_initial_delay_s": args.poll_delay,
+        "heavy_events": args.heavy_events,
+        "light_time_to_archive_s": {
+            "p50": round(percentile(light_times, 50), 3),
+            "p90": round(percentile(light_times, 90), 3),
+        },
+        "heavy_time_to_archive_s": {
+            "p50": round(percentile(heavy_times, 50), 3),
+            "max": round(max(heavy_times), 3) if heavy_times else 0,
+        },
+        "api_calls_per_recording": round(stats["total_api_calls"] / max(len(completed), 1), 2),
+        "api_calls_by_endpoint": stats["calls"],
+        "im_messages_per_recording": round(stats["calls"].get("im.message.create", 0) / max(len(completed), 1), 2),
+        "media_bytes": stats["media_bytes"],
+        "media_stalls": stats["media_stalls"],
+        "wall_time_s": round(total_elapsed, 2),
+        "peak_threads": sampler.peak_threads,
+        "peak_rss_mb": round(sampler.peak_rss_kb / 1024.0, 1),
+    }
+    for t in completed:
+        report["status_counts"][t["status"]] = report["status_counts"].get(t["status"], 0) + 1
+
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    else:
+        report["workdir"] = workdir
+    return report
+
+def parse_env(text):
+    key, _, value = text.partition("=")
+    return key, value
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Webhook -> 归档 端到端压测")
+    parser.add_argument("--events", type=int, default=100, help="发送的会议结束事件数")
+    parser.add_argument("--concurrency", type=int, default=10, help="并发发送事件的客户端数")
+    parser.add_argument("--owners", type=int, default=10, help="会议 Owner 数 (事件轮流分配)")
+    parser.add_argument("--media-size", default="2M", help="每个录制文件大小")
+    parser.add_argument("--media-rate", default="0", help="Stub 单连接下载限速 (字节/秒)")
+    parser.add_argument("--latency-ms", type=float, default=5, help="Stub 每个 API 的延迟")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--unauthorized-rate", type=float, default=0.0)
+    parser.add_argument("--heavy-events", type=int, default=0,
+                        help="额外的大文件事件数 (同一个 Owner，先于其他事件发送)，用于观察下载调度的公平性")
+    parser.add_argument("--heavy-media-size", default="50M", help="大文件事件的录制大小")
+    parser.add_argument("--stall-rate", type=float, default=0.0,
+                        help="录制第一次下载在中途卡住的概率 (对比 --env DOWNLOAD_READ_TIMEOUT=...)")
+    parser.add_argument("--stall-seconds", type=float, default=600, help="卡住的连接停止发送数据的时间")
+    parser.add_argument("--poll-delay", type=float, default=0.1, help="POLL_INITIAL_DELAY (秒)")
+    parser.add_argument("--server-threads", type=int, default=4, help="Waitress 工作线程数")
+    parser.add_argument("--timeout", type=float, default=300, help="等待全部任务完成的最长时间 (秒)")
+    parser.add_argument("--log-level", default="WARNING", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    parser.add_argument("--env", type=parse_env, action="append", help="额外环境变量 KEY=VALUE，可重复")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录便于排查")
+    parser.add_argument("--json", action="store_true", help="仅输出 JSON")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report["completed_jobs"] >= args.events + args.heavy_events else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,426 @@
+"""
+本地飞书 OpenAPI Stub Server (仅用于压测 / 联调，不依赖外网)
+
+模拟本服务用到的接口:
+- 租户 Token / 用户 Token 刷新 / 授权码换 Token / 用户信息
+- 会议录制信息 / 会议详情
+- 通讯录用户 / 部门
+- 妙记媒体下载链接 + 支持 Range 的媒体文件服务 (内容按需生成，不占磁盘)
+- 发送消息
+
+支持注入: 固定延迟、随机错误、随机 401、录制在第 N 次查询后才就绪
+
+用法:
+    python -m benchmarks.feishu_stub --port 18080 --media-size 50M --latency-ms 20
+    然后设置 FEISHU_BASE_URL=http://127.0.0.1:18080 启动服务
+
+运行时调整 / 查看统计:
+    curl -X POST localhost:18080/stub/config -d '{"error_rate": 0.1}'
+    curl localhost:18080/stub/stats
+"""
+import re
+import sys
+import json
+import time
+import random
+import struct
+import functools
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+# 媒体文件内容: 结构完整的 MP4 (服务端会校验 box 结构)，按偏移生成，Range 请求时切片
+#   ftyp + free (内含 Token，保证不同录制的内容哈希不同，不会被内容去重合并)
+#   + mdat (固定的 1MB 块循环拼接) + 末尾的 moov (与飞书录制一样不是 faststart)
+_PATTERN = bytes(range(256)) * 4096
+_HEADER_SIZE = 64
+_MDAT_HEADER_SIZE = 16
+_CHUNKS = 16
+
+def _box(box_type, body):
+    return struct.pack(">I4s", 8 + len(body), box_type) + body
+
+@functools.lru_cache(maxsize=256)
+def _media_layout(object_token, size):
+    """-> (文件头: ftyp + free + mdat 头, 末尾的 moov)；文件太小放不下时返回 (Token 头, b"")"""
+    token = object_token.encode("utf-8")
+    ftyp = _box(b"ftyp", b"isom" + struct.pack(">I", 0x200) + b"isommp42")
+    free = _box(b"free", token[:_HEADER_SIZE - len(ftyp) - 8].ljust(_HEADER_SIZE - len(ftyp) - 8, b"\0"))
+    # moov 长度只取决于 chunk offset 表的位宽，先按 stco 估算
+    wide = size > 0xFFFFFFFF
+    moov_size = 8 * 6 + 8 + _CHUNKS * (8 if wide else 4)
+    mdat_size = size - _HEADER_SIZE - moov_size
+    if mdat_size <= _MDAT_HEADER_SIZE + _CHUNKS:
+        return token[:_HEADER_SIZE].ljust(_HEADER_SIZE, b"\0"), b""
+    step = (mdat_size - _MDAT_HEADER_SIZE) // _CHUNKS
+    offsets = [_HEADER_SIZE + _MDAT_HEADER_SIZE + i * step for i in range(_CHUNKS)]
+    table = struct.pack(">II", 0, _CHUNKS) + struct.pack(">%d%s" % (_CHUNKS, "Q" if wide else "I"), *offsets)
+    stbl = _box(b"stbl", _box(b"co64" if wide else b"stco", table))
+    moov = _box(b"moov", _box(b"trak", _box(b"mdia", _box(b"minf", stbl))))
+    head = ftyp + free + struct.pack(">I4sQ", 1, b"mdat", mdat_size)
+    return head, moov
+
+def media_bytes(object_token, offset, n, size):
+    """返回大小为 size 的虚拟媒体文件 [offset, offset+n) 的内容 (n 不超过 1MB)"""
+    head, moov = _media_layout(object_token, size)
+    moov_start = size - len(moov)
+    end = min(offset + n, size)
+    pieces = []
+    while offset < end:
+        if offset < len(head):
+            piece = head[offset:end]
+        elif offset >= moov_start:
+            piece = moov[offset - moov_start:end - moov_start]
+        else:
+            pos = (offset - len(head)) % len(_PATTERN)
+            piece = _PATTERN[pos:pos + min(end, moov_start) - offset]
+        pieces.append(piece)
+        offset += len(piece)
+    return b"".join(pieces)
+
+def parse_size(text):
+    """'50M' -> 52428800"""
+    text = str(text).strip().upper()
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+class StubState:
+    def __init__(self, media_size=10 * 1024 * 1024, latency_ms=0, error_rate=0.0,
+                 unauthorized_rate=0.0, ready_after_polls=1, media_rate=0, history_meetings=5,
+                 stall_rate=0.0, stall_seconds=600):
+        self.lock = threading.Lock()
+        self.config = {
+            "media_size": media_size,
+            "latency_ms": latency_ms,
+            "error_rate": error_rate,
+            "unauthorized_rate": unauthorized_rate,
+            "ready_after_polls": ready_after_polls,
+            # 媒体下载限速 (字节/秒，0 为不限速)
+            "media_rate": media_rate,
+            # 每个用户的历史会议数 (补录 /vc/v1/meeting_list 返回)
+            "history_meetings": history_meetings,
+            # 模拟 CDN 连接卡死: 每个录制的第一次下载以该概率在传输一半后停止发送数据 stall_seconds 秒
+            "stall_rate": stall_rate,
+            "stall_seconds": stall_seconds,
+            # 按妙记 Token 覆盖文件大小: [[Token 包含的字符串, 大小], ...]，用于模拟长短会议混合
+            "media_size_rules": [],
+        }
+        self.calls = {}
+        self.media_bytes = 0
+        self.polls = {}
+        self.media_requests = set()
+        self.media_stalls = 0
+
+    def media_size_for(self, object_token):
+        for needle, size in self.config.get("media_size_rules") or []:
+            if needle in object_token:
+                return int(size)
+        return int(self.config["media_size"])
+
+    def count(self, endpoint):
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+    def poll(self, meeting_id):
+        with self.lock:
+            self.polls[meeting_id] = self.polls.get(meeting_id, 0) + 1
+            return self.polls[meeting_id]
+
+    def should_stall(self, object_token):
+        """每个录制只在第一次完整下载时按 stall_rate 决定是否卡住 (重连后正常传输)"""
+        with self.lock:
+            if object_token in self.media_requests:
+                return False
+            self.media_requests.add(object_token)
+            if random.random() < self.config["stall_rate"]:
+                self.media_stalls += 1
+                return True
+            return False
+
+    def stats(self):
+        with self.lock:
+            return {
+                "calls": dict(self.calls),
+                "total_api_calls": sum(v for k, v in self.calls.items() if k != "media.file"),
+                "media_bytes": self.media_bytes,
+                "media_stalls": self.media_stalls,
+                "meetings_polled": len(self.polls),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.polls.clear()
+            self.media_bytes = 0
+            self.media_requests.clear()
+            self.media_stalls = 0
+
+# (方法, 路径正则, 接口名, 是否用户 Token 接口)
+ROUTES = [
+    ("POST", r"^/open-apis/auth/v3/tenant_access_token/internal$", "auth.tenant_access_token", False),
+    ("POST", r"^/open-apis/authen/v1/refresh_access_token$", "authen.refresh_access_token", False),
+    ("POST", r"^/open-apis/authen/v1/access_token$", "authen.access_token", False),
+    ("GET", r"^/open-apis/authen/v1/user_info$", "authen.user_info", True),
+    ("GET", r"^/open-apis/vc/v1/meeting_list$", "vc.meeting_list", True),
+    ("GET", r"^/open-apis/vc/v1/meetings/(?P<meeting_id>[^/]+)/recording$", "vc.meeting.recording", True),
+    ("GET", r"^/open-apis/vc/v1/meetings/(?P<meeting_id>[^/]+)$", "vc.meeting.get", True),
+    ("GET", r"^/open-apis/contact/v3/users/(?P<user_id>[^/]+)$", "contact.user.get", False),
+    ("GET", r"^/open-apis/contact/v3/departments/(?P<dept_id>[^/]+)$", "contact.department.get", False),
+    ("GET", r"^/open-apis/minutes/v1/minutes/(?P<object_token>[^/]+)/media$", "minutes.media", True),
+    ("POST", r"^/open-apis/im/v1/messages$", "im.message.create", False),
+    ("GET", r"^/stub-media/(?P<object_token>[^/]+)\.mp4$", "media.file", False),
+]
+ROUTES = [(m, re.compile(p), name, user_api) for m, p, name, user_api in ROUTES]
+
+def object_token_for(meeting_id):
+    """会议ID -> 妙记 Token (需匹配 event_handler 中的 obcn[a-z0-9]+)"""
+    return "obcn" + re.sub(r"[^a-z0-9]", "", str(meeting_id).lower())
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # 由 make_server 注入
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    # --- 基础工具 ---
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return {}
+
+    def _json(self, payload, status=200):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method):
+        parts = urlsplit(self.path)
+        path, query = parts.path, parse_qs(parts.query)
+
+        if path == "/stub/stats":
+            return self._json(self.state.stats())
+        if path == "/stub/config":
+            if method == "POST":
+                with self.state.lock:
+                    self.state.config.update(self._read_body())
+            return self._json(self.state.config)
+        if path == "/stub/reset" and method == "POST":
+            self.state.reset()
+            return self._json({"ok": True})
+
+        for route_method, pattern, name, user_api in ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                break
+        else:
+            return self._json({"code": 404, "msg": f"stub: no route for {method} {path}"}, 404)
+
+        self.state.count(name)
+        config = self.state.config
+        body = self._read_body() if method == "POST" else {}
+
+        if name != "media.file":
+            if config["latency_ms"]:
+                time.sleep(config["latency_ms"] / 1000.0)
+            if config["error_rate"] and random.random() < config["error_rate"]:
+                return self._json({"code": 99991400, "msg": "stub injected error"}, 500)
+            if user_api and config["unauthorized_rate"] and random.random() < config["unauthorized_rate"]:
+                return self._json({"code": 99991677, "msg": "stub injected token expired"}, 401)
+
+        handler = getattr(self, "_api_" + name.replace(".", "_"))
+        return handler(match.groupdict(), query, body)
+
+    # --- 接口实现 ---
+    def _api_auth_tenant_access_token(self, params, query, body):
+        self._json({"code": 0, "msg": "ok", "tenant_access_token": "t-stub-tenant", "expire": 7200})
+
+    def _api_authen_refresh_access_token(self, params, query, body):
+        suffix = random.randint(0, 1 << 30)
+        self._json({"code": 0, "msg": "ok", "data": {
+            "access_token": f"u-stub-{suffix}", "refresh_token": f"ur-stub-{suffix}", "expires_in": 7200}})
+
+    def _api_authen_access_token(self, params, query, body):
+        self._json({"code": 0, "msg": "ok", "data": {
+            "access_token": "u-stub-code", "refresh_token": "ur-stub-code", "expires_in": 7200,
+            "token_type": "Bearer"}})
+
+    def _api_authen_user_info(self, params, query, body):
+        token = self.headers.get("Authorization", "")
+        # 压测脚本为每个用户写入 "u-stub-<user_id>"，这里原样解析出 user_id
+        user_id = token.split("u-stub-", 1)[-1] if "u-stub-" in token else "stub_user"
+        self._json({"code": 0, "msg": "ok", "data": {"user_id": user_id, "name": f"用户{user_id}"}})
+
+    def _api_vc_meeting_recording(self, params, query, body):
+        meeting_id = params["meeting_id"]
+        if self.state.poll(meeting_id) < self.state.config["ready_after_polls"]:
+            return self._json({"code": 121004, "msg": "data not exist"}, 400)
+        url = f"https://meetings.feishu.cn/minutes/{object_token_for(meeting_id)}"
+        self._json({"code": 0, "msg": "ok", "data": {"recording": {"url": url, "duration": "1800"}}})
+
+    def _api_vc_meeting_list(self, params, query, body):
+        """历史会议列表: 为每个用户生成 history_meetings 个会议，支持 page_size / page_token 分页"""
+        token = self.headers.get("Authorization", "")
+        user_id = token.split("u-stub-", 1)[-1] if "u-stub-" in token else "stub_user"
+        total = int(self.state.config["history_meetings"])
+        page_size = int(query.get("page_size", ["20"])[0])
+        offset = int(query.get("page_token", ["0"])[0] or 0)
+        start_time = int(query.get("start_time", ["1700000000"])[0])
+        items = [{
+            "meeting_id": f"hist{user_id}x{i}",
+            "meeting_topic": f"历史会议 {i}",
+            "start_time": str(start_time + i * 3600),
+        } for i in range(offset, min(offset + page_size, total))]
+        next_offset = offset + len(items)
+        self._json({"code": 0, "msg": "ok", "data": {
+            "meeting_list": items, "has_more": next_offset < total, "page_token": str(next_offset)}})
+
+    def _api_vc_meeting_get(self, params, query, body):
+        meeting_id = params["meeting_id"]
+        start = 1700000000 + (abs(hash(meeting_id)) % 10000000)
+        # 历史会议 hist<user>x<i> 的 Owner 为 <user>，其他会议为 stub_user
+        match = re.match(r"^hist(.+)x\d+$", meeting_id)
+        owner = match.group(1) if match else "stub_user"
+        self._json({"code": 0, "msg": "ok", "data": {"meeting": {
+            "id": meeting_id, "topic": f"压测会议 {meeting_id}", "owner": {"id": owner, "user_type": 1},
+            "start_time": str(start), "end_time": str(start + 1800), "participants": []}}})
+
+    def _api_contact_user_get(self, params, query, body):
+        self._json({"code": 0, "msg": "ok", "data": {"user": {
+            "user_id": params["user_id"], "department_ids": ["od-stub-bench"]}}})
+
+    def _api_contact_department_get(self, params, query, body):
+        self._json({"code": 0, "msg": "ok", "data": {"department": {
+            "open_department_id": params["dept_id"], "name": "Bench团队"}}})
+
+    def _api_minutes_media(self, params, query, body):
+        host = self.headers.get("Host")
+        url = f"http://{host}/stub-media/{params['object_token']}.mp4"
+        self._json({"code": 0, "msg": "ok", "data": {"download_url": url}})
+
+    def _api_im_message_create(self, params, query, body):
+        self._json({"code": 0, "msg": "ok", "data": {"message_id": f"om_stub_{random.randint(0, 1 << 30)}"}})
+
+    def _api_media_file(self, params, query, body):
+        """按需生成媒体内容，支持 Range: bytes=start-[end]"""
+        size = self.state.media_size_for(params["object_token"])
+        start, end = 0, size - 1
+        status = 200
+        range_header = self.headers.get("Range")
+        if range_header:
+            m = re.match(r"bytes=(\d*)-(\d*)", range_header)
+            if not m or (not m.group(1) and not m.group(2)):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if m.group(1):
+                start = int(m.group(1))
+                if m.group(2):
+                    end = min(int(m.group(2)), size - 1)
+            else:
+                start = max(size - int(m.group(2)), 0)
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        length = end - start + 1
+        self.send_response(status)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(length))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        rate = int(self.state.config.get("media_rate") or 0)
+        object_token = params["object_token"]
+        # 探测文件大小的 Range: bytes=0-0 请求不参与卡顿模拟
+        stall_at = start + length // 2 if length > 1 and self.state.should_stall(object_token) else None
+        offset = start
+        sent = 0
+        started = time.monotonic()
+        try:
+            while sent < length:
+                chunk = media_bytes(object_token, offset, min(length - sent, 256 * 1024), size)
+                self.wfile.write(chunk)
+                offset += len(chunk)
+                sent += len(chunk)
+                if stall_at is not None and offset >= stall_at:
+                    self.wfile.flush()
+                    time.sleep(float(self.state.config["stall_seconds"]))
+                    return
+                if rate:
+                    # 简单限速: 保证平均速度不超过 media_rate
+                    ahead = sent / rate - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self.state.lock:
+                self.state.media_bytes += sent
+
+def make_server(host="127.0.0.1", port=0, **state_kwargs):
+    """创建 Stub Server (port=0 时由系统分配端口)，返回 (server, state)"""
+    state = StubState(**state_kwargs)
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server, state
+
+def start_in_thread(**kwargs):
+    """在后台线程启动 Stub Server，返回 (server, state, base_url)"""
+    server, state = make_server(**kwargs)
+    t = threading.Thread(target=server.serve_forever, name="feishu-stub", daemon=True)
+    t.start()
+    host, port = server.server_address[:2]
+    return server, state, f"http://{host}:{port}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地飞书 OpenAPI Stub Server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--media-size", default="10M", help="媒体文件大小，如 500M / 2G")
+    parser.add_argument("--media-rate", default="0", help="单连接媒体下载限速 (字节/秒)，如 5M，0 为不限")
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个 API 调用的固定延迟")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="API 随机返回 500 的概率")
+    parser.add_argument("--unauthorized-rate", type=float, default=0.0, help="用户 Token 接口随机返回 401 的概率")
+    parser.add_argument("--ready-after-polls", type=int, default=1, help="录制在第 N 次查询时就绪")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="录制第一次下载在中途卡住的概率")
+    parser.add_argument("--stall-seconds", type=float, default=600, help="卡住的连接停止发送数据的时间")
+    args = parser.parse_args(argv)
+
+    server, _ = make_server(
+        args.host, args.port, media_size=parse_size(args.media_size), latency_ms=args.latency_ms,
+        error_rate=args.error_rate, unauthorized_rate=args.unauthorized_rate,
+        ready_after_polls=args.ready_after_polls, media_rate=parse_size(args.media_rate),
+        stall_rate=args.stall_rate, stall_seconds=args.stall_seconds)
+    print(f"Feishu stub listening on http://{args.host}:{server.server_address[1]}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ import csv
 import json
 import logging
 import requests
-from app.utils.feishu_client import get_tenant_access_token
+from app.utils.feishu_client import get_tenant_access_token, open_api_url
 from app.utils.config import load_config
 from app.utils.logger import logger
 
@@ -18,7 +18,7 @@ def get_all_users_in_department(access_token, department_id="0", parent_dept_nam
     users = []
     
     # 1. 获取本部门直属用户
-    url = "https://open.feishu.cn/open-apis/contact/v3/users"
+    url = open_api_url("contact/v3/users")
     params = {
         "department_id": department_id,
         "page_size": 50,
@@ -62,7 +62,7 @@ def get_all_users_in_department(access_token, department_id="0", parent_dept_nam
     # 2. 递归获取子部门的用户
     # API: GET /open-apis/contact/v3/departments/:department_id/children
     try:
-        sub_url = f"https://open.feishu.cn/open-apis/contact/v3/departments/{department_id}/children"
+        sub_url = open_api_url(f"contact/v3/departments/{department_id}/children")
         sub_params = {
             "page_size": 50,
             "department_id_type": "open_department_id",
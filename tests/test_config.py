@@ -0,0 +1,21 @@
+import unittest
+from app.utils.config import parse_size
+
+class ParseSizeTest(unittest.TestCase):
+    def test_units(self):
+        self.assertEqual(parse_size("512K"), 512 * 1024)
+        self.assertEqual(parse_size("10M"), 10 * 1024 ** 2)
+        self.assertEqual(parse_size("1G"), 1024 ** 3)
+        self.assertEqual(parse_size("1048576"), 1048576)
+
+    def test_bandwidth_suffix(self):
+        self.assertEqual(parse_size("10MB/s"), 10 * 1024 ** 2)
+        self.assertEqual(parse_size("10m/s"), 10 * 1024 ** 2)
+        self.assertEqual(parse_size("2.5MB"), int(2.5 * 1024 ** 2))
+
+    def test_empty_is_zero(self):
+        self.assertEqual(parse_size(""), 0)
+        self.assertEqual(parse_size("0"), 0)
+
+if __name__ == "__main__":
+    unittest.main()